@@ -39,6 +39,62 @@ export function queryAPI(data: QueryInput) {
   })
 }
 
+export type QueryStreamEvent = {
+  event: 'analysis' | 'data' | 'token' | 'done'
+  data: any
+}
+
+// 流式查询，按阶段回调 analysis / data / token 事件，返回 done 事件中与 queryAPI 相同的结果
+export async function queryStreamAPI(data: QueryInput, onEvent: (event: QueryStreamEvent) => void) {
+  const response = await fetch('/api/query/stream', {
+    method: 'POST',
+    body: JSON.stringify(data),
+    headers: {
+      'Content-Type': 'application/json'
+    }
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream request failed: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let result: any = null
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) {
+      break
+    }
+    buffer += decoder.decode(value, { stream: true })
+
+    // 事件之间以空行分隔
+    let separator = buffer.indexOf('\n\n')
+    while (separator >= 0) {
+      const block = buffer.slice(0, separator)
+      buffer = buffer.slice(separator + 2)
+      separator = buffer.indexOf('\n\n')
+
+      let event = 'message'
+      let payload = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim()
+        } else if (line.startsWith('data:')) {
+          payload += line.slice(5).trim()
+        }
+      }
+      const parsed = { event, data: JSON.parse(payload) } as QueryStreamEvent
+      if (parsed.event === 'done') {
+        result = parsed.data
+      }
+      onEvent(parsed)
+    }
+  }
+  return result
+}
+
 export function downloadAPI(url: string, filename: string) {
   // 使用 axios 发送 GET 请求下载文件
   axios.get(`api/download`, {
@@ -1,12 +1,40 @@
-from flask import Flask, request, jsonify, send_file
+import os
+import asyncio
+import multiprocessing
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from utils.entry_point import EntryPoint
-from utils.data_init import DATA_PATH, DATA_DESCRIPTION, load_data_sample
+from utils.data_init import DATA_PATH, DATA_DESCRIPTION
+from utils.data_store import get_data_store
+from utils.sandbox_pool import get_sandbox_pool
+from utils.llm_memo import get_llm_memo
+from utils.streaming import iterate_async, sse_event
+from utils.image_store import IMAGE_CACHE_CONTROL, get_image_store
+from utils.telemetry import METRICS_CONTENT_TYPE, render_metrics
 from utils.logger import get_logger
+from report.chart_pool import get_chart_pool
 
 logger = get_logger("app")
 
-entry_point = EntryPoint()
+data_store = get_data_store(DATA_PATH)
+
+# 图表渲染进程（forkserver / spawn 启动）会重新导入本模块，查询入口的创建和预热只在服务进程中进行
+if multiprocessing.current_process().name == "MainProcess":
+    entry_point = EntryPoint()
+
+    # 启动时解析一次数据集，之后常驻内存
+    data_store.refresh_if_changed()
+
+    # 预先启动沙箱进程池，避免首个查询承担解释器启动开销
+    get_sandbox_pool()
+
+    # 预先启动图表渲染进程池，报告图表无需每次启动进程和初始化 matplotlib
+    get_chart_pool()
+
+    # 预热 LLM 记忆化缓存，重启后无需冷启动
+    llm_memo = get_llm_memo()
+    if llm_memo is not None:
+        llm_memo.warm_start(int(os.getenv("LLM_MEMO_WARM_ENTRIES", "1000")))
 
 app = Flask(__name__)
 CORS(app)
@@ -14,6 +42,79 @@ CORS(app)
 downloadableFiles = []
 
 
+def format_query_response(result):
+    """
+    Build the /api/query response body for a process_query result (shared with asgi.py).
+    """
+    # 检查错误
+    if "error" in result:
+        return {"code": 500, "message": result["error"], "data": None}
+
+    # 如果是报告生成类型，返回文件下载
+    if result.get("query_type") == "report" and "report_path" in result:
+        path = result["report_path"]
+        # convert WindowsPath to string
+        path = str(path)
+
+        downloadableFiles.append(path)
+        # print(type(result["report_path"]))
+        # print(result["report_path"])
+        return {
+            "code": 200,
+            "message": "报告生成成功",
+            "data": {
+                "query_type": "report",
+                # "report_path": path,
+                # "download_name": f"{result.get('province', '湖北')}_{result.get('year', '2022')}年能源消费分析报告.docx",
+                "markdown_content": result.get("markdown_content", "")
+            },
+        }
+
+    # 其他分析类型返回JSON数据
+    return {"code": 200, "message": "分析成功", "data": result}
+
+
+async def query_event_stream(data):
+    """
+    Server-sent events for /api/query/stream (shared with asgi.py).
+
+    Forwards the analysis, data and token events of EntryPoint.astream_query and finishes
+    with a "done" event carrying the same body /api/query would return.
+    """
+    try:
+        query = data.get("query")
+        if not query:
+            yield sse_event("done", {"code": 400, "message": "缺少查询文本", "data": None})
+            return
+
+        await asyncio.to_thread(data_store.refresh_if_changed)
+        async for event, payload in entry_point.astream_query(
+            query=query,
+            data_path=DATA_PATH,
+            data_description=DATA_DESCRIPTION,
+            data_sample=data_store.sample,
+            vast_system_state=data.get("vast_system_state"),
+            message_history=data.get("message_history"),
+            force_regenerate=bool(data.get("force_regenerate", False)),
+        ):
+            if event == "result":
+                logger.info(f"处理结果: {payload}")
+                yield sse_event("done", format_query_response(payload))
+            else:
+                yield sse_event(event, payload)
+
+    except Exception as e:
+        import traceback
+
+        traceback.print_exc()
+        yield sse_event(
+            "done", {"code": 500, "message": f"处理请求时发生错误: {str(e)}", "data": None}
+        )
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
 @app.route("/api/test", methods=["POST"])
 def test():
     data = request.get_json()
@@ -34,53 +135,20 @@ def query():
         if not query:
             return jsonify({"code": 400, "message": "缺少查询文本", "data": None})
 
-        # 使用预加载的数据样本进行处理
+        # 数据文件有更新时重新加载，否则直接使用内存中的数据样本
+        data_store.refresh_if_changed()
         result = entry_point.process_query(
             query=query,
             data_path=DATA_PATH,
             data_description=DATA_DESCRIPTION,
-            data_sample=load_data_sample(),
+            data_sample=data_store.sample,
             vast_system_state=vast_system_state,
             message_history=message_history,
+            force_regenerate=bool(data.get("force_regenerate", False)),
         )
         logger.info(f"处理结果: {result}")
 
-        # 检查错误
-        if "error" in result:
-            return jsonify({"code": 500, "message": result["error"], "data": None})
-
-        # 如果是报告生成类型，返回文件下载
-        if result.get("query_type") == "report" and "report_path" in result:
-            path = result["report_path"]
-            # convert WindowsPath to string
-            path = str(path)
-            
-            downloadableFiles.append(path)
-            # print(type(result["report_path"]))
-            # print(result["report_path"])
-            return jsonify(
-                {
-                    "code": 200,
-                    "message": "报告生成成功",
-                    "data": {
-                        "query_type": "report",
-                        # "report_path": path,
-                        # "download_name": f"{result.get('province', '湖北')}_{result.get('year', '2022')}年能源消费分析报告.docx",
-                        "markdown_content": result.get("markdown_content", "")
-                    },
-                }
-            )
-            # response = send_file(
-            #     result["report_path"],
-            #     mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            #     as_attachment=True,
-            #     download_name=f"{result.get('province', '湖北')}_{result.get('year', '2022')}年能源消费分析报告.docx",
-            # )
-            # response.headers['Content-Transfer-Encoding'] = 'binary'
-            # return response
-
-        # 其他分析类型返回JSON数据
-        return jsonify({"code": 200, "message": "分析成功", "data": result})
+        return jsonify(format_query_response(result))
 
     except Exception as e:
         import traceback
@@ -91,6 +159,46 @@ def query():
         )
 
 
+@app.route("/api/query/stream", methods=["POST"])
+def query_stream():
+    data = request.get_json()
+    print(data)
+    return Response(
+        iterate_async(query_event_stream(data)),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.route("/api/report/images/<name>", methods=["GET"])
+def report_image(name):
+    """
+    Serve a content-addressed report image with ETag and immutable cache headers.
+    """
+    image_store = get_image_store()
+    path = image_store.path(name)
+    if path is None:
+        return jsonify({"code": 404, "message": "图片不存在", "data": None}), 404
+
+    # 文件名即内容摘要，浏览器带着相同的 ETag 重新请求时直接返回 304
+    etag = image_store.etag(name)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = send_file(path, mimetype=image_store.mimetype(name))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+    return response
+
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    """
+    Request and stage latencies and counters in the Prometheus text format.
+    """
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route("/api/download", methods=["GET"])
 def download():
     try:
@@ -0,0 +1,146 @@
+"""
+ASGI serving mode.
+
+Serves the same API as app.py from an event loop, so a request waiting on the LLM does not
+hold a server thread. LLM calls run on DSPy's bounded worker pool and, together with the
+report narratives, share one concurrency limit (LLM_MAX_CONCURRENCY, default 16); sandbox
+runs and report generation run in worker threads. Start with e.g.
+
+    hypercorn asgi:app --bind 127.0.0.1:5000
+
+The Flask app in app.py stays available for development (python app.py).
+"""
+
+import asyncio
+import traceback
+
+from quart import Quart, Response, request, jsonify, send_file
+from quart_cors import cors
+
+from app import (
+    SSE_HEADERS,
+    entry_point,
+    data_store,
+    downloadableFiles,
+    format_query_response,
+    query_event_stream,
+)
+from utils.data_init import DATA_PATH, DATA_DESCRIPTION
+from utils.image_store import IMAGE_CACHE_CONTROL, get_image_store
+from utils.telemetry import METRICS_CONTENT_TYPE, render_metrics
+from utils.logger import get_logger
+
+logger = get_logger("app")
+
+app = cors(Quart(__name__))
+
+
+@app.route("/api/test", methods=["POST"])
+async def test():
+    data = await request.get_json()
+    return jsonify({"code": 200, "message": "请求成功", "data": data["key"].upper()})
+
+
+@app.route("/api/query", methods=["POST"])
+async def query():
+    try:
+        # 获取用户查询
+        data = await request.get_json()
+        query = data.get("query")
+        vast_system_state = data.get("vast_system_state")
+        message_history = data.get("message_history")
+
+        if not query:
+            return jsonify({"code": 400, "message": "缺少查询文本", "data": None})
+
+        # 数据文件有更新时重新加载（需要重新解析时在工作线程中进行）
+        await asyncio.to_thread(data_store.refresh_if_changed)
+        result = await entry_point.aprocess_query(
+            query=query,
+            data_path=DATA_PATH,
+            data_description=DATA_DESCRIPTION,
+            data_sample=data_store.sample,
+            vast_system_state=vast_system_state,
+            message_history=message_history,
+            force_regenerate=bool(data.get("force_regenerate", False)),
+        )
+        logger.info(f"处理结果: {result}")
+
+        return jsonify(format_query_response(result))
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify(
+            {"code": 500, "message": f"处理请求时发生错误: {str(e)}", "data": None}
+        )
+
+
+@app.route("/api/query/stream", methods=["POST"])
+async def query_stream():
+    data = await request.get_json()
+    response = Response(
+        query_event_stream(data),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+    # 流式响应可能持续到 LLM 生成结束，不使用默认超时
+    response.timeout = None
+    return response
+
+
+@app.route("/api/report/images/<name>", methods=["GET"])
+async def report_image(name):
+    """
+    Serve a content-addressed report image with ETag and immutable cache headers.
+    """
+    image_store = get_image_store()
+    path = image_store.path(name)
+    if path is None:
+        return jsonify({"code": 404, "message": "图片不存在", "data": None}), 404
+
+    # 文件名即内容摘要，浏览器带着相同的 ETag 重新请求时直接返回 304
+    etag = image_store.etag(name)
+    if request.if_none_match.contains(etag):
+        response = Response("", status=304)
+    else:
+        response = await send_file(path, mimetype=image_store.mimetype(name))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+    return response
+
+
+@app.route("/api/metrics", methods=["GET"])
+async def metrics():
+    """
+    Request and stage latencies and counters in the Prometheus text format.
+    """
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/api/download", methods=["GET"])
+async def download():
+    try:
+        # 获取下载文件名
+        file_name = request.args.get("file_name")
+        if not file_name:
+            return jsonify({"code": 400, "message": "缺少文件名", "data": None})
+
+        # 检查文件是否存在于可下载列表中
+        if file_name not in downloadableFiles:
+            return jsonify({"code": 404, "message": "文件未找到", "data": None})
+
+        return await send_file(
+            file_name,
+            mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            as_attachment=True,
+            download_name=file_name.split("/")[-1],
+        )
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify(
+            {"code": 500, "message": f"处理请求时发生错误: {str(e)}", "data": None}
+        )
+
+
+if __name__ == "__main__":
+    app.run(port=5000)
@@ -0,0 +1 @@
+# 让测试能以 server/ 为根导入 utils、report 包
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+
+
+def parse_years(series: pd.Series) -> pd.Series:
+    """Year numbers of a year column holding dates, date strings or plain years."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(int)
+    return pd.to_datetime(series).dt.year
+
+
+def _sum_by(df: pd.DataFrame, keys: list) -> pd.Series:
+    # 年份只解析一次，不复制整张表
+    years = parse_years(df["year"]).rename("year")
+    return df["value"].groupby([years] + [df[key] for key in keys]).sum()
+
+
+class AggregateCube:
+    """
+    Pre-aggregated report statistics, built once per data version.
+
+    Holds the year x energy_type totals of the energy balance sheet, the year x industry x
+    energy_type totals of the industry sheet and the yearly GDP. Every report metric and chart
+    reads from these small tables (index lookups and column selections) instead of copying and
+    re-grouping the raw sheets, so report cost does not grow with the number of raw rows.
+    The cube only holds aggregates and is cheap to pickle to chart workers.
+    """
+
+    def __init__(
+        self,
+        energy_df: pd.DataFrame = None,
+        industry_df: pd.DataFrame = None,
+        gdp_df: pd.DataFrame = None,
+    ):
+        # 能源平衡表：年份 x 能源品种
+        self.energy_by_year_type = (
+            _sum_by(energy_df, ["energy_type"]).unstack("energy_type")
+            if energy_df is not None
+            else pd.DataFrame()
+        )
+
+        # 分行业能源消费表：年份 x 行业 x 能源品种
+        if industry_df is not None:
+            self.industry_energy = _sum_by(industry_df, ["industry", "energy_type"])
+            self.industry_by_year = self.industry_energy.groupby(level=["year", "industry"]).sum()
+            # 年度总量直接按年份汇总：行业或能源品种为空的行不在上面的分组中，但计入总量
+            self.industry_total_by_year = _sum_by(industry_df, [])
+        else:
+            empty = pd.Series(dtype=float)
+            self.industry_energy = self.industry_by_year = self.industry_total_by_year = empty
+
+        # 年份 x 行业 的宽表，用于按年份和行业直接取值
+        self.industry_matrix = (
+            self.industry_by_year.unstack("industry") if len(self.industry_by_year) else pd.DataFrame()
+        )
+
+        # 地区生产总值
+        self.gdp_by_year = _sum_by(gdp_df, []) if gdp_df is not None else pd.Series(dtype=float)
+
+    @classmethod
+    def from_sheets(cls, datas: list) -> "AggregateCube":
+        """
+        Build the cube from the workbook sheets in SHEET_NAMES order
+        (energy balance, industry energy, products, GDP).
+        """
+        energy_df, industry_df, _, gdp_df = datas
+        return cls(energy_df=energy_df, industry_df=industry_df, gdp_df=gdp_df)
+
+    def consumption_by_year(self, energy_type: str) -> pd.Series:
+        """Yearly consumption of one energy type (energy balance sheet)."""
+        if energy_type not in self.energy_by_year_type.columns:
+            return pd.Series(dtype=float, name="value").rename_axis("year")
+        return self.energy_by_year_type[energy_type].dropna().rename("value")
+
+    def intensity_by_year(self) -> pd.Series:
+        """Yearly industry energy consumption per unit of GDP."""
+        return self.industry_total_by_year / self.gdp_by_year
+
+    def industry_value(self, year: int, industry: str) -> float:
+        """Consumption of one industry in one year."""
+        return self.industry_matrix.at[year, industry]
+
+
+_cubes: "OrderedDict[str, AggregateCube]" = OrderedDict()
+_cubes_lock = threading.Lock()
+# 保留的数据版本数
+MAX_CUBES = 4
+
+
+def get_aggregate_cube(datas: list, version: Optional[str] = None) -> AggregateCube:
+    """
+    Return the cube for a data version, building it on first use.
+
+    Args:
+        datas: Workbook sheets in SHEET_NAMES order
+        version: Content hash of the workbook; without it the cube is built and not kept
+
+    Returns:
+        The AggregateCube of the sheets
+    """
+    if version is None:
+        return AggregateCube.from_sheets(datas)
+
+    with _cubes_lock:
+        cube = _cubes.get(version)
+        if cube is None:
+            cube = AggregateCube.from_sheets(datas)
+            _cubes[version] = cube
+            while len(_cubes) > MAX_CUBES:
+                _cubes.popitem(last=False)
+        else:
+            _cubes.move_to_end(version)
+        return cube
@@ -0,0 +1,325 @@
+"""
+Batch generation of energy consumption reports for many (province, year) pairs.
+
+Usage (from the server directory):
+    python -m report.batch --province 湖北 --years 2006-2022
+    python -m report.batch --item 湖北:2021 --item 湖北:2022 --llm-workers 2
+"""
+
+import os
+import json
+import time
+import argparse
+import contextlib
+import threading
+import traceback
+import concurrent.futures
+import multiprocessing as mp
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from report.aggregate_cube import get_aggregate_cube
+from report.chart_pool import get_chart_pool, get_pool_context
+from report.metrics import evaluate_metrics
+from report.stat_func import (
+    DEFAULT_PATHS,
+    MODULE_DIR,
+    build_chart_tasks,
+    compute_replacement_values,
+    generate_chart,
+    replace_markdown_placeholders,
+)
+from utils.data_init import DATA_PATH
+from utils.data_store import get_data_store
+from utils.report_cache import get_report_cache
+from utils.image_store import inline_images_default, keep_images
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("report_batch")
+
+# 批量报告的默认输出目录
+BATCH_OUTPUT_DIR = MODULE_DIR / "batch_output"
+
+# 能耗数据工作簿的文件名后缀：<省份>_外部能耗数据.xlsx
+DATA_FILE_SUFFIX = "_外部能耗数据"
+
+# 进度回调：(已完成数, 总数, 单项结果)
+ProgressCallback = Callable[[int, int, Dict[str, Any]], None]
+
+
+def _default_llm_workers() -> int:
+    return max(1, int(os.getenv("REPORT_LLM_WORKERS", "4")))
+
+
+def workbook_province(data_file) -> Optional[str]:
+    """Province whose data the workbook holds, from its file name (None if not recognizable)."""
+    stem = Path(data_file).stem
+    if stem.endswith(DATA_FILE_SUFFIX) and len(stem) > len(DATA_FILE_SUFFIX):
+        return stem[: -len(DATA_FILE_SUFFIX)]
+    return None
+
+
+def parse_items(specs: Iterable[str]) -> List[Tuple[str, int]]:
+    """
+    Parse "province:year" or "province:start-end" specs into (province, year) pairs.
+    """
+    items = []
+    for spec in specs:
+        province, _, years = spec.partition(":")
+        if not province or not years:
+            raise ValueError(f"无效的报告项: {spec}，应为 省份:年份 或 省份:起始年份-结束年份")
+        start, _, end = years.partition("-")
+        items.extend((province, year) for year in range(int(start), int(end or start) + 1))
+    return items
+
+
+def generate_reports(
+    items: Iterable[Tuple[str, int]],
+    data_file: str = DATA_PATH,
+    output_dir: Optional[Path] = None,
+    chart_workers: Optional[int] = None,
+    llm_workers: Optional[int] = None,
+    force_regenerate: bool = False,
+    progress: Optional[ProgressCallback] = None,
+    inline_images: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Generate one report per (province, year) pair.
+
+    The workbook, aggregate cube and metrics of all requested years are computed once and
+    shared by every report. Charts of all reports are rendered on the shared chart pool (a
+    short-lived pool of chart_workers processes when it is disabled) while the LLM narratives
+    run on one bounded thread pool, so the rendering of later reports overlaps the narratives
+    of earlier ones. Every report is written to its own directory and a failing report does
+    not affect the others.
+
+    The workbook holds the data of a single province, named by its file name
+    (<province>_外部能耗数据.xlsx); items of any other province fail instead of being
+    reported with that province's numbers.
+
+    Args:
+        items: (province, year) pairs, duplicates are generated once
+        data_file: Path of the energy workbook
+        output_dir: Base output directory, a timestamped run directory is created inside it
+        chart_workers: Chart processes; only used when the shared chart pool is started here
+            (or is disabled), no effect when it is already running, e.g. in the server
+        llm_workers: Concurrent LLM narrative calls (REPORT_LLM_WORKERS, default 4)
+        force_regenerate: Ignore the report cache
+        progress: Called after each report with (done, total, item result)
+        inline_images: Embed images as base64 for offline use (default REPORT_INLINE_IMAGES)
+
+    Returns:
+        Summary with the run directory, counts per status and one result per item
+    """
+    items = list(dict.fromkeys((province, int(year)) for province, year in items))
+    llm_workers = llm_workers or _default_llm_workers()
+    if inline_images is None:
+        inline_images = inline_images_default()
+
+    run_dir = Path(output_dir or BATCH_OUTPUT_DIR) / time.strftime("%Y%m%d-%H%M%S")
+    run_dir.mkdir(parents=True, exist_ok=True)
+    start_time = time.time()
+    logger.info(f"开始批量生成 {len(items)} 份报告，输出目录: {run_dir}")
+
+    # 数据、聚合立方体和所有年份的指标只计算一次
+    store = get_data_store(str(data_file))
+    cube = get_aggregate_cube(store.get_sheets(), store.version)
+    metrics = evaluate_metrics(cube, sorted({year for _, year in items}))
+    report_cache = get_report_cache()
+    data_province = workbook_province(data_file)
+
+    results: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    results_lock = threading.Lock()
+
+    def finish(result: Dict[str, Any]) -> None:
+        with results_lock:
+            results[(result["province"], result["year"])] = result
+            done = len(results)
+        if result["status"] == "failed":
+            logger.error(f"[{done}/{len(items)}] {result['province']}{result['year']}年报告失败: {result['error']}")
+        else:
+            logger.info(f"[{done}/{len(items)}] {result['province']}{result['year']}年报告完成 ({result['status']})")
+        if progress is not None:
+            try:
+                progress(done, len(items), result)
+            except Exception as e:
+                logger.warning(f"进度回调出错: {e}")
+
+    chart_pool = get_chart_pool(chart_workers)
+
+    with contextlib.ExitStack() as stack:
+        # 常驻图表进程池未启用时，为本批次启动一个临时进程池
+        own_pool = None
+        if chart_pool is None:
+            own_pool = stack.enter_context(
+                get_pool_context().Pool(processes=chart_workers or mp.cpu_count())
+            )
+        llm_executor = stack.enter_context(
+            concurrent.futures.ThreadPoolExecutor(max_workers=llm_workers)
+        )
+        report_executor = stack.enter_context(
+            concurrent.futures.ThreadPoolExecutor(max_workers=llm_workers)
+        )
+
+        def render_async(tasks):
+            if chart_pool is not None:
+                return chart_pool.render_async(tasks)
+            return own_pool.map_async(generate_chart, tasks)
+
+        # 先提交所有报告的图表任务，后续报告的图表与前面报告的 LLM 文本并行生成
+        pending = []
+        for province, year in items:
+            item_start = time.time()
+            item_dir = run_dir / f"{province}_{year}"
+            try:
+                # 工作簿只有一个省份的数据，其他省份的报告会错误地套用这些数据
+                if data_province is not None and province != data_province:
+                    raise ValueError(
+                        f"没有{province}的能耗数据，{Path(data_file).name} 只包含{data_province}的数据"
+                    )
+                cache_key = None
+                if report_cache is not None:
+                    cache_key = report_cache.make_key(
+                        province, year, DEFAULT_PATHS["template"], store.version, inline_images
+                    )
+                    cached = None if force_regenerate else report_cache.get(cache_key)
+                    if cached is not None:
+                        if not inline_images:
+                            keep_images(cached["values"].get("image_paths", []))
+                        item_dir.mkdir(parents=True, exist_ok=True)
+                        output_path = item_dir / "report.md"
+                        output_path.write_text(cached["markdown"], encoding="utf-8")
+                        finish(_item_result(province, year, "cached", item_start, path=output_path))
+                        continue
+
+                values = compute_replacement_values(cube, year, province, metrics)
+                image_dir = item_dir / "images"
+                image_dir.mkdir(parents=True, exist_ok=True)
+                charts = render_async(build_chart_tasks(cube, year, province, str(image_dir)))
+                pending.append((province, year, item_dir, cache_key, values, charts, item_start))
+            except Exception as e:
+                logger.debug(traceback.format_exc())
+                finish(_item_result(province, year, "failed", item_start, error=e))
+
+        futures = [
+            report_executor.submit(
+                _finish_report, *task, report_cache, llm_executor, inline_images
+            )
+            for task in pending
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            finish(future.result())
+
+    ordered = [results[item] for item in items]
+    summary = {
+        "output_dir": str(run_dir),
+        "total": len(items),
+        "generated": sum(r["status"] == "generated" for r in ordered),
+        "cached": sum(r["status"] == "cached" for r in ordered),
+        "failed": sum(r["status"] == "failed" for r in ordered),
+        "seconds": round(time.time() - start_time, 2),
+        "items": ordered,
+    }
+    with open(run_dir / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    logger.info(
+        f"批量报告完成 - 生成 {summary['generated']}，缓存 {summary['cached']}，"
+        f"失败 {summary['failed']}，耗时 {summary['seconds']} 秒"
+    )
+    return summary
+
+
+def _finish_report(
+    province: str,
+    year: int,
+    item_dir: Path,
+    cache_key: Optional[str],
+    values: Dict[str, Any],
+    charts: "mp.pool.AsyncResult",
+    item_start: float,
+    report_cache,
+    llm_executor: concurrent.futures.Executor,
+    inline_images: bool,
+) -> Dict[str, Any]:
+    """Wait for the charts of one report, write its markdown and cache it. Never raises."""
+    try:
+        values["image_paths"] = [path for path in charts.get() if path is not None]
+        output_path, markdown_content = replace_markdown_placeholders(
+            values,
+            output_path=item_dir / "report.md",
+            executor=llm_executor,
+            inline_images=inline_images,
+        )
+        if report_cache is not None:
+            try:
+                report_cache.put(cache_key, markdown_content, values)
+            except Exception as e:
+                logger.warning(f"缓存报告失败: {e}")
+        return _item_result(province, year, "generated", item_start, path=output_path)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        return _item_result(province, year, "failed", item_start, error=e)
+
+
+def _item_result(
+    province: str,
+    year: int,
+    status: str,
+    item_start: float,
+    path: Optional[Path] = None,
+    error: Optional[Exception] = None,
+) -> Dict[str, Any]:
+    return {
+        "province": province,
+        "year": year,
+        "status": status,
+        "path": str(path) if path is not None else None,
+        "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        "seconds": round(time.time() - item_start, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量生成能源消费报告")
+    parser.add_argument(
+        "--province", default="湖北", help="与 --years 搭配使用的省份，须与数据工作簿的省份一致"
+    )
+    parser.add_argument("--years", help="年份或年份范围，如 2021 或 2006-2022")
+    parser.add_argument(
+        "--item", action="append", default=[], help="报告项 省份:年份 或 省份:起始-结束，可重复"
+    )
+    parser.add_argument(
+        "--data", default=DATA_PATH, help="能耗数据工作簿路径（<省份>_外部能耗数据.xlsx，只含一个省份）"
+    )
+    parser.add_argument("--output-dir", default=str(BATCH_OUTPUT_DIR), help="输出目录")
+    parser.add_argument("--chart-workers", type=int, help="图表渲染进程数")
+    parser.add_argument("--llm-workers", type=int, help="并发 LLM 调用数")
+    parser.add_argument("--force", action="store_true", help="忽略报告缓存，重新生成")
+    parser.add_argument(
+        "--inline-images", action="store_true", help="以base64内嵌图片，便于离线查看"
+    )
+    args = parser.parse_args(argv)
+
+    specs = list(args.item)
+    if args.years:
+        specs.append(f"{args.province}:{args.years}")
+    if not specs:
+        parser.error("需要指定 --years 或 --item")
+
+    summary = generate_reports(
+        parse_items(specs),
+        data_file=args.data,
+        output_dir=Path(args.output_dir),
+        chart_workers=args.chart_workers,
+        llm_workers=args.llm_workers,
+        force_regenerate=args.force,
+        inline_images=args.inline_images or None,
+    )
+    print(json.dumps({k: v for k, v in summary.items() if k != "items"}, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+"""
+Rendering benchmark of plot_industry_energy_trends across industry and year counts.
+
+Usage (from the server directory):
+    python -m report.benchmark_charts
+    python -m report.benchmark_charts --industries 5 10 20 40 --years 3 5 10 --dpi 300
+"""
+
+import io
+import time
+import argparse
+from typing import List
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from report.stat_func import plot_industry_energy_trends
+
+
+def synthetic_industry_series(n_industries: int, n_years: int, seed: int = 0) -> pd.Series:
+    """Year x industry consumption totals shaped like AggregateCube.industry_by_year."""
+    rng = np.random.default_rng(seed)
+    years = np.arange(2020, 2020 + n_years)
+    industries = [f"行业{i}" for i in range(n_industries)]
+    index = pd.MultiIndex.from_product([years, industries], names=["year", "industry"])
+    return pd.Series(rng.uniform(10, 200, len(index)), index=index, name="value")
+
+
+def count_artists(fig: plt.Figure) -> int:
+    return sum(
+        len(ax.patches) + len(ax.lines) + len(ax.texts) + len(ax.collections) for ax in fig.axes
+    )
+
+
+def run(industry_counts: List[int], year_counts: List[int], dpi: int, repeat: int) -> None:
+    print(f"{'行业数':>6} {'年份数':>6} {'图元数':>8} {'绘制(ms)':>10} {'保存(ms)':>10} {'合计(ms)':>10}")
+    for n_industries in industry_counts:
+        for n_years in year_counts:
+            data = synthetic_industry_series(n_industries, n_years)
+            draw_times, save_times = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fig = plot_industry_energy_trends(
+                    data,
+                    start_year=2020,
+                    end_year=2020 + n_years - 1,
+                    figsize=(12, 8),
+                    colormap="Pastel1",
+                    max_categories=n_industries,
+                )
+                drawn = time.perf_counter()
+                fig.savefig(io.BytesIO(), format="png", dpi=dpi, bbox_inches="tight")
+                saved = time.perf_counter()
+                artists = count_artists(fig)
+                plt.close(fig)
+                draw_times.append(drawn - start)
+                save_times.append(saved - drawn)
+
+            draw_ms = np.median(draw_times) * 1000
+            save_ms = np.median(save_times) * 1000
+            print(
+                f"{n_industries:>6} {n_years:>6} {artists:>8} "
+                f"{draw_ms:>10.1f} {save_ms:>10.1f} {draw_ms + save_ms:>10.1f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="行业能源消费趋势图渲染基准测试")
+    parser.add_argument("--industries", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--years", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--dpi", type=int, default=300, help="与报告图表一致的分辨率")
+    parser.add_argument("--repeat", type=int, default=3, help="每种规模重复次数，取中位数")
+    args = parser.parse_args()
+    run(args.industries, args.years, args.dpi, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
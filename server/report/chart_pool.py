@@ -0,0 +1,133 @@
+import io
+import os
+import atexit
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing.pool import AsyncResult
+from typing import List, Optional
+
+# 获取该模块的日志器：渲染进程不导入 utils 包（会加载 DSPy 等），由服务进程在启动进程池时配置
+logger = logging.getLogger("chart_pool")
+
+
+def get_pool_context():
+    """
+    Multiprocessing context for chart rendering pools.
+
+    Pools are started after the server's threads (sandbox workers, the background event loop),
+    and forking a threaded process can deadlock on locks those threads hold, so workers are
+    started by a forkserver (spawn where forkserver is unavailable) instead of fork. The
+    forkserver preloads this module and the report code, so a worker starts with the imports
+    done and _warm_up only has to render. Neither imports the utils package, which would load
+    DSPy and the query pipeline into the forkserver.
+    """
+    if "forkserver" in mp.get_all_start_methods():
+        context = mp.get_context("forkserver")
+        # 不预加载 __main__：服务入口模块在 forkserver 中导入时会尝试启动进程池
+        context.set_forkserver_preload(["report.chart_pool", "report.stat_func"])
+        return context
+    return mp.get_context("spawn")
+
+
+def _warm_up() -> None:
+    """Worker initializer: configure fonts and render one figure so the first chart is warm."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from report.stat_func import configure_matplotlib_for_chinese
+
+    configure_matplotlib_for_chinese()
+
+    # 预先加载字体和 Agg 渲染器
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.set_title("能源")
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+
+
+class ChartPool:
+    """
+    Long-lived pool of chart rendering processes.
+
+    Workers start once with matplotlib imported and warmed up, and are reused by every report.
+    Tasks are generate_chart tuples carrying only the small pre-aggregated series of one chart.
+    Workers are replaced after max_tasks charts to bound matplotlib's memory growth.
+    """
+
+    def __init__(self, size: int = None, max_tasks: int = 200):
+        # 进程池只在服务进程中创建，此时 utils 包已加载，为日志器配置统一的彩色输出
+        from utils.logger import get_logger
+
+        get_logger("chart_pool")
+
+        self.size = size or os.cpu_count() or 1
+        self.max_tasks = max_tasks
+        self._lock = threading.Lock()
+        self._pool = None
+        self._start()
+
+    def _start(self) -> None:
+        logger.info(f"启动图表渲染进程池 - 进程数: {self.size}")
+        self._pool = get_pool_context().Pool(
+            processes=self.size, initializer=_warm_up, maxtasksperchild=self.max_tasks or None
+        )
+
+    def render_async(self, tasks: List[tuple]) -> AsyncResult:
+        """
+        Submit chart tasks without waiting.
+
+        Returns:
+            AsyncResult whose get() returns the output path of each chart (None if it failed)
+        """
+        from report.stat_func import generate_chart
+
+        with self._lock:
+            if self._pool is None:
+                self._start()
+            return self._pool.map_async(generate_chart, tasks)
+
+    def render(self, tasks: List[tuple]) -> List[Optional[str]]:
+        """
+        Render chart tasks and wait for them.
+
+        Returns:
+            Output path of each chart, None for charts that failed
+        """
+        return self.render_async(tasks).get()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+
+_pool: Optional[ChartPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_chart_pool(size: int = None) -> Optional[ChartPool]:
+    """
+    Get the process-wide chart rendering pool, starting it on first use.
+
+    Configured through CHART_POOL (set to 0 to disable and render each report on a short-lived
+    pool), CHART_POOL_SIZE and CHART_MAX_TASKS. size only applies when the pool is started.
+
+    Returns:
+        The shared ChartPool, or None if pooling is disabled
+    """
+    global _pool
+
+    if os.getenv("CHART_POOL", "1") == "0":
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ChartPool(
+                size=size or int(os.getenv("CHART_POOL_SIZE", "0")) or None,
+                max_tasks=int(os.getenv("CHART_MAX_TASKS", "200")),
+            )
+            atexit.register(_pool.close)
+    return _pool
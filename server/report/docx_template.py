@@ -0,0 +1,194 @@
+"""
+Single-pass DOCX templating at the XML level.
+
+A template is compiled once: placeholders that Word split across several runs are merged into
+the run where they start (keeping that run's formatting), and the text nodes holding
+placeholders are indexed. Rendering a report then loads the normalized document, substitutes
+every placeholder of those text nodes in one regex pass and embeds the images directly into the
+runs, without rewriting paragraph.text or re-scanning the document per placeholder.
+"""
+
+import io
+import os
+import bisect
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Inches, Length
+
+from report.placeholders import PLACEHOLDER_PATTERN
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# 插入图片的默认宽度
+DEFAULT_IMAGE_WIDTH = Inches(6)
+
+
+def _set_text(t, text: str) -> None:
+    t.text = text
+    # 保留首尾空格
+    t.set(XML_SPACE, "preserve")
+
+
+def _merge_split_placeholders(p) -> None:
+    """Move each placeholder split across runs into the text node where it starts."""
+    texts = list(p.iter(qn("w:t")))
+    if len(texts) < 2:
+        return
+    contents = [t.text or "" for t in texts]
+    full = "".join(contents)
+    if "<placeholder" not in full:
+        return
+
+    # 每个文本节点在段落文本中的起始位置
+    starts, offset = [], 0
+    for content in contents:
+        starts.append(offset)
+        offset += len(content)
+
+    def locate(pos: int) -> Tuple[int, int]:
+        # 起始位置不超过 pos 的最后一个节点（跳过其前的空节点）
+        index = bisect.bisect_right(starts, pos) - 1
+        return index, pos - starts[index]
+
+    # 从后向前处理，前面匹配的位置不受影响
+    for match in reversed(list(PLACEHOLDER_PATTERN.finditer(full))):
+        first, first_offset = locate(match.start())
+        last, last_offset = locate(match.end() - 1)
+        if first == last:
+            continue
+        _set_text(texts[first], (texts[first].text or "")[:first_offset] + match.group(0))
+        for t in texts[first + 1 : last]:
+            _set_text(t, "")
+        _set_text(texts[last], (texts[last].text or "")[last_offset + 1 :])
+
+
+class DocxTemplate:
+    """
+    A compiled Word report template.
+
+    Compiling normalizes the document once; render() can then be called for any number of
+    reports. Values are given as {placeholder: text}, e.g. {"<placeholder_year>": "2022"}.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        doc = Document(str(self.path))
+        body = doc.element.body
+
+        paragraphs = list(body.iter(qn("w:p")))
+        for p in paragraphs:
+            _merge_split_placeholders(p)
+
+        # 段落原文（用于生成总结的上下文和摘要的全文）
+        self.paragraphs: List[str] = [
+            "".join(t.text or "" for t in p.iter(qn("w:t"))) for p in paragraphs
+        ]
+
+        # 含占位符的文本节点：(文档中文本节点序号, 段落序号)
+        paragraph_index = {p: i for i, p in enumerate(paragraphs)}
+        self.tokens: List[Tuple[int, int]] = []
+        for i, t in enumerate(body.iter(qn("w:t"))):
+            if t.text and "<placeholder" in t.text:
+                p = next(a for a in t.iterancestors(qn("w:p")))
+                self.tokens.append((i, paragraph_index[p]))
+
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        self._normalized = buffer.getvalue()
+
+    @property
+    def placeholders(self) -> List[str]:
+        """All placeholders of the template, in document order (with repeats removed)."""
+        found = PLACEHOLDER_PATTERN.findall("\n".join(self.paragraphs))
+        return list(dict.fromkeys(found))
+
+    def paragraph_texts(
+        self, values: Dict[str, str], paragraph_values: Dict[int, Dict[str, str]] = None
+    ) -> List[str]:
+        """Paragraph texts with the given values filled in; unknown placeholders are kept."""
+        paragraph_values = paragraph_values or {}
+        return [
+            fill_placeholders(text, values, paragraph_values.get(i))
+            for i, text in enumerate(self.paragraphs)
+        ]
+
+    def render(
+        self,
+        values: Dict[str, str],
+        output_path,
+        images: Dict[str, str] = None,
+        paragraph_values: Dict[int, Dict[str, str]] = None,
+        image_width: Length = DEFAULT_IMAGE_WIDTH,
+    ) -> Path:
+        """
+        Fill the template and save it.
+
+        Args:
+            values: Placeholder texts for the whole document
+            images: Image paths by placeholder, e.g. {"<placeholder_img1>": "chart.png"}
+            paragraph_values: Placeholder texts that only apply to one paragraph (by index),
+                e.g. the conclusion generated from that paragraph
+
+        Returns:
+            Path of the saved document
+        """
+        images = images or {}
+        paragraph_values = paragraph_values or {}
+        doc = Document(io.BytesIO(self._normalized))
+
+        # 一次遍历取出所有文本节点，按编译时的序号定位占位符
+        texts = list(doc.element.body.iter(qn("w:t")))
+        for text_index, paragraph in self.tokens:
+            t = texts[text_index]
+            content = t.text
+            pictures = [p for p in PLACEHOLDER_PATTERN.findall(content) if p in images]
+            content = fill_placeholders(content, values, paragraph_values.get(paragraph))
+            for placeholder in pictures:
+                content = content.replace(placeholder, "")
+            _set_text(t, content)
+
+            # 图片直接嵌入占位符所在的run
+            for placeholder in pictures:
+                inline = doc.part.new_pic_inline(images[placeholder], image_width, None)
+                t.getparent().add_drawing(inline)
+
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        doc.save(str(output_path))
+        return output_path
+
+
+def fill_placeholders(
+    text: str, values: Dict[str, str], overrides: Optional[Dict[str, str]] = None
+) -> str:
+    """Replace every placeholder of text in one pass."""
+
+    def lookup(match):
+        placeholder = match.group(0)
+        if overrides and placeholder in overrides:
+            return overrides[placeholder]
+        return values.get(placeholder, placeholder)
+
+    return PLACEHOLDER_PATTERN.sub(lookup, text)
+
+
+_templates: Dict[Path, Tuple[float, DocxTemplate]] = {}
+_templates_lock = threading.Lock()
+
+
+def get_docx_template(path) -> DocxTemplate:
+    """Return the compiled template of path, recompiling it when the file changes."""
+    path = Path(path).resolve()
+    mtime = os.path.getmtime(path)
+    with _templates_lock:
+        entry = _templates.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+    template = DocxTemplate(path)
+    with _templates_lock:
+        _templates[path] = (mtime, template)
+    return template
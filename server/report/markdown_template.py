@@ -0,0 +1,80 @@
+"""
+Compiled markdown report template.
+
+The template is split once into a segment list (literal text and placeholders, alternating) and
+cached until the file changes. A report is rendered with a single join over the segments instead
+of one str.replace over the whole document per placeholder. Conclusion placeholders are slots
+identified by their segment index, with the paragraph they summarize precompiled, so no regex
+search over the partially rendered report is needed.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from report.placeholders import CONCLUSION_PATTERN, PLACEHOLDER_SPLIT_PATTERN
+
+
+class MarkdownTemplate:
+    """
+    A markdown template compiled into segments.
+
+    segments alternates literal text (even indices) and placeholders (odd indices). Values are
+    given as {placeholder: text}, e.g. {"<placeholder_year>": "2022"}; slot values override a
+    single placeholder occurrence by segment index. Unknown placeholders are kept as they are.
+    The paragraphs of the conclusion slots are compiled with with_slots=False.
+    """
+
+    def __init__(self, text: str, path: Optional[Path] = None, with_slots: bool = True):
+        self.path = path
+        self.segments: List[str] = PLACEHOLDER_SPLIT_PATTERN.split(text)
+        self.placeholders = set(self.segments[1::2])
+
+        # 总结占位符：(片段序号, 所在段落的模板)
+        self.conclusion_slots: List[Tuple[int, "MarkdownTemplate"]] = []
+        for k, match in enumerate(PLACEHOLDER_SPLIT_PATTERN.finditer(text)):
+            if not with_slots or not CONCLUSION_PATTERN.fullmatch(match.group(0)):
+                continue
+            # 占位符所在的段落（以空行分隔）
+            start_pos = text.rfind("\n\n", 0, match.start()) + 2
+            if start_pos < 2:  # 如果没有找到\n\n，可能是文档开头
+                start_pos = 0
+            end_pos = text.find("\n\n", match.end())
+            if end_pos == -1:  # 如果没有找到\n\n，可能是文档结尾
+                end_pos = len(text)
+            paragraph = MarkdownTemplate(text[start_pos:end_pos], with_slots=False)
+            self.conclusion_slots.append((2 * k + 1, paragraph))
+
+    def render(self, values: Dict[str, str], slots: Dict[int, str] = None) -> str:
+        parts = self.segments.copy()
+        for i in range(1, len(parts), 2):
+            if slots and i in slots:
+                parts[i] = slots[i]
+            else:
+                parts[i] = values.get(parts[i], parts[i])
+        return "".join(parts)
+
+    def render_without_conclusions(self, values: Dict[str, str]) -> str:
+        """Render with the conclusion placeholders removed (the context of a conclusion)."""
+        blanks = {p: "" for p in self.placeholders if CONCLUSION_PATTERN.fullmatch(p)}
+        return self.render({**values, **blanks})
+
+
+_templates: Dict[Path, Tuple[float, MarkdownTemplate]] = {}
+_templates_lock = threading.Lock()
+
+
+def get_markdown_template(path) -> MarkdownTemplate:
+    """Return the compiled template of path, recompiling it when the file changes."""
+    path = Path(path).resolve()
+    mtime = os.path.getmtime(path)
+    with _templates_lock:
+        entry = _templates.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+    with open(path, "r", encoding="utf-8") as file:
+        template = MarkdownTemplate(file.read(), path)
+    with _templates_lock:
+        _templates[path] = (mtime, template)
+    return template
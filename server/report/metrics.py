@@ -0,0 +1,171 @@
+"""
+Declarative registry of the report placeholders.
+
+Each placeholder is an expression over per-year series taken from the AggregateCube. All
+expressions are evaluated together for any number of years: every series is indexed by the
+requested years, so one evaluation pass computes a whole batch of reports, and the industry
+rankings are a single argsort over the year x industry matrix instead of a loop per industry.
+"""
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from report.aggregate_cube import AggregateCube
+
+# 能源消费量指标使用的能源品种
+ENERGY_TYPE = "其他能源"
+# 对比基准年份
+BASE_YEAR = 2020
+# 能耗强度下降目标（13.5%）
+INTENSITY_TARGET = 0.135
+INTENSITY_TARGET_PERCENT = 13.5
+
+
+class MetricInputs:
+    """
+    Per-year series the metric expressions are written against, aligned on the requested years.
+    """
+
+    def __init__(self, cube: AggregateCube, years: Iterable[int]):
+        years = pd.Index(list(years), name="year")
+        self.years = years
+        self.year = pd.Series(years.to_numpy(), index=years)
+
+        consumption = cube.consumption_by_year(ENERGY_TYPE)
+        intensity = cube.intensity_by_year()
+        industry_total = cube.industry_total_by_year
+
+        self.consumption = self._at(consumption, years)
+        self.consumption_prev = self._at(consumption, years - 1)
+        self.consumption_base = self._at(consumption, [BASE_YEAR] * len(years))
+        self.intensity = self._at(intensity, years)
+        self.intensity_prev = self._at(intensity, years - 1)
+        self.intensity_base = self._at(intensity, [BASE_YEAR] * len(years))
+        self.industry_total = self._at(industry_total, years)
+        self.industry_total_base = self._at(industry_total, [BASE_YEAR] * len(years))
+
+        # 年份 x 行业 的消费量及相比前一年的增速
+        matrix = cube.industry_matrix
+        current = matrix.reindex(years)
+        previous = matrix.reindex(years - 1).set_axis(years)
+        self._consumers = self._ranking(current)
+        self._speedups = self._ranking(current / previous)
+
+    def _at(self, series: pd.Series, keys) -> pd.Series:
+        return pd.Series(series.reindex(keys).to_numpy(dtype=float), index=self.years)
+
+    @staticmethod
+    def _ranking(frame: pd.DataFrame) -> tuple:
+        """Industries of every row sorted by value, descending (missing values last)."""
+        values = frame.to_numpy(dtype=float)
+        order = np.argsort(-np.where(np.isnan(values), -np.inf, values), axis=1, kind="stable")
+        return frame.columns.to_numpy(), values, order
+
+    def _ranked(self, ranking: tuple, rank: int, names: bool) -> pd.Series:
+        columns, values, order = ranking
+        index = order[:, rank]
+        if names:
+            return pd.Series(columns[index], index=self.years)
+        return pd.Series(values[np.arange(len(index)), index], index=self.years)
+
+    def top_consumer(self, rank: int) -> pd.Series:
+        """Name of the industry with the rank-th largest consumption."""
+        return self._ranked(self._consumers, rank, names=True)
+
+    def top_speedup(self, rank: int) -> pd.Series:
+        """Name of the industry with the rank-th largest growth over the previous year."""
+        return self._ranked(self._speedups, rank, names=True)
+
+    def top_speedup_value(self, rank: int) -> pd.Series:
+        """Growth ratio over the previous year of the rank-th fastest growing industry."""
+        return self._ranked(self._speedups, rank, names=False)
+
+    def intensity_drop(self) -> pd.Series:
+        """Relative drop of the energy intensity since the base year."""
+        return (self.intensity_base - self.intensity) / self.intensity_base
+
+
+# <placeholder_valN>，按N的顺序排列
+VALUE_METRICS = [
+    ("val1", lambda m: m.consumption),
+    ("val2", lambda m: m.consumption_prev),
+    ("val3", lambda m: m.consumption / m.consumption_prev),
+    ("val4", lambda m: m.intensity / m.intensity_prev),
+    ("val5", lambda m: m.consumption_base),
+    ("val6", lambda m: m.consumption),
+    ("val7", lambda m: m.consumption / m.consumption_base),
+    ("val8", lambda m: m.consumption / m.consumption_base / (m.year - BASE_YEAR)),
+    ("val9", lambda m: m.intensity_drop()),
+    ("val10", lambda m: m.intensity_drop() / INTENSITY_TARGET),
+    ("val11", lambda m: m.year - BASE_YEAR),
+    ("val12", lambda m: (INTENSITY_TARGET_PERCENT - m.intensity_drop()) / (m.year - BASE_YEAR)),
+    ("val13", lambda m: m.year * 0),
+    ("val14", lambda m: m.year * 0),
+    ("val15", lambda m: m.top_speedup_value(0)),
+    ("val16", lambda m: m.top_speedup_value(1)),
+]
+
+# <placeholder_choicesN>：(名称, 条件, 条件成立时的文字, 不成立时的文字)
+CHOICE_METRICS = [
+    ("choices1", lambda m: m.consumption > m.consumption_prev, "增长", "下降"),
+    ("choices2", lambda m: m.intensity > m.intensity_prev, "增长", "下降"),
+    (
+        "choices3",
+        lambda m: m.consumption / m.consumption_prev
+        > m.consumption / m.consumption_base / (m.year - BASE_YEAR),
+        "高于",
+        "低于",
+    ),
+    ("choices4", lambda m: m.industry_total > m.industry_total_base, "增长", "下降"),
+]
+
+# <placeholder_industryN>
+INDUSTRY_METRICS = [
+    ("industry1", lambda m: m.top_consumer(0)),
+    ("industry2", lambda m: m.top_consumer(1)),
+    ("industry3", lambda m: m.top_speedup(0)),
+    ("industry4", lambda m: m.top_speedup(1)),
+]
+
+
+def evaluate_metrics(cube: AggregateCube, years: Iterable[int]) -> pd.DataFrame:
+    """
+    Evaluate every registered placeholder for the given years in one pass.
+
+    Args:
+        cube: Aggregates of the data version
+        years: Report years
+
+    Returns:
+        DataFrame indexed by year with one column per placeholder (valN, choicesN, industryN)
+    """
+    inputs = MetricInputs(cube, years)
+    columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, expression in VALUE_METRICS:
+            columns[name] = expression(inputs).astype(float)
+        for name, condition, if_true, if_false in CHOICE_METRICS:
+            columns[name] = pd.Series(
+                np.where(condition(inputs), if_true, if_false), index=inputs.years
+            )
+        for name, expression in INDUSTRY_METRICS:
+            columns[name] = expression(inputs)
+    return pd.DataFrame(columns, index=inputs.years)
+
+
+def replacement_values_for(metrics: pd.DataFrame, year: int, province: str) -> Dict[str, List]:
+    """
+    Replacement values of one report from the evaluated metrics, in the layout expected by
+    replace_markdown_placeholders (image_paths is left empty).
+    """
+    row = metrics.loc[year]
+    return {
+        "year": year,
+        "province": province,
+        "values": [float(row[name]) for name, _ in VALUE_METRICS],
+        "choices": [row[name] for name, *_ in CHOICE_METRICS],
+        "industries": [row[name] for name, _ in INDUSTRY_METRICS],
+        "image_paths": [],
+    }
@@ -0,0 +1,197 @@
+"""
+Task-graph scheduling of one report build.
+
+The build is split into stages (data, template, metrics, charts, values, conclusions,
+abstract, images, assemble) with explicit dependencies. Stages whose inputs are ready run
+concurrently, so the charts render in the process pool while the LLM writes the conclusions and
+abstract, and every stage's timing is logged.
+"""
+
+import time
+import concurrent.futures
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from report.aggregate_cube import get_aggregate_cube
+from report.stat_func import (
+    compute_replacement_values,
+    generate_abstract,
+    generate_conclusions,
+    image_placeholder_values,
+    load_template,
+    render_charts,
+    render_report,
+    write_report,
+)
+from report.placeholders import placeholder_values
+from utils.logger import get_logger
+from utils.telemetry import record_span
+
+# 获取该模块的日志器
+logger = get_logger("report_pipeline")
+
+
+class TaskGraph:
+    """
+    A small dependency graph of named tasks run on a thread pool.
+
+    Each task function receives the results of its dependencies as keyword arguments named after
+    them. Dependencies must be added before the tasks that use them, which keeps the graph acyclic.
+    After run(), timings maps each task to (start offset, duration) in seconds, relative to
+    started_at (a time.perf_counter() value).
+    """
+
+    def __init__(self, name: str = "task_graph"):
+        self.name = name
+        self._tasks: Dict[str, tuple] = {}
+        self.timings: Dict[str, tuple] = {}
+        self.started_at: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Iterable[str] = ()) -> "TaskGraph":
+        deps = tuple(deps)
+        if name in self._tasks:
+            raise ValueError(f"重复的任务: {name}")
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if missing:
+            raise ValueError(f"任务 {name} 依赖未定义的任务: {missing}")
+        self._tasks[name] = (fn, deps)
+        return self
+
+    def run(self, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run every task as soon as its dependencies have finished.
+
+        Returns:
+            Results by task name; the first task exception is re-raised once the tasks that were
+            already running have finished, no task outlives the call
+        """
+        results: Dict[str, Any] = {}
+        pending = dict(self._tasks)
+        running: Dict[concurrent.futures.Future, str] = {}
+        started: Dict[str, float] = {}
+        self.timings = {}
+        origin = self.started_at = time.perf_counter()
+
+        def timed(name, fn, kwargs):
+            started[name] = time.perf_counter()
+            try:
+                return fn(**kwargs)
+            finally:
+                self.timings[name] = (
+                    started[name] - origin,
+                    time.perf_counter() - started[name],
+                )
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(self._tasks) or 1,
+            thread_name_prefix=self.name,
+        )
+        try:
+            while pending or running:
+                # 提交所有依赖已完成的任务
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        running[executor.submit(timed, name, fn, kwargs)] = name
+                        del pending[name]
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        finally:
+            # 出错时不再启动新任务，并等待正在执行的任务结束，避免它们在请求结束、
+            # 报告工作目录被删除后仍在写入
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
+
+    def format_timings(self) -> str:
+        return ", ".join(
+            f"{name} {start:.2f}+{seconds:.2f}s"
+            for name, (start, seconds) in sorted(self.timings.items(), key=lambda x: x[1][0])
+        )
+
+
+def build_report(
+    store,
+    year: int,
+    province: str,
+    images_dir,
+    output_path,
+    template_path=None,
+    inline_images: bool = None,
+    llm_executor: concurrent.futures.Executor = None,
+) -> Dict[str, Any]:
+    """
+    Build one report with the stages scheduled as a task graph.
+
+    Args:
+        store: DataStore of the workbook
+        images_dir: Directory the charts are rendered into
+        output_path: Path of the markdown file to write
+        llm_executor: Optional shared thread pool for the LLM narratives
+
+    Returns:
+        Dict with output_path, markdown, replacement_values and timings (see TaskGraph)
+    """
+    start_time = time.perf_counter()
+    Path(images_dir).mkdir(parents=True, exist_ok=True)
+
+    def load_data():
+        # 聚合立方体每个数据版本只构建一次
+        return get_aggregate_cube(list(store.get_sheets()), store.version)
+
+    def assemble(template, values, conclusions, abstract, images, charts, metrics):
+        metrics["image_paths"].extend(charts)
+        logger.info(f"已生成 {len(charts)} 张图表用于报告")
+        markdown_content = render_report(template, values, conclusions, abstract, images)
+        return write_report(markdown_content, output_path), markdown_content
+
+    graph = TaskGraph(f"report_{province}_{year}")
+    graph.add("data", load_data)
+    graph.add("template", lambda: load_template(template_path))
+    graph.add("metrics", lambda data: compute_replacement_values(data, year, province), ["data"])
+    graph.add("charts", lambda data: render_charts(data, year, province, images_dir), ["data"])
+    graph.add("values", lambda metrics: placeholder_values(metrics), ["metrics"])
+    graph.add(
+        "conclusions",
+        lambda template, values: generate_conclusions(template, values, year, llm_executor),
+        ["template", "values"],
+    )
+    graph.add(
+        "abstract",
+        lambda template, values, conclusions: generate_abstract(
+            template, values, conclusions, year, province, llm_executor
+        ),
+        ["template", "values", "conclusions"],
+    )
+    graph.add(
+        "images",
+        lambda template, charts: image_placeholder_values(template, charts, inline_images),
+        ["template", "charts"],
+    )
+    graph.add(
+        "assemble",
+        assemble,
+        ["template", "values", "conclusions", "abstract", "images", "charts", "metrics"],
+    )
+
+    results = graph.run()
+    output_path, markdown_content = results["assemble"]
+
+    # 各阶段计入所属请求的耗时记录（/api/metrics）
+    for name, (start, seconds) in graph.timings.items():
+        record_span(f"report.{name}", seconds, graph.started_at + start)
+
+    logger.info(
+        f"{province}{year}年报告流水线完成，总耗时 {time.perf_counter() - start_time:.2f}秒 - "
+        f"{graph.format_timings()}"
+    )
+    return {
+        "output_path": output_path,
+        "markdown": markdown_content,
+        "replacement_values": results["metrics"],
+        "timings": graph.timings,
+    }
@@ -0,0 +1,37 @@
+"""
+Placeholders shared by the markdown and Word report templates.
+
+Both templates use the same <placeholder_xxx> names; this module holds the patterns that find
+them and builds the texts of the value placeholders from the computed report values.
+"""
+
+import re
+from typing import Any, Dict
+
+# 占位符：<placeholder_xxx>（Word 模板）
+PLACEHOLDER_PATTERN = re.compile(r"<placeholder_[^<>]+>")
+
+# 占位符的捕获分组形式，split 后奇数位为占位符（Markdown 模板）
+PLACEHOLDER_SPLIT_PATTERN = re.compile(r"(<placeholder[^<>]*>)")
+
+# 总结占位符
+CONCLUSION_PATTERN = re.compile(r"<placeholder[^>]*conclusion[^>]*>")
+
+ABSTRACT_PLACEHOLDER = "<placeholder_abstract>"
+
+
+def placeholder_values(replacement_values: Dict[str, Any]) -> Dict[str, str]:
+    """Texts of the year, province, valN, choicesN and industryN placeholders."""
+    values = {
+        "<placeholder_year>": str(replacement_values["year"]),
+        "<placeholder_prev_year>": str(replacement_values["year"] - 1),
+        "<placeholder_province>": replacement_values["province"],
+    }
+    # 数值保留两位小数
+    for i, value in enumerate(replacement_values["values"]):
+        values[f"<placeholder_val{i+1}>"] = "{:.2f}".format(value)
+    for i, choice in enumerate(replacement_values["choices"]):
+        values[f"<placeholder_choices{i+1}>"] = str(choice)
+    for i, industry in enumerate(replacement_values.get("industries", [])):
+        values[f"<placeholder_industry{i+1}>"] = str(industry)
+    return values
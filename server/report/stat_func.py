@@ -5,11 +5,16 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
+import matplotlib.patches as mpatches
+import matplotlib.transforms as mtransforms
 import platform
 from pathlib import Path
 import os
 import multiprocessing as mp
 
+from report.aggregate_cube import AggregateCube, parse_years
+from report.metrics import evaluate_metrics, replacement_values_for
+
 # 获取当前模块所在目录
 MODULE_DIR = Path(__file__).parent
 
@@ -36,27 +41,32 @@ configure_matplotlib_for_chinese()
 
 
 def energy_consumption_by_year(df: pd.DataFrame, energy_type: str) -> pd.Series:
-    df = df.copy()
-    df["year"] = pd.to_datetime(df["year"]).dt.year
+    # 传入聚合立方体时直接取预聚合结果，传入已聚合的序列时直接使用
+    if isinstance(df, AggregateCube):
+        return df.consumption_by_year(energy_type)
+    if isinstance(df, pd.Series):
+        return df
     df = df[df["energy_type"] == energy_type]
-    return df.groupby("year")["value"].sum()
+    return df["value"].groupby(parse_years(df["year"]).rename("year")).sum()
 
 
 def energy_intensity_by_year(gdp_df: pd.DataFrame, energy_df: pd.DataFrame) -> pd.Series:
-    gdp_df = gdp_df.copy()
-    energy_df = energy_df.copy()
-    gdp_df["year"] = pd.to_datetime(gdp_df["year"]).dt.year
-    energy_df["year"] = pd.to_datetime(energy_df["year"]).dt.year
-    return energy_df.groupby("year")["value"].sum() / gdp_df.groupby("year")["value"].sum()
+    if isinstance(energy_df, AggregateCube):
+        return energy_df.intensity_by_year()
+    if isinstance(energy_df, pd.Series):
+        return energy_df
+    energy = energy_df["value"].groupby(parse_years(energy_df["year"]).rename("year")).sum()
+    gdp = gdp_df["value"].groupby(parse_years(gdp_df["year"]).rename("year")).sum()
+    return energy / gdp
 
 
 def energy_consumption_by_industry_and_year(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
-    df = df.copy()
-    df["year"] = pd.to_datetime(df["year"]).dt.year
-    return (
-        df.groupby(["year", "industry"])["value"].sum(),
-        df.groupby(["year", "industry", "energy_type"])["value"].sum(),
-    )
+    # 已按年份和行业聚合的序列（图表任务只携带这一部分）
+    if isinstance(df, pd.Series):
+        return df, None
+    if not isinstance(df, AggregateCube):
+        df = AggregateCube(industry_df=df)
+    return df.industry_by_year, df.industry_energy
 
 
 def plot_industry_energy_pie(
@@ -156,71 +166,63 @@ def plot_industry_energy_trends(
     # 获取按行业和年份分组的能源消费数据
     consumption_by_industry_year, _ = energy_consumption_by_industry_and_year(df)
 
-    # 将Series转换为DataFrame并重置索引
-    df_consumption = consumption_by_industry_year.reset_index()
-
     # 过滤年份范围
+    all_years = consumption_by_industry_year.index.get_level_values("year")
     if end_year is None:
-        end_year = df_consumption["year"].max()
+        end_year = all_years.max()
 
-    df_filtered = df_consumption[
-        (df_consumption["year"] >= start_year) & (df_consumption["year"] <= end_year)
-    ]
+    df_filtered = consumption_by_industry_year[(all_years >= start_year) & (all_years <= end_year)]
 
     if df_filtered.empty:
         print(f"警告: {start_year}至{end_year}年范围内没有数据")
         return None
 
+    # 行业 x 年份 矩阵，缺失值按0处理
+    pivot_data = df_filtered.unstack("year", fill_value=0)
+
     # 处理行业类别数量限制
     # 首先依据行业的总消费量进行排序（忽略"其他"类别）
-    df_no_other = df_filtered[df_filtered["industry"] != "其他"]
-    industry_totals = df_no_other.groupby("industry")["value"].sum().sort_values(ascending=False)
+    industry_totals = (
+        pivot_data.drop(index="其他", errors="ignore").sum(axis=1).sort_values(ascending=False)
+    )
 
     # 如果行业数量超过max_categories，则将剩余行业归为"其他"
     if len(industry_totals) > max_categories:
-        # 获取前N个最大的行业
-        top_industries = industry_totals.index[:max_categories].tolist()
-
-        # 将剩余行业标记为"其他"
-        df_filtered.loc[
-            ~df_filtered["industry"].isin(top_industries) & (df_filtered["industry"] != "其他"),
-            "industry",
-        ] = "其他"
-
-        # 对其他类别进行汇总
-        df_agg = df_filtered.groupby(["year", "industry"])["value"].sum().reset_index()
-        df_filtered = df_agg
+        rest_industries = industry_totals.index[max_categories:]
+        others = pivot_data.loc[rest_industries].sum()
+        if "其他" in pivot_data.index:
+            others = others + pivot_data.loc["其他"]
+        pivot_data = pivot_data.drop(index=list(rest_industries) + ["其他"], errors="ignore")
+        pivot_data.loc["其他"] = others
 
     # 排序行业 - 按总量降序排列，将"其他"放在最后
-    # 先计算每个行业的总量
-    industry_order = df_filtered.groupby("industry")["value"].sum().sort_values(ascending=False)
-
-    # 确保"其他"类别放在最后面（如果存在）
+    industry_order = pivot_data.sum(axis=1).sort_values(ascending=False)
+    industries = [industry for industry in industry_order.index if industry != "其他"]
     if "其他" in industry_order.index:
-        other_value = industry_order["其他"]
-        industry_order = industry_order[industry_order.index != "其他"]
-        # 附加到最后
-        industry_order = pd.concat([industry_order, pd.Series({"其他": other_value})])
-
-    # 使用排序后的顺序
-    industries = industry_order.index.tolist()
-    years = sorted(df_filtered["year"].unique())
-
-    # 创建数据透视表以便于绘图
-    pivot_data = df_filtered.pivot(index="industry", columns="year", values="value").fillna(0)
+        industries.append("其他")
 
     # 确保数据按来自行业排序的industry_order的顺序排列
     pivot_data = pivot_data.reindex(industries)
+    years = sorted(pivot_data.columns)
+    pivot_data = pivot_data[years]
+    values = pivot_data.to_numpy(dtype=float)
 
     # 设置图表尺寸和颜色映射
     fig, ax = plt.subplots(figsize=figsize)
-    color_map = plt.cm.get_cmap(colormap)
+    color_map = matplotlib.colormaps[colormap]
 
     # 计算绘图参数
     n_industries = len(industries)
     n_years = len(years)
     bar_width = 0.7 / n_years  # 每个年份柱的宽度 - 设置小一些增加间隔
     industry_width = 1.2  # 每个行业组的宽度 - 增加间隔
+    colors = color_map(np.arange(n_industries) / n_industries)
+
+    # 柱的位置矩阵：行业位置 + 柱在行业组内的偏移
+    positions = (
+        np.arange(n_industries)[:, None] * industry_width
+        + (np.arange(n_years)[None, :] - n_years / 2 + 0.5) * bar_width
+    )
 
     # 创建用于增长率标注的辅助坐标轴
     ax2 = ax.twinx()
@@ -230,93 +232,64 @@ def plot_industry_energy_trends(
     ax2.yaxis.set_major_formatter(mtick.PercentFormatter(decimals=0))
     ax2.spines["right"].set_color("gray")
 
-    # 创建存储每个行业的增长率数据的字典
-    growth_rates = {}
-
-    # 绘制分组柱状图
-    for i, industry in enumerate(industries):
-        industry_data = pivot_data.loc[industry]
-        industry_growth_rates = []  # 存储该行业的增长率
-        industry_positions = []  # 存储柱子位置以绘制增长率线
-
-        for j, year in enumerate(years):
-            # 计算柱的位置：行业位置 + 柱在行业组内的偏移
-            bar_position = i * industry_width + (j - n_years / 2 + 0.5) * bar_width
-            value = industry_data.get(year, 0)  # 获取对应年份的值，如果不存在则为0
-            industry_positions.append(bar_position)  # 记录位置用于绘制增长率线
-
-            # 计算相对于上一年的变化率（如果不是第一年）
-            if j > 0 and industry_data.get(years[j - 1], 0) != 0:
-                prev_value = industry_data.get(years[j - 1], 0)
-                change_pct = (value - prev_value) / prev_value * 100
-                industry_growth_rates.append(change_pct)  # 添加到增长率列表
-            else:
-                industry_growth_rates.append(None)  # 第一年没有增长率
-
-            # 绘制柱状图
-            bar = ax.bar(
-                bar_position,
-                value,
-                width=bar_width * 0.9,  # 稍微缩小柱子宽度增加间隔
-                color=color_map(i / n_industries),
-                alpha=0.8,
-                label=industry if j == 0 else "",
-                edgecolor="white",
-                linewidth=0.5,
-            )
+    # 年份标签以文字标记批量绘制：每个年份一个图元，而不是每根柱一个文本对象
+    label_transform = mtransforms.offset_copy(ax.transData, fig=fig, y=4, units="points")
+
+    # 绘制分组柱状图：每个年份一次绘制所有行业的柱
+    for j, year in enumerate(years):
+        ax.bar(
+            positions[:, j],
+            values[:, j],
+            width=bar_width * 0.9,  # 稍微缩小柱子宽度增加间隔
+            color=colors,
+            alpha=0.8,
+            edgecolor="white",
+            linewidth=0.5,
+        )
+        # 在柱子上方添加年份标签
+        ax.scatter(
+            positions[:, j],
+            values[:, j] * 1.02,
+            marker=f"${year}$",
+            s=400,
+            c="gray",
+            linewidths=0,
+            transform=label_transform,
+        )
 
-        # 存储该行业的增长率数据
-        growth_rates[industry] = {"positions": industry_positions, "rates": industry_growth_rates}
+    # 相对于上一年的变化率（上一年为0时没有增长率）
+    previous = values[:, :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth_rates = np.where(previous != 0, (values[:, 1:] - previous) / previous * 100, np.nan)
 
     # 为每个行业绘制增长率线
-    for industry, data in growth_rates.items():
-        positions = data["positions"]
-        rates = data["rates"]
-
-        # 过滤掉第一个点（没有增长率）
-        valid_positions = [pos for pos, rate in zip(positions[1:], rates[1:]) if rate is not None]
-        valid_rates = [rate for rate in rates[1:] if rate is not None]
-
-        if valid_positions and valid_rates:
-            industry_index = industries.index(industry)
-            line_color = color_map(industry_index / n_industries)
-
-            # 绘制该行业的增长率线
-            ax2.plot(valid_positions, valid_rates, "-o", color=line_color, alpha=0.7, linewidth=1.5)
-
-            # 标注最后一个点的增长率值
-            if valid_rates:
-                ax2.annotate(
-                    f"{valid_rates[-1]:.1f}%",
-                    xy=(valid_positions[-1], valid_rates[-1]),
-                    xytext=(5, 0),
-                    textcoords="offset points",
-                    ha="left",
-                    va="center",
-                    color=line_color,
-                    fontsize=8,
-                )
+    for i in range(n_industries):
+        valid = ~np.isnan(growth_rates[i])
+        if not valid.any():
+            continue
+        valid_positions = positions[i, 1:][valid]
+        valid_rates = growth_rates[i][valid]
+
+        # 绘制该行业的增长率线
+        ax2.plot(valid_positions, valid_rates, "-o", color=colors[i], alpha=0.7, linewidth=1.5)
+
+        # 标注最后一个点的增长率值
+        ax2.annotate(
+            f"{valid_rates[-1]:.1f}%",
+            xy=(valid_positions[-1], valid_rates[-1]),
+            xytext=(5, 0),
+            textcoords="offset points",
+            ha="left",
+            va="center",
+            color=colors[i],
+            fontsize=8,
+        )
 
     # 设置x轴刻度和标签（两级）
     # 第一级：行业位置 - 考虑行业间隔
-    ax.set_xticks([i * industry_width for i in range(n_industries)])
+    ax.set_xticks(np.arange(n_industries) * industry_width)
     ax.set_xticklabels(industries, fontsize=12, rotation=30, ha="right")
 
-    # 为每个行业组添加年份标签
-    for i, industry in enumerate(industries):
-        for j, year in enumerate(years):
-            bar_position = i * industry_width + (j - n_years / 2 + 0.5) * bar_width
-            # 在柱子上方添加年份标签
-            ax.text(
-                bar_position,
-                pivot_data.loc[industry, year] * 1.02,  # 将文本放在柱子的顶部上方
-                str(year),
-                ha="center",
-                va="bottom",
-                fontsize=8,
-                color="gray",
-            )
-
     # 设置标题和坐标轴标签
     if title is None:
         title = f"{start_year}至{end_year}年各行业能源消费趋势"
@@ -329,15 +302,15 @@ def plot_industry_energy_trends(
     # 调整y轴范围，确保显示完整的数据
     ax.set_ylim(bottom=0)  # 设置为从0开始
     # 确保有足够空间显示柱子上方的年份标签
-    y_max = pivot_data.max().max() * 1.15  # 增加一点空间
+    y_max = values.max() * 1.15  # 增加一点空间
     ax.set_ylim(top=y_max)
 
-    # 添加图例
-    handles, labels = ax.get_legend_handles_labels()
-    unique_labels = dict(zip(labels, handles))
-    ax.legend(
-        unique_labels.values(), unique_labels.keys(), title="行业", loc="upper right", fontsize=12
-    )
+    # 添加图例（每个行业一个色块）
+    handles = [
+        mpatches.Patch(facecolor=colors[i], alpha=0.8, edgecolor="white", label=industry)
+        for i, industry in enumerate(industries)
+    ]
+    ax.legend(handles=handles, title="行业", loc="upper right", fontsize=12)
 
     plt.tight_layout()
 
@@ -515,11 +488,6 @@ def generate_chart(args):
     # 解包参数
     chart_type, chart_params, output_path = args
     
-    # 确保在子进程中使用Agg后端
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    
     try:
         if chart_type == 'energy_consumption':
             df, energy_type, title, figsize, baseline_year = chart_params
@@ -548,108 +516,43 @@ def generate_chart(args):
         return None
 
 
-def get_docx_placeholder_replacement_values(
-    datas: list[pd.DataFrame], year: int, province: str, temp_dir=None
-):
+def compute_replacement_values(
+    cube: AggregateCube, year: int, province: str, metrics: pd.DataFrame = None
+) -> dict:
+    """
+    Placeholder values of one report, without the charts (image_paths is left empty).
 
-    # 创建用于保存结果的字典
-    res = {
-        "year": year,
-        "province": province,
-        "values": [],
-        "choices": [],
-        "industries": [],
-        "image_paths": [],
-    }
+    metrics may hold the evaluate_metrics result of several years, so a batch of reports
+    shares one evaluation pass.
+    """
+    # 与原先逐项计算一致：缺少当年或上一年数据时直接报错
+    consumption = energy_consumption_by_year(cube, "其他能源")
+    for required_year in (year, year - 1):
+        if required_year not in consumption.index:
+            raise KeyError(required_year)
 
-    # 确保临时目录存在
-    if temp_dir is None:
-        temp_dir = DEFAULT_PATHS["temp_images"]
-    os.makedirs(temp_dir, exist_ok=True)
-    df1, df2, df3, df4 = datas
-    consumption = energy_consumption_by_year(df1, "其他能源")
-    intensity = energy_intensity_by_year(df4, df2)
-    res["values"].append(consumption[year])  # val1
-    res["values"].append(consumption[year - 1])  # val2
-    if consumption[year] > consumption[year - 1]:
-        res["choices"].append("增长")
-    else:
-        res["choices"].append("下降")  # choices1
-    res["values"].append(consumption[year] / consumption[year - 1])  # val3
+    # 所有占位符由指标注册表一次性向量化计算
+    if metrics is None or year not in metrics.index:
+        metrics = evaluate_metrics(cube, [year])
+    return replacement_values_for(metrics, year, province)
 
-    if intensity[year] > intensity[year - 1]:
-        res["choices"].append("增长")
-    else:
-        res["choices"].append("下降")  # choices2
-    res["values"].append(intensity[year] / intensity[year - 1])  # val4
-    res["values"].append(consumption[2020])  # val5
-    res["values"].append(consumption[year])  # val6
-    res["values"].append(consumption[year] / consumption[2020])  # val7
-    res["values"].append(consumption[year] / consumption[2020] / (year - 2020))  # val8
-
-    ### Trend
-    if consumption[year] / consumption[year - 1] > consumption[year] / consumption[2020] / (
-        year - 2020
-    ):
-        res["choices"].append("高于")
-    else:
-        res["choices"].append("低于")  # choices3
-    res["values"].append((intensity[2020] - intensity[year]) / intensity[2020])  # val9
-    res["values"].append((intensity[2020] - intensity[year]) / intensity[2020] / 0.135)  # val10
-    res["values"].append(year - 2020)  # val11
-    res["values"].append(
-        (13.5 - (intensity[2020] - intensity[year]) / intensity[2020]) / (year - 2020)
-    )  # val12
-
-    consumption_iy1, consumption_iy2 = energy_consumption_by_industry_and_year(df2)
-    consumption_iy1 = consumption_iy1.reset_index()
-    consumption_iy2 = consumption_iy2.reset_index()
-
-    consumption_y1 = consumption_iy1[consumption_iy1["year"] == year].sort_values(
-        by="value", ascending=False
-    )
 
-    res["industries"].append(consumption_y1.iloc[0]["industry"])  # industry1
-    res["industries"].append(consumption_y1.iloc[1]["industry"])  # industry2
-
-    res["values"].append(0)  # val13
-    res["values"].append(0)  # val14
-
-    # 使用 consumption_iy1 计算不同行业的相比前一年的增速
-    industry_speedup = {}
-    for industry in consumption_iy1["industry"].unique():
-        industry_speedup[industry] = (
-            consumption_iy1[
-                (consumption_iy1["year"] == year) & (consumption_iy1["industry"] == industry)
-            ]["value"].values[0]
-            / consumption_iy1[
-                (consumption_iy1["year"] == year - 1) & (consumption_iy1["industry"] == industry)
-            ]["value"].values[0]
-        )
-    # 排序，获得加速前2的行业和加速比
-    sorted_speedup = sorted(industry_speedup.items(), key=lambda x: x[1], reverse=True)
-    res["values"].append(sorted_speedup[0][1])  # val15
-    res["values"].append(sorted_speedup[1][1])  # val16
-    res["industries"].append(sorted_speedup[0][0])  # industry3
-    res["industries"].append(sorted_speedup[1][0])  # industry4
-
-    ### Trend
-    if (
-        consumption_iy1[consumption_iy1["year"] == year]["value"].sum()
-        > consumption_iy1[consumption_iy1["year"] == 2020]["value"].sum()
-    ):
-        res["choices"].append("增长")
-    else:
-        res["choices"].append("下降")  # choices4
+def build_chart_tasks(cube: AggregateCube, year: int, province: str, temp_dir) -> list:
+    """
+    Chart tasks of one report for generate_chart, writing into temp_dir.
 
-    # 使用多进程生成可视化图表
-    print("开始多进程生成可视化图表...")
-    
-    # 准备图表生成任务
-    chart_tasks = [
+    Each task carries only the small pre-aggregated series its chart plots, not the cube or
+    the raw sheets, so sending it to a render worker is cheap.
+    """
+    consumption = cube.consumption_by_year("其他能源")
+    intensity = cube.intensity_by_year()
+    industry = cube.industry_by_year
+    industry_years = industry.index.get_level_values("year")
+
+    return [
         # 图1: 能源消费量图表
         ('energy_consumption', (
-            df1, 
+            consumption, 
             "其他能源", 
             f"{province}{year}年能源消费量年度变化", 
             (10, 6), 
@@ -658,24 +561,24 @@ def get_docx_placeholder_replacement_values(
         
         # 图2: 能源强度图表
         ('energy_intensity', (
-            df4, 
-            df2, 
+            None, 
+            intensity, 
             f"{province}{year}年能源强度年度变化", 
             (10, 6), 
             2020
         ), os.path.join(temp_dir, "energy_intensity.png")),
         
-        # 图3: 行业能源消费占比饼图
+        # 图3: 行业能源消费占比饼图（仅当年）
         ('industry_pie', (
-            df2, 
+            industry[industry_years == year], 
             year, 
             f"{province}{year}年各行业能源消费占比", 
             (8, 8)
         ), os.path.join(temp_dir, "industry_pie.png")),
         
-        # 图4: 行业能源消费趋势图
+        # 图4: 行业能源消费趋势图（仅2020年至当年）
         ('industry_trends', (
-            df2, 
+            industry[(industry_years >= 2020) & (industry_years <= year)], 
             2020, 
             year, 
             f"{province}2020至{year}年各行业能源消费趋势", 
@@ -683,14 +586,53 @@ def get_docx_placeholder_replacement_values(
             "Pastel1"
         ), os.path.join(temp_dir, "industry_trends.png"))
     ]
+
+
+def render_charts(cube: AggregateCube, year: int, province: str, temp_dir) -> list:
+    """
+    Render the charts of one report into temp_dir.
+
+    Returns:
+        Paths of the charts that were generated (failed charts are left out)
+    """
+    print("开始多进程生成可视化图表...")
     
-    # 使用进程池并行处理图表生成
-    with mp.Pool(processes=min(mp.cpu_count(), len(chart_tasks))) as pool:
-        results = pool.map(generate_chart, chart_tasks)
+    # 准备图表生成任务
+    chart_tasks = build_chart_tasks(cube, year, province, temp_dir)
+    
+    # 使用常驻的图表渲染进程池；未启用时退回临时进程池
+    # （延迟导入：chart_pool 依赖 utils 包，而 utils 包会导入本模块）
+    from report.chart_pool import get_chart_pool, get_pool_context
+
+    chart_pool = get_chart_pool()
+    if chart_pool is not None:
+        results = chart_pool.render(chart_tasks)
+    else:
+        processes = min(mp.cpu_count(), len(chart_tasks))
+        with get_pool_context().Pool(processes=processes) as pool:
+            results = pool.map(generate_chart, chart_tasks)
     
     # 过滤掉失败的结果，只保留成功生成的图表路径
-    successful_paths = [path for path in results if path is not None]
-    res["image_paths"].extend(successful_paths)
+    return [path for path in results if path is not None]
+
+
+def get_docx_placeholder_replacement_values(
+    datas: list[pd.DataFrame], year: int, province: str, temp_dir=None, cube: AggregateCube = None
+):
+
+    # 确保临时目录存在
+    if temp_dir is None:
+        temp_dir = DEFAULT_PATHS["temp_images"]
+    os.makedirs(temp_dir, exist_ok=True)
+    # 所有指标和图表都读取预聚合的立方体，不再重复扫描原始数据表
+    if cube is None:
+        cube = AggregateCube.from_sheets(datas)
+
+    # 创建用于保存结果的字典
+    res = compute_replacement_values(cube, year, province)
+
+    # 使用多进程生成可视化图表
+    res["image_paths"].extend(render_charts(cube, year, province, temp_dir))
     
     print(f"已生成 {len(res['image_paths'])} 张图表用于报告")
     print(res)
@@ -700,32 +642,22 @@ def get_docx_placeholder_replacement_values(
 
 import os
 import re
-import openai
 import concurrent.futures
 import base64
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+
+from report.markdown_template import MarkdownTemplate, get_markdown_template
+from report.placeholders import ABSTRACT_PLACEHOLDER, placeholder_values
 
 
 def generate_text_with_llm(context, prompt, max_tokens=150, temperature=0.7):
     """
-    使用LLM生成文本的通用函数
+    使用LLM生成文本的通用函数（使用进程内共享、连接复用的 LLM 客户端）
     """
-    client = openai.OpenAI(
-        api_key="sk-esfitgzkgjgnrgjhxpfsuolsgqubdvplclhzpdkuspwpsort",
-        base_url="https://api.siliconflow.cn/v1",
-    )
+    # 延迟导入：utils 包会导入本模块
+    from utils.llm_client import get_llm_client
 
-    # 使用OpenAI SDK调用API
-    response = client.chat.completions.create(
-        model="Pro/deepseek-ai/DeepSeek-V3",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=max_tokens,
-        temperature=temperature,
-    )
-
-    # 提取生成的文本
-    generated_text = response.choices[0].message.content.strip()
-    return generated_text
+    return get_llm_client().complete(prompt, max_tokens=max_tokens, temperature=temperature)
 
 
 def generate_conclusion_with_llm(context, year, prompt=None):
@@ -759,86 +691,40 @@ def generate_abstract_with_llm(full_text, year, province):
     return generate_text_with_llm(full_text, prompt, max_tokens=500, temperature=0.5)
 
 
-def replace_markdown_placeholders(
-    replacement_values: dict[str, any], template_path=None, output_path=None
-) -> Tuple[Path, str]:
-    # 使用默认路径或自定义路径
+def load_template(template_path=None) -> MarkdownTemplate:
+    """Compiled markdown report template (cached until the file changes)."""
     if template_path is None:
         template_path = DEFAULT_PATHS["template"]
-    if output_path is None:
-        output_path = DEFAULT_PATHS["output"]
-
-    # 确保路径是Path对象
-    template_path = Path(template_path)
-    output_path = Path(output_path)
-
     print(f"处理Markdown文档: {template_path}")
+    return get_markdown_template(template_path)
 
-    # 读取模板文件内容
-    with open(template_path, "r", encoding="utf-8") as file:
-        markdown_content = file.read()
-
-    if "image_paths" in replacement_values:
-        print(f"准备插入{len(replacement_values['image_paths'])}张图片")
-
-    # 替换年份和省份
-    markdown_content = markdown_content.replace(
-        "<placeholder_year>", str(replacement_values["year"])
-    )
-    markdown_content = markdown_content.replace(
-        "<placeholder_prev_year>", str(replacement_values["year"] - 1)
-    )
-    markdown_content = markdown_content.replace(
-        "<placeholder_province>", replacement_values["province"]
-    )
-
-    # 替换数值
-    for i, value in enumerate(replacement_values["values"]):
-        markdown_content = markdown_content.replace(
-            f"<placeholder_val{i+1}>", "{:.2f}".format(value)
-        )
 
-    # 替换选择项
-    for i, choice in enumerate(replacement_values["choices"]):
-        markdown_content = markdown_content.replace(f"<placeholder_choices{i+1}>", str(choice))
-
-    # 替换行业名称
-    for i, industry in enumerate(replacement_values.get("industries", [])):
-        markdown_content = markdown_content.replace(f"<placeholder_industry{i+1}>", str(industry))
+def generate_conclusions(
+    template: MarkdownTemplate,
+    values: Dict[str, str],
+    year: int,
+    executor: concurrent.futures.Executor = None,
+) -> Dict[int, str]:
+    """
+    Generate the conclusion of every conclusion slot from its paragraph.
 
-    # 处理总结占位符 - 在所有其他占位符替换后执行
-    conclusion_placeholder_pattern = r"<placeholder[^>]*conclusion[^>]*>"
+    Conclusions only depend on the filled-in numbers, so this can run before the charts exist.
 
+    Returns:
+        Conclusion texts by slot (segment index of the template)
+    """
     print("开始处理段落总结...")
-    year = replacement_values["year"]
 
-    # 查找所有总结占位符
-    conclusion_matches = list(re.finditer(conclusion_placeholder_pattern, markdown_content))
+    # 为每个总结占位符收集所在段落的上下文
     conclusion_tasks = []
-
-    # 为每个匹配的占位符收集上下文
-    for i, match in enumerate(conclusion_matches):
-        # 找到占位符所在的段落
-        start_pos = markdown_content.rfind("\n\n", 0, match.start()) + 2
-        if start_pos < 2:  # 如果没有找到\n\n，可能是文档开头
-            start_pos = 0
-
-        end_pos = markdown_content.find("\n\n", match.end())
-        if end_pos == -1:  # 如果没有找到\n\n，可能是文档结尾
-            end_pos = len(markdown_content)
-
-        paragraph_text = markdown_content[start_pos:end_pos]
-        print(f"找到总结占位符: '{paragraph_text[:50]}...'")
-
-        # 提取上下文（移除占位符）
-        context = re.sub(conclusion_placeholder_pattern, "", paragraph_text).strip()
-
-        # 将任务添加到列表
-        conclusion_tasks.append((i, match, context))
+    for i, (slot, paragraph) in enumerate(template.conclusion_slots):
+        context = paragraph.render_without_conclusions(values).strip()
+        print(f"找到总结占位符: '{paragraph.render(values)[:50]}...'")
+        conclusion_tasks.append((i, slot, context))
 
     # 定义处理单个总结的函数
     def process_conclusion(task_tuple):
-        idx, match, ctx = task_tuple
+        idx, slot, ctx = task_tuple
         if ctx.strip():
             # 有内容，生成总结
             print(f"处理总结任务 {idx+1}/{len(conclusion_tasks)}: 使用段落内容生成")
@@ -847,77 +733,168 @@ def replace_markdown_placeholders(
             # 无内容，使用默认总结
             print(f"处理总结任务 {idx+1}/{len(conclusion_tasks)}: 使用默认总结")
             conclusion = f"{year}年能耗数据分析显示能源消费和强度指标有所变化，各行业能源结构存在差异。需要继续关注节能降耗和能源转型发展。"
-        return idx, match, conclusion
+        return idx, slot, conclusion
 
     # 使用线程池并发处理所有总结生成任务
-    replacements_to_make = []
+    conclusions = {}
     if conclusion_tasks:
         print(f"并发处理 {len(conclusion_tasks)} 个总结生成任务...")
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=min(5, len(conclusion_tasks))
-        ) as executor:
+        own_executor = executor is None
+        if own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(5, len(conclusion_tasks))
+            )
+        try:
             # 提交所有任务并等待完成
-            futures = {executor.submit(process_conclusion, task): task for task in conclusion_tasks}
-
-            # 收集处理结果
+            futures = [executor.submit(process_conclusion, task) for task in conclusion_tasks]
             for future in concurrent.futures.as_completed(futures):
-                idx, match, conclusion = future.result()
+                idx, slot, conclusion = future.result()
                 print(f"完成总结任务 {idx+1}/{len(conclusion_tasks)}: {conclusion[:50]}...")
-                # 保存替换信息
-                replacements_to_make.append((match.span(), conclusion))
+                conclusions[slot] = conclusion
+        finally:
+            if own_executor:
+                executor.shutdown()
+                executor = None
     else:
         print("没有找到需要生成总结的段落")
 
-    # 应用替换（从后向前，以避免位置偏移）
-    replacements_to_make.sort(key=lambda x: x[0][0], reverse=True)
-    for (start, end), conclusion in replacements_to_make:
-        markdown_content = markdown_content[:start] + conclusion + markdown_content[end:]
-
-    # 处理摘要占位符
-    abstract_placeholder = "<placeholder_abstract>"
-    if abstract_placeholder in markdown_content:
-        print("开始生成文档摘要...")
-        # 生成摘要
-        province = replacement_values["province"]
-        abstract = generate_abstract_with_llm(markdown_content, year, province)
-        print(f"摘要生成成功: {abstract[:50]}...")
-
-        # 替换占位符
-        markdown_content = markdown_content.replace(abstract_placeholder, abstract)
-
-    # 替换图像 - 将图片以base64编码直接嵌入到Markdown中,放到最后防止被 llm 读取占用 context 空间
-    for i, img_path in enumerate(replacement_values.get("image_paths", [])):
+    return conclusions
+
+
+def generate_abstract(
+    template: MarkdownTemplate,
+    values: Dict[str, str],
+    conclusions: Dict[int, str],
+    year: int,
+    province: str,
+    executor: concurrent.futures.Executor = None,
+) -> Optional[str]:
+    """Generate the abstract from the report text, or None if the template has no abstract."""
+    if ABSTRACT_PLACEHOLDER not in template.placeholders:
+        return None
+
+    print("开始生成文档摘要...")
+    # 摘要基于填入数值和总结后的全文（图片尚未填入）
+    full_text = template.render(values, conclusions)
+    if executor is not None:
+        abstract = executor.submit(generate_abstract_with_llm, full_text, year, province).result()
+    else:
+        abstract = generate_abstract_with_llm(full_text, year, province)
+    print(f"摘要生成成功: {abstract[:50]}...")
+    return abstract
+
+
+def image_placeholder_values(
+    template: MarkdownTemplate, image_paths: list, inline_images: bool = None
+) -> Dict[str, str]:
+    """
+    Markdown of the image placeholders.
+
+    Images are stored in the content-addressed image store and referenced by URL; with
+    inline_images (default REPORT_INLINE_IMAGES) they are embedded as base64 instead, for
+    offline export.
+    """
+    # 图像在摘要之后才填入，避免被 llm 读取占用 context 空间
+    # （延迟导入：utils 包会导入本模块）
+    from utils.image_store import get_image_store, inline_images_default
+
+    if inline_images is None:
+        inline_images = inline_images_default()
+
+    images = {}
+    for i, img_path in enumerate(image_paths):
         placeholder = f"<placeholder_img{i+1}>"
-        if placeholder in markdown_content:
+        if placeholder in template.placeholders:
             print(f"处理图片 {i+1}: {placeholder}")
-            # 将图片转换为base64并嵌入到markdown中
             try:
-                # 读取图片文件
-                with open(img_path, "rb") as img_file:
-                    img_data = img_file.read()
-                    # 编码为base64
-                    img_base64 = base64.b64encode(img_data).decode("utf-8")
+                if inline_images:
+                    # 将图片以base64编码直接嵌入到Markdown中（离线导出）
+                    with open(img_path, "rb") as img_file:
+                        img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
                     # 获取文件扩展名以确定MIME类型
                     file_ext = os.path.splitext(img_path)[1].lower()[1:]
                     if file_ext == "jpg":
                         file_ext = "jpeg"
-                    # 创建markdown格式的base64图片
                     img_markdown = f"![图片{i+1}](data:image/{file_ext};base64,{img_base64})"
-                    # 替换占位符
-                    markdown_content = markdown_content.replace(placeholder, img_markdown)
                     print(f"图片 {i+1} 已成功嵌入为base64")
+                else:
+                    # 存入内容寻址的图片存储，通过URL引用，浏览器可缓存
+                    image_store = get_image_store()
+                    img_markdown = f"![图片{i+1}]({image_store.url(image_store.put(img_path))})"
+                    print(f"图片 {i+1} 已保存: {img_markdown}")
             except Exception as e:
-                print(f"嵌入图片 {i+1} 时出错: {e}")
+                print(f"处理图片 {i+1} 时出错: {e}")
                 # 如果出错，使用普通链接
                 img_markdown = f"![图片{i+1}]({img_path})"
-                markdown_content = markdown_content.replace(placeholder, img_markdown)
+            images[placeholder] = img_markdown
+
+    return images
+
 
+def render_report(
+    template: MarkdownTemplate,
+    values: Dict[str, str],
+    conclusions: Dict[int, str] = None,
+    abstract: Optional[str] = None,
+    images: Dict[str, str] = None,
+) -> str:
+    """Render the whole report in one pass over the template segments."""
+    values = {**values, **(images or {})}
+    if abstract is not None:
+        values[ABSTRACT_PLACEHOLDER] = abstract
+    return template.render(values, conclusions)
+
+
+def write_report(markdown_content: str, output_path=None) -> Path:
+    """Write the report markdown and return its path."""
+    if output_path is None:
+        output_path = DEFAULT_PATHS["output"]
+    output_path = Path(output_path)
     # 保存文档
     output_path.parent.mkdir(parents=True, exist_ok=True)  # 确保输出目录存在
     with open(output_path, "w", encoding="utf-8") as file:
         file.write(markdown_content)
     print(f"报告已生成: {output_path}")
 
+    return output_path
+
+
+def replace_markdown_placeholders(
+    replacement_values: dict[str, any],
+    template_path=None,
+    output_path=None,
+    executor: concurrent.futures.Executor = None,
+    inline_images: bool = None,
+) -> Tuple[Path, str]:
+    """
+    Fill the markdown template and write the report.
+
+    Runs the stages in order: values, conclusions, abstract, images (see image_placeholder_values
+    for inline_images), then renders the compiled template in one pass. report.pipeline
+    schedules the same stages as a task graph so the charts render while the LLM narratives are
+    generated.
+
+    executor is an optional shared thread pool for the LLM narratives (conclusions and abstract);
+    batch generation passes one pool for all reports so the number of concurrent LLM calls stays
+    bounded. Without it a private pool is used for the conclusions.
+    """
+    year = replacement_values["year"]
+    province = replacement_values["province"]
+
+    template = load_template(template_path)
+
+    if "image_paths" in replacement_values:
+        print(f"准备插入{len(replacement_values['image_paths'])}张图片")
+
+    values = placeholder_values(replacement_values)
+    conclusions = generate_conclusions(template, values, year, executor)
+    abstract = generate_abstract(template, values, conclusions, year, province, executor)
+    images = image_placeholder_values(
+        template, replacement_values.get("image_paths", []), inline_images
+    )
+    markdown_content = render_report(template, values, conclusions, abstract, images)
+    output_path = write_report(markdown_content, output_path)
+
     # 返回输出文件路径
     return output_path, markdown_content
 
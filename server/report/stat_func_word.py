@@ -658,33 +658,22 @@ def get_docx_placeholder_replacement_values(
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from report.docx_template import get_docx_template
+from report.placeholders import CONCLUSION_PATTERN, placeholder_values
 import os
 import re
-import openai
 import concurrent.futures
 from typing import List, Tuple, Dict, Any
 
 
 def generate_text_with_llm(context, prompt, max_tokens=150, temperature=0.7):
     """
-    使用LLM生成文本的通用函数
+    使用LLM生成文本的通用函数（使用进程内共享、连接复用的 LLM 客户端）
     """
-    client = openai.OpenAI(
-        api_key="sk-esfitgzkgjgnrgjhxpfsuolsgqubdvplclhzpdkuspwpsort",
-        base_url="https://api.siliconflow.cn/v1",
-    )
-
-    # 使用OpenAI SDK调用API
-    response = client.chat.completions.create(
-        model="Pro/deepseek-ai/DeepSeek-V3",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=max_tokens,
-        temperature=temperature,
-    )
+    # 延迟导入：utils 包会导入本模块
+    from utils.llm_client import get_llm_client
 
-    # 提取生成的文本
-    generated_text = response.choices[0].message.content.strip()
-    return generated_text
+    return get_llm_client().complete(prompt, max_tokens=max_tokens, temperature=temperature)
 
 
 def generate_conclusion_with_llm(context, year, prompt=None):
@@ -719,89 +708,52 @@ def generate_abstract_with_llm(full_text, year, province):
 
 
 def replace_docx_placeholders(
-    replacement_values: dict[str, any], template_path=None, output_path=None
+    replacement_values: dict[str, any],
+    template_path=None,
+    output_path=None,
+    executor: concurrent.futures.Executor = None,
 ):
+    """
+    Fill the Word template and save the report.
+
+    The template is compiled once per file version (see report.docx_template): placeholders
+    split across runs are merged, all placeholders are substituted in one pass at the XML level
+    keeping the run formatting, and the charts are embedded at their image placeholders.
+    Conclusions and the abstract are generated from the filled-in paragraph texts first.
+    executor is an optional shared thread pool for the LLM narratives.
+    """
     # 使用默认路径或自定义路径
     if template_path is None:
         template_path = DEFAULT_PATHS["template"]
     if output_path is None:
         output_path = DEFAULT_PATHS["output"]
 
-    # 确保路径是Path对象
-    template_path = Path(template_path)
-    output_path = Path(output_path)
-
     print(f"处理Word文档: {template_path}")
-    doc = Document(str(template_path))
+    template = get_docx_template(template_path)
 
     if "image_paths" in replacement_values:
         print(f"准备插入{len(replacement_values['image_paths'])}张图片")
 
-    # 替换基本占位符
-    for paragraph in doc.paragraphs:
-        # 替换年份和省份
-        if "<placeholder_year>" in paragraph.text:
-            paragraph.text = paragraph.text.replace(
-                "<placeholder_year>", str(replacement_values["year"])
-            )
-        if "<placeholder_prev_year>" in paragraph.text:
-            paragraph.text = paragraph.text.replace(
-                "<placeholder_prev_year>", str(replacement_values["year"] - 1)
-            )
-        if "<placeholder_province>" in paragraph.text:
-            paragraph.text = paragraph.text.replace(
-                "<placeholder_province>", replacement_values["province"]
-            )
-
-        # 替换数值
-        for i, value in enumerate(replacement_values["values"]):
-            if f"<placeholder_val{i+1}>" in paragraph.text:
-                # 保留两位小数
-                paragraph.text = paragraph.text.replace(
-                    f"<placeholder_val{i+1}>", "{:.2f}".format(value)
-                )
-
-        # 替换选择项
-        for i, choice in enumerate(replacement_values["choices"]):
-            if f"<placeholder_choices{i+1}>" in paragraph.text:
-                paragraph.text = paragraph.text.replace(f"<placeholder_choices{i+1}>", str(choice))
-
-        # 替换行业名称
-        for i, industry in enumerate(replacement_values.get("industries", [])):
-            if f"<placeholder_industry{i+1}>" in paragraph.text:
-                paragraph.text = paragraph.text.replace(
-                    f"<placeholder_industry{i+1}>", str(industry)
-                )
-        # 替换图像
-        # for i, img_path in enumerate(replacement_values.get("image_paths", [])):
-        #     placeholder = f"<placeholder_img{i+1}>"
-        #     if placeholder in paragraph.text:
-        #         print(f"处理图片 {i+1}: {placeholder} 在段落: '{paragraph.text[:30]}...'")
-        #         replace_placeholder_with_img(paragraph, placeholder, img_path)
+    year = replacement_values["year"]
+    province = replacement_values["province"]
 
-    # 处理总结占位符 - 在所有其他占位符替换后执行
-    conclusion_placeholder_pattern = r"<placeholder[^>]*conclusion[^>]*>"
+    # 基本占位符：所有替换值在最后一次性写入文档
+    values = placeholder_values(replacement_values)
+    paragraph_texts = template.paragraph_texts(values)
 
+    # 处理总结占位符：按填入数值后的段落文本生成
     print("开始处理段落总结...")
-    year = replacement_values["year"]
-
-    # 使用多线程并发处理所有总结生成任务
-    # 步骤1: 收集所有需要处理的段落和上下文
     conclusion_tasks = []
-    for i, paragraph in enumerate(doc.paragraphs):
-        if re.search(conclusion_placeholder_pattern, paragraph.text):
-            original_text = paragraph.text
-            print(f"找到总结占位符: '{original_text[:50]}...'")
-
+    for i, text in enumerate(paragraph_texts):
+        if CONCLUSION_PATTERN.search(text):
+            print(f"找到总结占位符: '{text[:50]}...'")
             # 提取上下文
-            context = re.sub(conclusion_placeholder_pattern, "", original_text).strip()
-
-            # 将任务添加到列表
-            conclusion_tasks.append((i, paragraph, context))
+            context = CONCLUSION_PATTERN.sub("", text).strip()
+            conclusion_tasks.append((i, context))
 
     # 定义处理单个总结的函数
     def process_conclusion(task_tuple):
-        idx, para, ctx = task_tuple
+        idx, ctx = task_tuple
         if ctx.strip():
             # 有内容，生成总结
             print(f"处理总结任务 {idx+1}/{len(conclusion_tasks)}: 使用段落内容生成")
@@ -810,53 +762,59 @@ def replace_docx_placeholders(
             # 无内容，使用默认总结
             print(f"处理总结任务 {idx+1}/{len(conclusion_tasks)}: 使用默认总结")
             conclusion = f"{year}年能耗数据分析显示能源消费和强度指标有所变化，各行业能源结构存在差异。需要继续关注节能降耗和能源转型发展。"
-        return idx, para, conclusion
+        return idx, conclusion
 
-    # 步骤2: 使用线程池并发处理所有总结生成任务
+    # 每个段落的总结只替换该段落中的总结占位符
+    paragraph_values = {}
     if conclusion_tasks:
         print(f"并发处理 {len(conclusion_tasks)} 个总结生成任务...")
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=min(5, len(conclusion_tasks))
-        ) as executor:
-            # 提交所有任务并等待完成
-            futures = {executor.submit(process_conclusion, task): task for task in conclusion_tasks}
-
-            # 处理结果并替换段落内容
+        own_executor = executor is None
+        if own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(5, len(conclusion_tasks))
+            )
+        try:
+            futures = [executor.submit(process_conclusion, task) for task in conclusion_tasks]
             for future in concurrent.futures.as_completed(futures):
-                idx, para, conclusion = future.result()
+                idx, conclusion = future.result()
                 print(f"完成总结任务 {idx+1}/{len(conclusion_tasks)}: {conclusion[:50]}...")
-                # 替换占位符
-                para.text = re.sub(conclusion_placeholder_pattern, conclusion, para.text)
+                paragraph_values[idx] = {
+                    placeholder: conclusion
+                    for placeholder in CONCLUSION_PATTERN.findall(paragraph_texts[idx])
+                }
+        finally:
+            if own_executor:
+                executor.shutdown()
+                executor = None
     else:
         print("没有找到需要生成总结的段落")
 
     # 在处理完所有占位符后，生成文档摘要
     abstract_placeholder = "<placeholder_abstract>"
-
-    # 收集文档的全部内容
-    print("开始生成文档摘要...")
-    full_text = ""
-    for para in doc.paragraphs:
-        if para.text.strip():
-            full_text += para.text + "\n\n"
-
-    # 查找摘要占位符
-    for paragraph in doc.paragraphs:
-        if abstract_placeholder in paragraph.text:
-            print(f"找到摘要占位符，生成文档摘要")
-
-            # 生成摘要
-            province = replacement_values["province"]
+    if abstract_placeholder in template.placeholders:
+        print("开始生成文档摘要...")
+        full_text = "".join(
+            text + "\n\n"
+            for text in template.paragraph_texts(values, paragraph_values)
+            if text.strip()
+        )
+        if executor is not None:
+            abstract = executor.submit(
+                generate_abstract_with_llm, full_text, year, province
+            ).result()
+        else:
             abstract = generate_abstract_with_llm(full_text, year, province)
-            print(f"摘要生成成功: {abstract[:50]}...")
+        print(f"摘要生成成功: {abstract[:50]}...")
+        values[abstract_placeholder] = abstract
 
-            # 替换占位符
-            paragraph.text = paragraph.text.replace(abstract_placeholder, abstract)
-            break
-
-    # 保存文档
-    output_path.parent.mkdir(parents=True, exist_ok=True)  # 确保输出目录存在
-    doc.save(str(output_path))
+    # 替换所有占位符、嵌入图片并保存文档
+    images = {
+        f"<placeholder_img{i+1}>": img_path
+        for i, img_path in enumerate(replacement_values.get("image_paths", []))
+    }
+    output_path = template.render(
+        values, output_path, images=images, paragraph_values=paragraph_values
+    )
     print(f"报告已生成: {output_path}")
 
     # 返回输出文件路径
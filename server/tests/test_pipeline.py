@@ -0,0 +1,37 @@
+import time
+import threading
+
+import pytest
+
+from report.pipeline import TaskGraph
+
+
+def test_tasks_run_after_their_dependencies():
+    graph = TaskGraph()
+    graph.add("a", lambda: 1)
+    graph.add("b", lambda a: a + 1, ["a"])
+    graph.add("c", lambda a, b: a + b, ["a", "b"])
+    assert graph.run() == {"a": 1, "b": 2, "c": 3}
+    assert set(graph.timings) == {"a", "b", "c"}
+
+
+def test_failure_waits_for_running_tasks_and_skips_the_rest():
+    finished = []
+    slow_started = threading.Event()
+
+    def fail():
+        slow_started.wait(5)
+        raise KeyError(2023)
+
+    def slow():
+        slow_started.set()
+        time.sleep(0.5)
+        finished.append("slow")
+
+    graph = TaskGraph()
+    graph.add("fail", fail)
+    graph.add("slow", slow)
+    graph.add("after", lambda fail: finished.append("after"), ["fail"])
+    with pytest.raises(KeyError):
+        graph.run()
+    assert finished == ["slow"]
@@ -0,0 +1,51 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.sandbox_pool import SandboxWorker, get_interpreter, table_to_records
+
+
+def to_json_records(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records"))
+
+
+def test_sub_millisecond_timestamps_are_truncated():
+    df = pd.DataFrame({"t": pd.to_datetime(["2020-01-01 00:00:00.000123456", None])})
+    records = table_to_records(pa.Table.from_pandas(df, preserve_index=False))
+    assert records == [{"t": 1577836800000}, {"t": None}]
+    assert records == to_json_records(df)
+
+
+def test_durations_become_milliseconds():
+    df = pd.DataFrame({"d": pd.to_timedelta(["1 days 00:00:01.500", "00:00:00.000000700"])})
+    records = table_to_records(pa.Table.from_pandas(df, preserve_index=False))
+    assert records == [{"d": 86401500}, {"d": 0}]
+    assert records == to_json_records(df)
+    json.dumps(records)
+
+
+def test_dates_and_timezones():
+    df = pd.DataFrame({"t": pd.to_datetime(["2020-01-01 08:00"]).tz_localize("Asia/Shanghai")})
+    records = table_to_records(pa.Table.from_pandas(df, preserve_index=False))
+    assert records == to_json_records(df)
+
+    table = pa.table({"d": pa.array([pd.Timestamp("2020-01-01").date()], pa.date32())})
+    assert table_to_records(table) == [{"d": 1577836800000}]
+
+
+def test_output_to_fd_1_does_not_break_the_protocol():
+    code = (
+        "import os, sys, subprocess\n"
+        "os.write(1, b'raw')\n"
+        "sys.__stdout__.write('dunder')\n"
+        "sys.__stdout__.flush()\n"
+        "subprocess.run([sys.executable, '-c', 'print(1)'])\n"
+        "print('captured')\n"
+    )
+    worker = SandboxWorker(get_interpreter(), [])
+    try:
+        assert worker.run(code, timeout=30) == ("captured\n", None)
+        assert worker.run("print('next')", timeout=30) == ("next\n", None)
+    finally:
+        worker.stop()
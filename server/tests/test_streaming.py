@@ -0,0 +1,47 @@
+import asyncio
+
+from utils.streaming import iterate_async
+from utils.telemetry import current_trace, request_trace, span
+
+
+async def traced_events(name: str, steps: int, traces: list):
+    with request_trace(name) as trace:
+        traces.append(trace)
+        for i in range(steps):
+            with span(f"{name}-{i}"):
+                await asyncio.sleep(0)
+            yield i
+        assert current_trace() is trace
+
+
+def span_names(trace) -> list:
+    return [name for name, _, _, _ in trace.spans]
+
+
+def test_trace_survives_yields():
+    traces = []
+    assert list(iterate_async(traced_events("a", 3, traces))) == [0, 1, 2]
+    assert span_names(traces[0]) == ["a-0", "a-1", "a-2"]
+    assert current_trace() is None
+
+
+def test_interleaved_streams_keep_their_own_spans():
+    traces = []
+    first = iterate_async(traced_events("a", 3, traces))
+    second = iterate_async(traced_events("b", 3, traces))
+    for _ in range(3):
+        next(first)
+        next(second)
+    assert list(first) == [] and list(second) == []
+    a, b = traces
+    assert span_names(a) == ["a-0", "a-1", "a-2"]
+    assert span_names(b) == ["b-0", "b-1", "b-2"]
+
+
+def test_closing_early_finishes_the_trace():
+    traces = []
+    events = iterate_async(traced_events("a", 3, traces))
+    assert next(events) == 0
+    events.close()
+    assert traces[0].status == "error"
+    assert span_names(traces[0]) == ["a-0"]
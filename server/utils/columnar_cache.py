@@ -0,0 +1,87 @@
+import os
+from pathlib import Path
+from typing import Dict
+
+import pandas as pd
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("columnar_cache")
+
+
+def default_cache_dir() -> Path:
+    """
+    Directory for the published sheets.
+
+    SHARED_DATA_DIR if set, otherwise a directory in /dev/shm when the platform has one (so the
+    files live in shared memory), otherwise cache/columnar next to the server code.
+    """
+    if os.getenv("SHARED_DATA_DIR"):
+        return Path(os.getenv("SHARED_DATA_DIR"))
+    if os.path.isdir("/dev/shm"):
+        return Path("/dev/shm") / "intelli-vis"
+    return Path(__file__).parent.parent / "cache" / "columnar"
+
+
+# 列式缓存目录
+COLUMNAR_CACHE_DIR = default_cache_dir()
+
+
+def sheet_cache_path(sheet_name: str, version: str, cache_dir: Path = COLUMNAR_CACHE_DIR) -> Path:
+    """Path of the Arrow IPC file holding one sheet of a given workbook version."""
+    return Path(cache_dir) / f"{sheet_name}-{version}.arrow"
+
+
+def materialize_sheets(
+    sheets: Dict[str, pd.DataFrame], version: str, cache_dir: Path = COLUMNAR_CACHE_DIR
+) -> Dict[str, str]:
+    """
+    Publish every sheet as an uncompressed Arrow IPC file keyed by the workbook version.
+
+    The files are written once and memory-mapped read-only by every sandbox process, so all
+    of them share the same pages and none of them parses the data. Files that already exist
+    for this version are reused, files left over from older versions of the same sheet are
+    removed. A sheet that cannot be converted (e.g. mixed-type object columns) is skipped,
+    and callers fall back to reading it from the workbook.
+
+    Args:
+        sheets: Mapping of sheet name to DataFrame
+        version: Content hash of the source workbook
+        cache_dir: Directory for the Arrow files
+
+    Returns:
+        Mapping of sheet name to Arrow file path for every sheet that was materialized
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = {}
+    for sheet_name, df in sheets.items():
+        path = sheet_cache_path(sheet_name, version, cache_dir)
+
+        if not path.exists():
+            # 先写入临时文件再原子替换，避免并发读取到半截文件
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                # 不压缩，读取方可以直接内存映射，无需解码
+                df.reset_index(drop=True).to_feather(tmp_path, compression="uncompressed")
+                os.replace(tmp_path, path)
+                logger.info(f"生成列式缓存: {path.name}")
+            except Exception as e:
+                logger.warning(f"工作表 {sheet_name} 无法转换为列式缓存，将回退到读取Excel: {e}")
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                continue
+
+        # 清理该工作表旧版本的缓存文件
+        for stale in cache_dir.glob(f"{sheet_name}-*.arrow"):
+            if stale != path:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+        paths[sheet_name] = str(path)
+
+    return paths
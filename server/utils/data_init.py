@@ -1,9 +1,17 @@
 import os
-import pandas as pd
 
 # 预定义数据路径和相关信息
 DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data/湖北_外部能耗数据.xlsx")
 print(DATA_PATH)
+
+# 工作簿中的工作表
+SHEET_NAMES = [
+    "hubei_in_y_pro_ind_ene_off",
+    "hubei_in_y_pro_ind_ene2_off",
+    "hubei_in_y_pro_ind_prd_off",
+    "hubei_in_y_pro_gdp_off",
+]
+
 # 预加载数据描述
 DATA_DESCRIPTION = """
 湖北_外部能耗数据表，其中有4个sheet，分别是：
@@ -23,24 +31,7 @@ DATA_DESCRIPTION = """
 """
 
 def load_data_sample():
-    """生成数据样本，供DSPy模型分析使用"""
-    sample_template = """
-sheet:hubei_in_y_pro_ind_ene_off
-{sample1}
-
-sheet:hubei_in_y_pro_ind_ene2_off
-{sample2}
+    """生成数据画像文本，供DSPy模型分析使用（由常驻内存的数据集提供，不再重复读取Excel）"""
+    from utils.data_store import get_data_store
 
-sheet:hubei_in_y_pro_ind_prd_off
-{sample3}
-
-sheet:hubei_in_y_pro_gdp_off
-{sample4}
-"""
-    
-    sample1 = pd.read_excel(DATA_PATH, sheet_name="hubei_in_y_pro_ind_ene_off").head(5).to_csv(index=False)
-    sample2 = pd.read_excel(DATA_PATH, sheet_name="hubei_in_y_pro_ind_ene2_off").head(5).to_csv(index=False)
-    sample3 = pd.read_excel(DATA_PATH, sheet_name="hubei_in_y_pro_ind_prd_off").head(5).to_csv(index=False)
-    sample4 = pd.read_excel(DATA_PATH, sheet_name="hubei_in_y_pro_gdp_off").head(5).to_csv(index=False)
-    
-    return sample_template.format(sample1=sample1, sample2=sample2, sample3=sample3, sample4=sample4)
+    return get_data_store(DATA_PATH).sample
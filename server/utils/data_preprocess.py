@@ -1,12 +1,17 @@
 import os
 import json
+import asyncio
 import traceback
-import subprocess
-import tempfile
 from typing import Any
 
 import dspy
 from utils.llm_config import DataPreprocesserSignature
+from utils.data_store import get_data_store, on_data_reload
+from utils.llm_memo import MemoizedModule
+from utils.result_cache import ResultCache, make_cache_key, normalize_text
+from utils.sandbox_pool import SandboxError, get_sandbox_pool, run_once, table_to_records
+from utils.streaming import run_sync
+from utils.telemetry import CACHE_HITS, RETRIES, SANDBOX_FAILURES, span
 from utils.logger import get_logger, log_dict
 
 # 获取该模块的日志器
@@ -15,7 +20,17 @@ logger = get_logger("data_preprocess")
 
 class DataPreprocesser:
     def __init__(self):
-        self.module = dspy.ChainOfThought(DataPreprocesserSignature)
+        self.module = MemoizedModule(
+            dspy.ChainOfThought(DataPreprocesserSignature), "DataPreprocesserSignature"
+        )
+        # 相同处理指令在数据未变化时直接复用结果
+        self.result_cache = ResultCache(
+            "process_with_retry",
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024,
+        )
+        on_data_reload(lambda store: self.result_cache.clear())
 
     def get_code_template(self) -> str:
         """
@@ -28,12 +43,13 @@ class DataPreprocesser:
         return """
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import json
 import traceback
 
 try:
     # Load the data with specified sheet
-    df = pd.read_excel('{data_path}', sheet_name='{sheet_name}')
+    df = {load_data}
     
     # ------ BEGIN GENERATED CODE ------
     # Convert date columns if needed - be careful with datetime operations
@@ -43,14 +59,47 @@ try:
 {generated_code}
     # ------ END GENERATED CODE ------
     
-    # Return the result as JSON
-    result_json = processed_df.to_json(orient='records')
-    print(result_json)
+    # Return the result through the sandbox's binary channel, or as JSON on stdout
+    if 'RESULT_SINK' in globals() and isinstance(processed_df, pd.DataFrame):
+        RESULT_SINK(processed_df)
+    else:
+        result_json = processed_df.to_json(orient='records')
+        print(result_json)
 except Exception as e:
     error_msg = {{'error': f'Code execution error: {{str(e)}}', 'traceback': traceback.format_exc()}}
     print(json.dumps(error_msg))
 """
 
+    def get_data_loader(self, data_path: str, sheet_name: str) -> str:
+        """
+        Returns the expression the generated script uses to load a sheet.
+
+        Sheets that have a columnar cache are converted from the sandbox worker's memory-mapped
+        Arrow table when available, otherwise memory-mapped from the Arrow file; unknown sheets
+        and sheets without a cache fall back to parsing the Excel workbook.
+
+        Args:
+            data_path: Path to the data file
+            sheet_name: Name of the Excel sheet to use
+
+        Returns:
+            Python expression evaluating to the sheet DataFrame
+        """
+        store = get_data_store(data_path)
+        if sheet_name is None:
+            sheet_name = store.sheet_names[0]
+
+        arrow_path = store.columnar_path(sheet_name)
+        if arrow_path:
+            return (
+                f"(PRELOADED_SHEETS[{arrow_path!r}].to_pandas() "
+                f"if {arrow_path!r} in globals().get('PRELOADED_SHEETS', {{}}) "
+                f"else pa.ipc.open_file(pa.memory_map({arrow_path!r}, 'r')).read_all().to_pandas())"
+            )
+
+        logger.warning(f"工作表 {sheet_name} 没有列式缓存，回退到读取Excel")
+        return f"pd.read_excel({data_path!r}, sheet_name={sheet_name!r})"
+
     def generate_code(
         self,
         preprocessing_instructions: str,
@@ -70,7 +119,7 @@ except Exception as e:
         Args:
             preprocessing_instructions: Instructions for data processing
             data_description: Description of the dataset
-            data_sample: Sample of the dataset
+            data_sample: Profile of the dataset
             data_path: Path to the data file
             sheet_name: Name of the Excel sheet to use
             code_template: Optional template where generated code will be inserted
@@ -78,29 +127,43 @@ except Exception as e:
         Returns:
             Complete code with generated parts inserted into template
         """
-        # Use default template if none provided
+        return run_sync(
+            self.agenerate_code(
+                preprocessing_instructions=preprocessing_instructions,
+                data_description=data_description,
+                data_sample=data_sample,
+                data_path=data_path,
+                sheet_name=sheet_name,
+                code_template=code_template,
+                chart_id=chart_id,
+                target_channels=target_channels,
+                previous_code=previous_code,
+                previous_error=previous_error,
+            )
+        )
+
+    async def agenerate_code(
+        self,
+        preprocessing_instructions: str,
+        data_description: str,
+        data_sample: str,
+        data_path: str = None,
+        sheet_name: str = None,
+        code_template: str = None,
+        chart_id: str = None,
+        target_channels: list[dict[str, str]] = None,
+        previous_code: str = None,
+        previous_error: str = None,
+    ) -> dict:
+        """
+        Async variant of generate_code (see generate_code), which runs it
+        """
         if code_template is None:
             code_template = self.get_code_template()
-
-        # 准备生成数据处理代码
-        generate_info = []
-
-        if previous_error:
-            generate_info.append(f"重试生成(前次错误)")
-
-        if chart_id:
-            channel_count = len(target_channels) if target_channels else 0
-            generate_info.append(f"图表ID:{chart_id} 通道数:{channel_count}")
-
-        sheet_name = sheet_name.strip().strip('"') if sheet_name else None
-        sheet_info = sheet_name if sheet_name else "0"
-        logger.info(
-            f"生成数据处理代码 - 工作表:{sheet_info}{' ' + ', '.join(generate_info) if generate_info else ''}"
-        )
+        sheet_name = self._log_generate_info(sheet_name, chart_id, target_channels, previous_error)
 
         try:
-
-            response = self.module(
+            response = await self.module.acall(
                 preprocessing_instructions=preprocessing_instructions,
                 data_description=data_description,
                 data_sample=data_sample,
@@ -110,27 +173,7 @@ except Exception as e:
                 previous_code=previous_code,
                 previous_error=previous_error,
             )
-            # print(response)
-            # if start with ```
-            if response.pandas_code.startswith("```python\n"):
-                response.pandas_code = response.pandas_code[11:]
-            if response.pandas_code.endswith("\n```"):
-                response.pandas_code = response.pandas_code[:-3]
-
-            # Insert the generated code into the template
-            complete_code = code_template.format(
-                generated_code=response.pandas_code,
-                data_path=data_path,
-                sheet_name=(
-                    sheet_name if sheet_name else "0"
-                ),  # Default to first sheet if not specified
-            )
-            # 记录成功生成的代码
-            mapping_count = len(response.channel_mapping) if response.channel_mapping else 0
-            logger.info(f"生成代码成功 - 映射了 {mapping_count} 个通道")
-
-            # Return both the code and the channel mapping
-            return {"code": complete_code, "channel_mapping": response.channel_mapping}
+            return self._assemble_code(response, code_template, data_path, sheet_name)
         except Exception as e:
             logger.error(f"生成数据处理代码失败: {str(e)}")
             traceback.print_exc()
@@ -139,6 +182,57 @@ except Exception as e:
                 "channel_mapping": {},
             }
 
+    def _log_generate_info(
+        self, sheet_name: str, chart_id: str, target_channels: list, previous_error: str
+    ) -> str:
+        """
+        Log what is being generated and return the cleaned sheet name
+        """
+        # 准备生成数据处理代码
+        generate_info = []
+
+        if previous_error:
+            generate_info.append(f"重试生成(前次错误)")
+
+        if chart_id:
+            channel_count = len(target_channels) if target_channels else 0
+            generate_info.append(f"图表ID:{chart_id} 通道数:{channel_count}")
+
+        sheet_name = sheet_name.strip().strip('"') if sheet_name else None
+        sheet_info = sheet_name if sheet_name else "0"
+        logger.info(
+            f"生成数据处理代码 - 工作表:{sheet_info}{' ' + ', '.join(generate_info) if generate_info else ''}"
+        )
+        return sheet_name
+
+    def _assemble_code(
+        self, response: dspy.Prediction, code_template: str, data_path: str, sheet_name: str
+    ) -> dict:
+        """
+        Insert the generated pandas code into the template
+        """
+        # if start with ```
+        if response.pandas_code.startswith("```python\n"):
+            response.pandas_code = response.pandas_code[11:]
+        if response.pandas_code.endswith("\n```"):
+            response.pandas_code = response.pandas_code[:-3]
+
+        # Insert the generated code into the template
+        complete_code = code_template.format(
+            generated_code=response.pandas_code,
+            load_data=self.get_data_loader(data_path, sheet_name),
+            data_path=data_path,
+            sheet_name=(
+                sheet_name if sheet_name else "0"
+            ),  # Default to first sheet if not specified
+        )
+        # 记录成功生成的代码
+        mapping_count = len(response.channel_mapping) if response.channel_mapping else 0
+        logger.info(f"生成代码成功 - 映射了 {mapping_count} 个通道")
+
+        # Return both the code and the channel mapping
+        return {"code": complete_code, "channel_mapping": response.channel_mapping}
+
     def process_with_retry(
         self,
         preprocessing_instructions: str,
@@ -154,10 +248,13 @@ except Exception as e:
         """
         Generate and execute code with automatic retry on failure.
 
+        Successful results are cached by the normalized instructions, sheet, chart, target
+        channels and data version, so repeated analyses skip code generation and execution.
+
         Args:
             preprocessing_instructions: Instructions for data processing
             data_description: Description of the dataset
-            data_sample: Sample of the dataset
+            data_sample: Profile of the dataset
             data_path: Path to the data file
             sheet_name: Name of the Excel sheet to use
             code_template: Optional template where generated code will be inserted
@@ -168,15 +265,8 @@ except Exception as e:
         Returns:
             The processed data or error information
         """
-        previous_code = None
-        previous_error = None
-
-        logger.info(f"数据处理开始 (最大重试次数: {max_attempts})")
-
-        for attempt in range(max_attempts):
-
-            # Generate code (with error feedback if available)
-            code_result = self.generate_code(
+        return run_sync(
+            self.aprocess_with_retry(
                 preprocessing_instructions=preprocessing_instructions,
                 data_description=data_description,
                 data_sample=data_sample,
@@ -185,58 +275,127 @@ except Exception as e:
                 code_template=code_template,
                 chart_id=chart_id,
                 target_channels=target_channels,
-                previous_code=previous_code,
-                previous_error=previous_error,
+                max_attempts=max_attempts,
             )
+        )
+
+    async def aprocess_with_retry(
+        self,
+        preprocessing_instructions: str,
+        data_description: str,
+        data_sample: str,
+        data_path: str,
+        sheet_name: str = None,
+        code_template: str = None,
+        chart_id: str = None,
+        target_channels: list[dict[str, str]] = None,
+        max_attempts: int = 3,
+    ) -> Any:
+        """
+        Async variant of process_with_retry (see process_with_retry), which runs it.
+
+        Code generation awaits the LLM and execution awaits the sandbox pool from a worker
+        thread, so neither blocks the event loop.
+        """
+        cache_key = self._result_cache_key(
+            preprocessing_instructions, data_path, sheet_name, code_template, chart_id, target_channels
+        )
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"命中结果缓存 - {len(cached['data'])} 条记录")
+            CACHE_HITS.inc(cache="result")
+            return dict(cached)
+
+        previous_code = None
+        previous_error = None
+
+        logger.info(f"数据处理开始 (最大重试次数: {max_attempts})")
 
-            logger.debug(f"代码生成结果: {code_result['code']}")
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                RETRIES.inc()
+
+            with span("codegen", attempt=attempt + 1):
+                code_result = await self.agenerate_code(
+                    preprocessing_instructions=preprocessing_instructions,
+                    data_description=data_description,
+                    data_sample=data_sample,
+                    data_path=data_path,
+                    sheet_name=sheet_name,
+                    code_template=code_template,
+                    chart_id=chart_id,
+                    target_channels=target_channels,
+                    previous_code=previous_code,
+                    previous_error=previous_error,
+                )
 
-            # 检查是否生成代码时出错
             if "error" in code_result:
                 logger.error(f"代码生成失败: {code_result['error']}")
                 return code_result
 
             complete_code = code_result["code"]
-            channel_mapping = code_result["channel_mapping"]
-
             logger.info(f"尝试 {attempt + 1}/{max_attempts} - 执行数据处理代码")
+            result = await self.aexecute_code(complete_code)
 
-            # Execute the generated code
-            result = self.execute_code(complete_code)
-
-            # Check if execution was successful
             if isinstance(result, list):
                 logger.info(
                     f"执行成功(尝试 {attempt + 1}/{max_attempts}) - 处理了 {len(result)} 条记录"
                 )
+                processed = {"data": result, "channel_mapping": code_result["channel_mapping"]}
+                self.result_cache.set(cache_key, processed)
+                return dict(processed)
 
-                # Add the channel mapping to the result
-                return {"data": result, "channel_mapping": channel_mapping}
-
-            # If we have an error and still have attempts left
             error_msg = result.get("error", "Unknown error")
 
+            # 生成的代码无法执行，丢弃该次调用的记忆化结果，避免相同请求再次得到同样的代码
+            self.module.forget(
+                preprocessing_instructions=preprocessing_instructions,
+                data_description=data_description,
+                data_sample=data_sample,
+                code_template=code_template or self.get_code_template(),
+                chart_id=chart_id,
+                target_channels=target_channels,
+                previous_code=previous_code,
+                previous_error=previous_error,
+            )
+
             if attempt == max_attempts - 1:
                 logger.error(f"处理失败 - 达到最大重试次数 {max_attempts}, 错误: {error_msg}")
-            else:
-                logger.warning(
-                    f"尝试 {attempt + 1}/{max_attempts} 失败 - 错误: {error_msg}, 准备重试"
-                )
+                return {"error": result.get("error", ""), "traceback": result.get("traceback", "")}
 
+            logger.warning(f"尝试 {attempt + 1}/{max_attempts} 失败 - 错误: {error_msg}, 准备重试")
             previous_code = complete_code
             previous_error = result.get("error", "") + "\n" + result.get("traceback", "")
 
-            # If we've reached max attempts, return the last error
-            if attempt == max_attempts - 1:
-                return {"error": result.get("error", ""), "traceback": result.get("traceback", "")}
-
-        # This should not be reached due to the return in the loop
         return {"error": "Max retry attempts reached"}
 
+    def _result_cache_key(
+        self,
+        preprocessing_instructions: str,
+        data_path: str,
+        sheet_name: str,
+        code_template: str,
+        chart_id: str,
+        target_channels: list,
+    ) -> str:
+        return make_cache_key(
+            normalize_text(preprocessing_instructions),
+            sheet_name.strip().strip('"') if sheet_name else None,
+            chart_id,
+            target_channels,
+            code_template,
+            get_data_store(data_path).version,
+        )
+
     def execute_code(self, code: str) -> Any:
         """
         Execute the generated pandas code in a separate process
 
+        Scripts run on a warm worker from the sandbox pool; when pooling is disabled
+        (SANDBOX_POOL=0) each script is started in a fresh PYTHON_INTERPRETER instead.
+        The result DataFrame comes back as an Arrow table over the worker's binary channel;
+        scripts that print their result as JSON are still supported.
+
         Args:
             code: The complete pandas code (with template) to execute
 
@@ -244,47 +403,53 @@ except Exception as e:
             The result of executing the code
         """
         try:
-            # Format the template with the actual data path
-            full_script = code
-
-            # Create a temporary Python script with the generated code
-            with tempfile.NamedTemporaryFile(suffix=".py", mode="w", delete=False, encoding="utf-8") as temp_file:
-                temp_file.write(full_script)
-                temp_file_path = temp_file.name
-
-            # Run the script in a separate process
-            logger.info(f"子进程执行数据处理脚本: {temp_file_path}")
-            logger.info(f"使用 Python 解释器: {os.getenv('PYTHON_INTERPRETER')}")
-            result = subprocess.run(
-                [os.getenv("PYTHON_INTERPRETER"), temp_file_path],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-
-            # Clean up the temporary file
-            os.unlink(temp_file_path)
-
-            # Parse the output JSON if available
-            if result.stdout:
-                try:
-                    parsed_result = json.loads(result.stdout.strip())
-                    if isinstance(parsed_result, list):
-                        logger.info(f"数据处理成功 - 得到 {len(parsed_result)} 条记录")
-                    else:
-                        logger.info("数据处理成功")
-                    return parsed_result
-                except json.JSONDecodeError as je:
-                    logger.error(f"解析JSON输出失败: {je}")
-                    return {"error": f"Failed to parse JSON output: {je}"}
+            pool = get_sandbox_pool()
+            if pool is not None:
+                output, table = pool.run(code)
             else:
-                logger.warning("脚本没有输出数据")
-                return {"error": "No output from data processing script"}
-
-        except subprocess.CalledProcessError as e:
-            logger.error(f"执行代码失败: {e.stderr}")
-            return {"error": f"Error executing code: {e.stderr}"}
+                output, table = run_once(code, timeout=float(os.getenv("SANDBOX_TIMEOUT", "60")))
+
+            with span("parse"):
+                if table is not None:
+                    records = table_to_records(table)
+                    logger.info(f"数据处理成功 - 得到 {len(records)} 条记录")
+                    return records
+
+                result = self._parse_output(output)
+            if isinstance(result, dict) and "error" in result:
+                SANDBOX_FAILURES.inc(kind="script")
+            return result
+
+        except SandboxError as e:
+            logger.error(f"沙箱工作进程执行失败: {e}")
+            SANDBOX_FAILURES.inc(kind="worker")
+            return {"error": f"Error executing code: {e}"}
         except Exception as e:
             logger.error(f"代码执行过程中出现异常: {str(e)}")
             traceback.print_exc()
             return {"error": f"Error in code execution: {str(e)}"}
+
+    async def aexecute_code(self, code: str) -> Any:
+        """
+        Async variant of execute_code; the blocking sandbox round trip runs in a worker thread
+        """
+        return await asyncio.to_thread(self.execute_code, code)
+
+    def _parse_output(self, output: str) -> Any:
+        """
+        Parse the JSON printed by the template
+        """
+        if output:
+            try:
+                parsed_result = json.loads(output.strip())
+                if isinstance(parsed_result, list):
+                    logger.info(f"数据处理成功 - 得到 {len(parsed_result)} 条记录")
+                else:
+                    logger.info("数据处理成功")
+                return parsed_result
+            except json.JSONDecodeError as je:
+                logger.error(f"解析JSON输出失败: {je}")
+                return {"error": f"Failed to parse JSON output: {je}"}
+        else:
+            logger.warning("脚本没有输出数据")
+            return {"error": "No output from data processing script"}
@@ -0,0 +1,172 @@
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("data_profile")
+
+# 画像缓存目录
+PROFILE_CACHE_DIR = Path(__file__).parent.parent / "cache" / "profiles"
+
+# 不同取值不超过该数量的文本列视为分类列，列出全部取值
+CATEGORICAL_MAX_DISTINCT = 60
+# 非分类文本列列出的示例取值数量
+EXAMPLE_VALUES = 5
+
+
+def _to_python(value: Any) -> Any:
+    """Convert numpy / pandas scalars to JSON-serializable Python values."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _year_range(series: pd.Series) -> Optional[List[int]]:
+    if pd.api.types.is_numeric_dtype(series):
+        years = series
+    else:
+        years = pd.to_datetime(series, errors="coerce").dt.year.dropna()
+    if years.empty:
+        return None
+    return [int(years.min()), int(years.max())]
+
+
+def profile_column(name: str, series: pd.Series) -> Dict[str, Any]:
+    """
+    Profile a single column.
+
+    Returns:
+        Dict with the column name, dtype and null ratio, plus min/max for numeric columns, the
+        year range for the year column and the distinct values of categorical columns
+    """
+    profile = {
+        "name": name,
+        "dtype": str(series.dtype),
+        "null_ratio": round(float(series.isna().mean()), 4) if len(series) else 0.0,
+    }
+    values = series.dropna()
+
+    if name == "year" or pd.api.types.is_datetime64_any_dtype(series):
+        profile["year_range"] = _year_range(values)
+        if not values.empty:
+            profile["example"] = str(_to_python(values.iloc[0]))
+    elif pd.api.types.is_numeric_dtype(series):
+        if not values.empty:
+            profile["min"] = _to_python(values.min())
+            profile["max"] = _to_python(values.max())
+    else:
+        counts = values.astype(str).value_counts()
+        profile["distinct"] = int(len(counts))
+        if len(counts) <= CATEGORICAL_MAX_DISTINCT:
+            profile["values"] = counts.index.tolist()
+        else:
+            profile["examples"] = counts.index[:EXAMPLE_VALUES].tolist()
+
+    return profile
+
+
+def profile_sheets(sheets: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """
+    Profile every sheet of the workbook.
+
+    Returns:
+        Mapping of sheet name to {"rows": n, "columns": [column profiles]}
+    """
+    return {
+        name: {
+            "rows": int(len(df)),
+            "columns": [profile_column(str(column), df[column]) for column in df.columns],
+        }
+        for name, df in sheets.items()
+    }
+
+
+def load_or_build_profile(
+    sheets: Dict[str, pd.DataFrame], version: str, cache_dir: Path = PROFILE_CACHE_DIR
+) -> Dict[str, Any]:
+    """
+    Return the dataset profile for a workbook version, computing it only if it is not cached.
+
+    Args:
+        sheets: Mapping of sheet name to DataFrame
+        version: Content hash of the source workbook
+        cache_dir: Directory for the cached profiles
+
+    Returns:
+        The profile produced by profile_sheets
+    """
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"profile-{version}.json"
+
+    if path.exists():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            if set(profile) == set(sheets):
+                logger.info(f"使用缓存的数据画像: {path.name}")
+                return profile
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取数据画像缓存失败，将重新生成: {e}")
+
+    logger.info("生成数据画像")
+    profile = profile_sheets(sheets)
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+        # 清理旧版本的画像
+        for stale in cache_dir.glob("profile-*.json"):
+            if stale != path:
+                stale.unlink()
+    except OSError as e:
+        logger.warning(f"保存数据画像缓存失败: {e}")
+
+    return profile
+
+
+def _format_number(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    """
+    Render the dataset profile as compact text for the LLM prompts.
+    """
+    lines = []
+    for sheet_name, sheet in profile.items():
+        lines.append(f"sheet:{sheet_name} ({sheet['rows']} rows)")
+        for column in sheet["columns"]:
+            parts = [column["dtype"]]
+            if column.get("year_range"):
+                start, end = column["year_range"]
+                parts.append(f"years {start}-{end} (e.g. {column.get('example')})")
+            if "min" in column:
+                parts.append(
+                    f"min {_format_number(column['min'])}, max {_format_number(column['max'])}"
+                )
+            if "values" in column:
+                parts.append(f"{column['distinct']} values: " + ", ".join(column["values"]))
+            elif "examples" in column:
+                parts.append(
+                    f"{column['distinct']} distinct, e.g. " + ", ".join(column["examples"])
+                )
+            if column["null_ratio"]:
+                parts.append(f"nulls {column['null_ratio']:.1%}")
+            lines.append(f"- {column['name']}: " + "; ".join(parts))
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,177 @@
+import os
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from utils.data_init import DATA_PATH, SHEET_NAMES
+from utils.columnar_cache import materialize_sheets
+from utils.data_profile import format_profile, load_or_build_profile
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("data_store")
+
+
+class DatasetStore:
+    """
+    Process-wide, in-memory copy of the energy workbook.
+
+    The workbook is parsed once and every sheet is kept resident as a DataFrame, together with
+    a profile of its columns (cached per version) that serves as the prompt sample. The file is
+    only re-read when its modification time or size changes, so queries and reports never pay
+    the openpyxl parsing cost themselves.
+    Each sheet is also published as a memory-mappable Arrow file for the generated scripts,
+    which run in separate interpreters and cannot share the resident frames.
+    """
+
+    def __init__(self, data_path: str = DATA_PATH, sheet_names: List[str] = None):
+        self.data_path = data_path
+        self.sheet_names = list(sheet_names or SHEET_NAMES)
+        self._lock = threading.RLock()
+        self._sheets: Dict[str, pd.DataFrame] = {}
+        self._profile: Dict = {}
+        self._sample = ""
+        self._columnar_paths: Dict[str, str] = {}
+        self._version: Optional[str] = None
+        self._file_signature = None
+
+    def _stat_signature(self):
+        stat = os.stat(self.data_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> None:
+        """
+        Parse the workbook and replace the resident sheets, sample and version.
+        """
+        with self._lock:
+            logger.info(f"加载数据集: {self.data_path}")
+            file_signature = self._stat_signature()
+
+            with open(self.data_path, "rb") as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:16]
+
+            # 一次打开工作簿，解析全部工作表
+            sheets = pd.read_excel(self.data_path, sheet_name=self.sheet_names)
+
+            # 为子进程执行的生成代码准备列式缓存
+            columnar_paths = materialize_sheets(sheets, version)
+
+            # 数据画像按版本缓存，数据未变化时直接读取
+            profile = load_or_build_profile(sheets, version)
+
+            previous_version = self._version
+            self._sheets = sheets
+            self._profile = profile
+            self._sample = format_profile(profile)
+            self._columnar_paths = columnar_paths
+            self._version = version
+            self._file_signature = file_signature
+
+            row_counts = ", ".join(f"{name}:{len(df)}" for name, df in sheets.items())
+            logger.info(f"数据集加载完成 - 版本: {version}, 行数: {row_counts}")
+
+        if previous_version is not None and previous_version != version:
+            _notify_reload(self)
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Reload the workbook if the file on disk changed since the last load.
+
+        Returns:
+            True if the data was (re)loaded, False if the resident copy is still current
+        """
+        with self._lock:
+            if self._version is not None and self._stat_signature() == self._file_signature:
+                return False
+            self.load()
+            return True
+
+    def _ensure_loaded(self) -> None:
+        if self._version is None:
+            self.refresh_if_changed()
+
+    @property
+    def version(self) -> str:
+        """Content hash of the workbook currently held in memory."""
+        self._ensure_loaded()
+        return self._version
+
+    @property
+    def profile(self) -> Dict:
+        """Per-sheet column profile (dtype, null ratio, ranges, categorical values)."""
+        self._ensure_loaded()
+        return self._profile
+
+    @property
+    def sample(self) -> str:
+        """Compact profile text used as the data sample in the LLM prompts."""
+        self._ensure_loaded()
+        return self._sample
+
+    def get_sheet(self, sheet_name: str) -> pd.DataFrame:
+        """
+        Return the resident DataFrame of a sheet.
+
+        The frame is shared by every caller; copy it before modifying it in place.
+        """
+        self._ensure_loaded()
+        return self._sheets[sheet_name]
+
+    def columnar_path(self, sheet_name: str) -> Optional[str]:
+        """
+        Return the Arrow file published for a sheet of the current version.
+
+        Returns None for unknown sheets or sheets that could not be converted.
+        """
+        self._ensure_loaded()
+        return self._columnar_paths.get(sheet_name)
+
+    def get_sheets(self) -> List[pd.DataFrame]:
+        """Return the resident DataFrames of all sheets, in SHEET_NAMES order."""
+        self._ensure_loaded()
+        sheets = self._sheets
+        return [sheets[name] for name in self.sheet_names]
+
+
+_stores: Dict[str, DatasetStore] = {}
+_stores_lock = threading.Lock()
+_reload_listeners: List[Callable[[DatasetStore], None]] = []
+
+
+def on_data_reload(callback: Callable[[DatasetStore], None]) -> None:
+    """
+    Register a callback invoked whenever a store reloads a changed workbook.
+
+    Used by the caches to drop results computed from the previous data.
+    """
+    _reload_listeners.append(callback)
+
+
+def _notify_reload(store: DatasetStore) -> None:
+    logger.info(f"数据集已更新，通知 {len(_reload_listeners)} 个监听者")
+    for callback in list(_reload_listeners):
+        try:
+            callback(store)
+        except Exception as e:
+            logger.error(f"数据更新回调执行失败: {e}")
+
+
+def get_data_store(data_path: str = DATA_PATH) -> DatasetStore:
+    """
+    Get the process-wide dataset store for a workbook, creating it on first use.
+
+    Args:
+        data_path: Path to the Excel workbook
+
+    Returns:
+        The shared DatasetStore for that path
+    """
+    key = os.path.abspath(data_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = DatasetStore(data_path)
+            _stores[key] = store
+    return store
@@ -1,10 +1,20 @@
+import asyncio
 import traceback
 import json
 from typing import Dict, Any
 
 from utils.query_analysis import QueryAnalysis
 from utils.data_preprocess import DataPreprocesser
+from utils.fused_query import get_fused_query
 from utils.llm_config import load_chart_configs, DataResponseSignature
+from utils.data_store import get_data_store, on_data_reload
+from utils.llm_memo import MemoizedModule
+from utils.report_cache import get_report_cache
+from utils.image_store import inline_images_default, keep_images
+from utils.report_workspace import get_report_workspaces
+from utils.result_cache import ResultCache, make_cache_key, normalize_text
+from utils.streaming import FieldStreamExtractor, run_sync
+from utils.telemetry import CACHE_HITS, record_span, request_trace, set_query_type, span
 import dspy
 from utils.logger import get_logger, log_dict
 import logging
@@ -13,12 +23,15 @@ import os
 import time
 import pandas as pd
 from pathlib import Path
-from typing import Dict, Any, List
-from report.stat_func import get_docx_placeholder_replacement_values, replace_markdown_placeholders
+from typing import Dict, Any, List, AsyncIterator
+from report.stat_func import DEFAULT_PATHS
 
 # 获取该模块的日志器
 logger = get_logger("entry_point")
 
+# 可以缓存整条响应的查询类型
+CACHEABLE_QUERY_TYPES = ("value", "visualization", "replace")
+
 
 class EntryPoint:
     """
@@ -30,13 +43,30 @@ class EntryPoint:
         logger.info("初始化 EntryPoint 组件")
         self.query_analyzer = QueryAnalysis()
         self.data_preprocesser = DataPreprocesser()
-        self.response_generator = dspy.ChainOfThought(DataResponseSignature)
+        self.response_generator = MemoizedModule(
+            dspy.ChainOfThought(DataResponseSignature), "DataResponseSignature"
+        )
+
+        # 相同问题在相同上下文和数据下直接返回缓存的响应
+        self.response_cache = ResultCache(
+            "process_query",
+            max_entries=int(os.getenv("QUERY_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+            max_bytes=int(os.getenv("QUERY_CACHE_MAX_MB", "64")) * 1024 * 1024,
+        )
+        self.history_window = int(os.getenv("QUERY_CACHE_HISTORY", "4"))
+        on_data_reload(lambda store: self.response_cache.clear())
 
         logger.info("加载图表配置")
         self.chart_configs = load_chart_configs()
         logger.debug(f"加载了 {len(self.chart_configs)} 个图表配置")
         log_dict(logger, "图表配置", self.chart_configs)
 
+        # 可选的单次调用快速路径 (FUSED_QUERY=1)
+        self.fused_query = get_fused_query(
+            self.query_analyzer, self.data_preprocesser, self.chart_configs
+        )
+
     def process_query(
         self,
         query: str,
@@ -46,170 +76,347 @@ class EntryPoint:
         code_template: str = None,
         vast_system_state: List[Dict[str, Any]] = None,
         message_history: List[Dict[str, Any]] = None,
+        force_regenerate: bool = False,
     ) -> Dict[str, Any]:
         """
         Process a user query by analyzing if it's a value query or visualization query,
         and processing data accordingly
 
+        Value, visualization and replace results are cached by the normalized query, the
+        frontend state, the recent message history and the data version. A hit skips query
+        analysis, data processing and response generation; the result's "cache" field says
+        whether it was served from the cache ("hit") or computed ("miss").
+
         Args:
             query: User's query about data or visualization
             data_path: Path to the dataset file
             data_description: Description of the dataset
-            data_sample: Sample of the dataset (first few rows)
+            data_sample: Profile of the dataset (column types, ranges and categories)
             code_template: Optional template for code generation
             vast_system_state: The current state of the VAST visualization system
             message_history: Previous conversation messages
+            force_regenerate: Rebuild a requested report even if it is cached
 
         Returns:
             Dict containing processed data and appropriate metadata based on query type
         """
-        try:
-            # 分析查询
-            logger.info(
-                f"处理查询: '{query[:50]}...'" if len(query) > 50 else f"处理查询: '{query}'"
+        # 同步入口在后台事件循环上运行异步流程，两种服务模式共用同一实现
+        return run_sync(
+            self.aprocess_query(
+                query=query,
+                data_path=data_path,
+                data_description=data_description,
+                data_sample=data_sample,
+                code_template=code_template,
+                vast_system_state=vast_system_state,
+                message_history=message_history,
+                force_regenerate=force_regenerate,
             )
+        )
+
+    async def aprocess_query(
+        self,
+        query: str,
+        data_path: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str = None,
+        vast_system_state: List[Dict[str, Any]] = None,
+        message_history: List[Dict[str, Any]] = None,
+        force_regenerate: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of process_query for the ASGI server (see process_query).
 
-            analysis_result = self.query_analyzer.analyze(
-                query,
-                data_description,
-                data_sample,
-                self.chart_configs,
+        This is the only implementation of the pipeline; process_query runs it on the
+        background event loop. LLM calls are awaited on DSPy's bounded worker pool and sandbox
+        runs and report generation are awaited from worker threads, so a request waiting on
+        the model does not hold a server thread.
+        """
+        with request_trace("查询") as trace:
+            cache_key = self._response_cache_key(
+                query, data_path, code_template, vast_system_state, message_history
+            )
+            cached = self._cached_response(cache_key, query)
+            if cached is not None:
+                return cached
+
+            result = await self._aprocess_query(
+                query=query,
+                data_path=data_path,
+                data_description=data_description,
+                data_sample=data_sample,
+                code_template=code_template,
                 vast_system_state=vast_system_state,
                 message_history=message_history,
+                force_regenerate=force_regenerate,
             )
+            return self._store_response(cache_key, result, trace)
+
+    def _cached_response(self, cache_key: str, query: str) -> Dict[str, Any]:
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info(f"命中查询缓存: '{query[:50]}'")
+        CACHE_HITS.inc(cache="query")
+        set_query_type(cached.get("query_type"))
+        return dict(cached, cache="hit")
+
+    def _store_response(
+        self, cache_key: str, result: Dict[str, Any], trace=None
+    ) -> Dict[str, Any]:
+        if not result or "error" in result:
+            if trace is not None:
+                trace.status = "error"
+            return result
+        if result.get("query_type") in CACHEABLE_QUERY_TYPES:
+            self.response_cache.set(cache_key, result)
+        return dict(result, cache="miss")
+
+    def _response_cache_key(
+        self,
+        query: str,
+        data_path: str,
+        code_template: str,
+        vast_system_state: List[Dict[str, Any]],
+        message_history: List[Dict[str, Any]],
+    ) -> str:
+        history = (message_history or [])[-self.history_window :] if self.history_window else []
+        return make_cache_key(
+            normalize_text(query),
+            make_cache_key(vast_system_state or []),
+            history,
+            code_template,
+            get_data_store(data_path).version,
+        )
+
+    async def astream_query(
+        self,
+        query: str,
+        data_path: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str = None,
+        vast_system_state: List[Dict[str, Any]] = None,
+        message_history: List[Dict[str, Any]] = None,
+        force_regenerate: bool = False,
+    ) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of process_query: yields (event, payload) pairs as the stages finish.
+
+        Events, in order:
+            - "analysis": query_type, sheet_name and, for charts, chart_id and chart_title
+            - "data": the processed data and channel_mapping
+            - "token": {"text": ...} pieces of the natural-language response (value queries)
+            - "result": the same dict process_query would return; always the last event
+
+        A response cache hit yields only the "result" event.
+        """
+        with request_trace("流式查询") as trace:
+            cache_key = self._response_cache_key(
+                query, data_path, code_template, vast_system_state, message_history
+            )
+            cached = self._cached_response(cache_key, query)
+            if cached is not None:
+                yield "result", cached
+                return
+
+            async for event, payload in self._aquery_events(
+                query=query,
+                data_path=data_path,
+                data_description=data_description,
+                data_sample=data_sample,
+                code_template=code_template,
+                vast_system_state=vast_system_state,
+                message_history=message_history,
+                force_regenerate=force_regenerate,
+                stream_response=True,
+            ):
+                if event == "result":
+                    payload = self._store_response(cache_key, payload, trace)
+                yield event, payload
+
+    async def _aprocess_query(self, **kwargs) -> Dict[str, Any]:
+        """
+        Run the full query pipeline without the response cache (the event pipeline without
+        token streaming)
+        """
+        async for event, payload in self._aquery_events(**kwargs):
+            if event == "result":
+                return payload
+
+    async def _aquery_events(
+        self,
+        query: str,
+        data_path: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str = None,
+        vast_system_state: List[Dict[str, Any]] = None,
+        message_history: List[Dict[str, Any]] = None,
+        force_regenerate: bool = False,
+        stream_response: bool = False,
+    ) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+        """
+        Async query pipeline as a sequence of stage events (see astream_query)
+        """
+        try:
+            logger.info(
+                f"处理查询: '{query[:50]}...'" if len(query) > 50 else f"处理查询: '{query}'"
+            )
+
+            fused = None
+            if self.fused_query is not None:
+                with span("fused_query"):
+                    fused = await self.fused_query.arun(
+                        query,
+                        data_path,
+                        data_description,
+                        data_sample,
+                        code_template=code_template,
+                        vast_system_state=vast_system_state,
+                        message_history=message_history,
+                    )
+
+            if fused is not None:
+                analysis_result = fused["analysis"]
+            else:
+                with span("query_analysis"):
+                    analysis_result = await self.query_analyzer.aanalyze(
+                        query,
+                        data_description,
+                        data_sample,
+                        self.chart_configs,
+                        vast_system_state=vast_system_state,
+                        message_history=message_history,
+                    )
 
             logger.info(f"查询分析结果: {analysis_result}")
 
-            # 检查错误
             if "error" in analysis_result:
                 logger.error(f"查询分析失败: {analysis_result['error']}")
-                return analysis_result
+                yield "result", analysis_result
+                return
 
-            # 获取查询类型
-            query_type = analysis_result.get("query_type", "visualization")  # 默认为可视化
+            query_type = analysis_result.get("query_type", "visualization")
+            set_query_type(query_type)
             sheet_name = analysis_result.get("sheet_name")
             existing_visualization_id = analysis_result.get("existing_visualization_id", "")
             logger.info(f"查询类型: {query_type}, 使用工作表: {sheet_name}")
-            if existing_visualization_id:
-                logger.info(f"将替换前端可视化ID: {existing_visualization_id}")
 
-            # 处理数值查询
             if query_type == "value":
-                logger.info("处理数值查询 - 生成数据处理代码")
-
-                processed_res = self.data_preprocesser.process_with_retry(
-                    preprocessing_instructions=analysis_result["preprocessing_instructions"],
-                    data_description=data_description,
-                    data_sample=data_sample,
-                    data_path=data_path,
-                    sheet_name=sheet_name,
-                    code_template=code_template,
-                    chart_id=None,  # 数值查询不需要图表
-                    target_channels=[],  # 数值查询不需要通道
-                    max_attempts=3,
-                )
+                yield "analysis", {"query_type": query_type, "sheet_name": sheet_name}
+
+                processed_res = await asyncio.to_thread(self._run_fused_code, fused)
+                if processed_res is None:
+                    processed_res = await self.data_preprocesser.aprocess_with_retry(
+                        preprocessing_instructions=analysis_result["preprocessing_instructions"],
+                        data_description=data_description,
+                        data_sample=data_sample,
+                        data_path=data_path,
+                        sheet_name=sheet_name,
+                        code_template=code_template,
+                        chart_id=None,
+                        target_channels=[],
+                        max_attempts=3,
+                    )
 
-                # 检查处理结果
                 if "error" in processed_res:
                     logger.error(f"数据处理失败: {processed_res.get('error')}")
-                    # 生成自然语言回答
-                response_result = self.generate_response(
-                    query=query,
-                    processed_results=processed_res["data"],
-                )
+                yield "data", {"data": processed_res["data"], "channel_mapping": {}}
+
+                if stream_response:
+                    response = ""
+                    async for piece in self.astream_response(
+                        query=query, processed_results=processed_res["data"]
+                    ):
+                        if isinstance(piece, str):
+                            yield "token", {"text": piece}
+                        else:
+                            response = piece.get("response", "")
+                else:
+                    response_result = await self.agenerate_response(
+                        query=query,
+                        processed_results=processed_res["data"],
+                    )
+                    response = response_result.get("response", "")
 
-                # 准备返回结果
-                result = {
+                logger.info(f"数值查询完成 - 处理了 {len(processed_res['data'])} 条数据")
+                yield "result", {
                     "query_type": "value",
                     "data": processed_res["data"],
-                    "response": response_result.get("response", ""),
+                    "response": response,
                 }
 
-                logger.info(f"数值查询完成 - 处理了 {len(processed_res['data'])} 条数据")
-                return result
-
-            elif query_type == "visualization" or query_type == "replace":  # 处理可视化查询
-                chart_id = analysis_result.get("chart_id")
-                chart_title = analysis_result.get("chart_title", "")
-
-                chart_id = chart_id.strip().strip('"')
-                chart_title = chart_title.strip().strip('"')
-
-                target_chart = next(
-                    (config for config in self.chart_configs if config["id"] == chart_id), None
-                )
-
-                if target_chart:
-                    target_channels = target_chart["channels"]
-                    channel_names = [c["name"] for c in target_channels]
-                    logger.info(
-                        f"处理可视化查询 - 图表: {chart_id}, 需要通道: {', '.join(channel_names)}"
+            elif query_type == "visualization" or query_type == "replace":
+                chart_id, chart_title, target_channels = self._resolve_chart(analysis_result)
+                analysis_event = {
+                    "query_type": query_type,
+                    "sheet_name": sheet_name,
+                    "chart_id": chart_id,
+                    "chart_title": chart_title,
+                }
+                if query_type == "replace" and existing_visualization_id:
+                    analysis_event["existing_visualization_id"] = existing_visualization_id
+                yield "analysis", analysis_event
+
+                processed_res = await asyncio.to_thread(self._run_fused_code, fused)
+                if processed_res is None:
+                    processed_res = await self.data_preprocesser.aprocess_with_retry(
+                        preprocessing_instructions=analysis_result["preprocessing_instructions"],
+                        data_description=data_description,
+                        data_sample=data_sample,
+                        data_path=data_path,
+                        sheet_name=sheet_name,
+                        code_template=code_template,
+                        chart_id=chart_id,
+                        target_channels=target_channels,
+                        max_attempts=3,
                     )
-                else:
-                    logger.warning(f"处理可视化查询 - 未找到匹配图表: {chart_id}")
-                    target_channels = []
-
-                # 生成和执行数据处理代码
-                processed_res = self.data_preprocesser.process_with_retry(
-                    preprocessing_instructions=analysis_result["preprocessing_instructions"],
-                    data_description=data_description,
-                    data_sample=data_sample,
-                    data_path=data_path,
-                    sheet_name=sheet_name,
-                    code_template=code_template,
-                    chart_id=chart_id,
-                    target_channels=target_channels,
-                    max_attempts=3,
-                )
 
-                # 检查处理结果
                 if "error" in processed_res:
                     logger.error(f"数据处理失败: {processed_res.get('error')}")
-                    return processed_res
+                    yield "result", processed_res
+                    return
 
-                # 准备返回结果
                 channel_mapping = processed_res.get("channel_mapping", {})
-                result = {
-                    "query_type": query_type,
-                    "data": processed_res["data"],
-                    "chart_id": chart_id,
-                    "chart_title": chart_title,
-                    "channel_mapping": channel_mapping,
-                }
+                yield "data", {"data": processed_res["data"], "channel_mapping": channel_mapping}
 
-                # 如果是替换请求，添加替换ID
-                if query_type == "replace" and existing_visualization_id:
-                    result["existing_visualization_id"] = existing_visualization_id
+                result = dict(
+                    analysis_event, data=processed_res["data"], channel_mapping=channel_mapping
+                )
+                result.pop("sheet_name")
 
                 data_count = len(processed_res["data"])
                 logger.info(f"可视化查询完成 - 图表: {chart_id}, 处理了 {data_count} 条数据")
-                return result
+                yield "result", result
 
-            elif query_type == "report":  # 处理报告生成
-                # 获取报告参数
+            elif query_type == "report":
                 province = analysis_result.get("province", "湖北")
                 year = analysis_result.get("year", "2022")
 
-                # 确保年份是整数
                 try:
-                    print("year:", year)
-                    if year.startswith('"') and year.endswith('"'):
-                        year = year[1:-1]
-                    year = int(year)
+                    year = self._parse_year(year)
                 except ValueError:
                     logger.error(f"无效的年份格式: {year}")
-                    return {"error": f"无效的年份格式: {year}"}
+                    yield "result", {"error": f"无效的年份格式: {year}"}
+                    return
 
-                # 生成报告
-                report_path, markdown_content = self.generate_report(data_path, province, year)
+                yield "analysis", {"query_type": query_type, "province": province, "year": str(year)}
+
+                # 报告生成是CPU密集的同步流程，放到工作线程中执行
+                report = await asyncio.to_thread(
+                    self.generate_report, data_path, province, year, force_regenerate
+                )
+                report_path, markdown_content = report if report else (None, None)
 
-                # 检查报告生成结果
                 if not report_path or not os.path.exists(report_path):
                     logger.error("报告生成失败")
-                    return {"error": "报告生成失败"}
+                    yield "result", {"error": "报告生成失败"}
+                    return
 
-                # 准备返回结果
-                result = {
+                logger.info(f"报告生成完成: {report_path}")
+                yield "result", {
                     "query_type": "report",
                     "report_path": report_path,
                     "province": province,
@@ -217,45 +424,144 @@ class EntryPoint:
                     "markdown_content": markdown_content,
                 }
 
-                logger.info(f"报告生成完成: {report_path}")
-                return result
+            else:
+                yield "result", None
 
         except Exception as e:
-            import traceback
-
             error_msg = str(e)
             logger.error(f"处理查询时出现异常: {error_msg}")
             logger.debug(traceback.format_exc())
-            return {"error": f"Error processing query: {error_msg}"}
+            yield "result", {"error": f"Error processing query: {error_msg}"}
 
-    def generate_report(self, data_path: str, province: str, year: int) -> tuple[str, str]:
+    def _run_fused_code(self, fused: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute the code produced by the fused fast path.
+
+        Returns:
+            {"data", "channel_mapping"} on success, or None so that the caller regenerates the
+            code with the two-stage flow
+        """
+        if not fused or not fused.get("code"):
+            return None
+
+        result = self.data_preprocesser.execute_code(fused["code"])
+        if isinstance(result, list):
+            logger.info(f"融合查询执行成功 - 处理了 {len(result)} 条记录")
+            return {"data": result, "channel_mapping": fused["channel_mapping"]}
+
+        logger.warning(f"融合查询代码执行失败，回退到两阶段代码生成: {result.get('error')}")
+        self.fused_query.forget(fused)
+        return None
+
+    def _resolve_chart(self, analysis_result: Dict[str, Any]) -> tuple[str, str, list]:
+        """
+        Clean the chart id and title chosen by the analysis and look up the chart's channels
+        """
+        chart_id = analysis_result.get("chart_id")
+        chart_title = analysis_result.get("chart_title", "")
+
+        chart_id = chart_id.strip().strip('"')
+        chart_title = chart_title.strip().strip('"')
+
+        target_chart = next(
+            (config for config in self.chart_configs if config["id"] == chart_id), None
+        )
+
+        if target_chart:
+            target_channels = target_chart["channels"]
+            channel_names = [c["name"] for c in target_channels]
+            logger.info(
+                f"处理可视化查询 - 图表: {chart_id}, 需要通道: {', '.join(channel_names)}"
+            )
+        else:
+            logger.warning(f"处理可视化查询 - 未找到匹配图表: {chart_id}")
+            target_channels = []
+
+        return chart_id, chart_title, target_channels
+
+    @staticmethod
+    def _parse_year(year: str) -> int:
+        """Parse the report year returned by the analysis, raising ValueError if invalid."""
+        if year.startswith('"') and year.endswith('"'):
+            year = year[1:-1]
+        return int(year)
+
+    def generate_report(
+        self,
+        data_path: str,
+        province: str,
+        year: int,
+        force_regenerate: bool = False,
+        inline_images: bool = None,
+    ) -> tuple[str, str]:
+        """
+        Generate the energy consumption report of a province and year.
+
+        Reports are cached by province, year, template and data version; a repeated request is
+        served from the cache unless force_regenerate is set. Images are referenced by URL unless
+        inline_images (default REPORT_INLINE_IMAGES) embeds them for offline export.
+
+        Returns:
+            (report path, markdown content), or None on failure
+        """
         try:
             # 记录开始时间
             start_time = time.time()
             logger.info(f"开始生成{province}{year}年能源消费报告...")
 
-            # 加载数据
+            # 加载数据（使用常驻内存的数据集，不再重复读取Excel）
             logger.info(f"从{data_path}加载数据")
-            base_path = Path(data_path).parent if os.path.isfile(data_path) else Path(data_path)
-            data_file = base_path / "湖北_外部能耗数据.xlsx"
-
-            if not os.path.exists(data_file):
-                logger.error(f"数据文件不存在: {data_file}")
+            data_file = self._report_data_file(data_path)
+            if data_file is None:
                 return None
 
-            # 加载各个数据表
-            df1 = pd.read_excel(data_file, sheet_name="hubei_in_y_pro_ind_ene_off")
-            df2 = pd.read_excel(data_file, sheet_name="hubei_in_y_pro_ind_ene2_off")
-            df3 = pd.read_excel(data_file, sheet_name="hubei_in_y_pro_ind_prd_off")
-            df4 = pd.read_excel(data_file, sheet_name="hubei_in_y_pro_gdp_off")
-
-            # 获取报告替换值
-            replacement_values = get_docx_placeholder_replacement_values(
-                [df1, df2, df3, df4], year=year, province=province
-            )
-
-            # 生成报告
-            output_path, markdown_content = replace_markdown_placeholders(replacement_values)
+            store = get_data_store(str(data_file))
+            report_cache = get_report_cache()
+            if inline_images is None:
+                inline_images = inline_images_default()
+            cache_key = None
+            if report_cache is not None:
+                cache_key = report_cache.make_key(
+                    province, year, DEFAULT_PATHS["template"], store.version, inline_images
+                )
+                cached = None if force_regenerate else report_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"命中报告缓存: {province}{year}年")
+                    CACHE_HITS.inc(cache="report")
+                    if not inline_images:
+                        keep_images(cached["values"].get("image_paths", []))
+                    return cached["markdown_path"], cached["markdown"]
+
+            # 每个请求使用独立的工作目录，并发生成的报告互不覆盖
+            with get_report_workspaces().create(cache_key or f"{province}_{year}") as workspace:
+                # 按依赖图调度各阶段：图表渲染与 LLM 生成总结、摘要并行进行
+                # （report.pipeline 依赖 utils 包，延迟导入以避免循环导入）
+                from report.pipeline import build_report
+
+                build = build_report(
+                    store,
+                    year=year,
+                    province=province,
+                    images_dir=workspace.images_dir,
+                    output_path=workspace.output_path,
+                    inline_images=inline_images,
+                )
+                output_path = build["output_path"]
+                markdown_content = build["markdown"]
+                replacement_values = build["replacement_values"]
+
+                # 发布报告：写入报告缓存，缓存不可用时发布工作目录本身（均为原子替换）
+                published = False
+                if report_cache is not None:
+                    try:
+                        output_path = report_cache.put(
+                            cache_key, markdown_content, replacement_values
+                        )
+                        published = True
+                    except Exception as e:
+                        logger.warning(f"缓存报告失败: {e}")
+                if not published:
+                    output_path = workspace.publish()
 
             # 记录完成时间
             generation_time = time.time() - start_time
@@ -270,6 +576,46 @@ class EntryPoint:
             logger.debug(traceback.format_exc())
             return None
 
+    def generate_reports(
+        self,
+        data_path: str,
+        items: List[tuple],
+        force_regenerate: bool = False,
+        progress=None,
+        **options,
+    ) -> Dict[str, Any]:
+        """
+        Generate the reports of many (province, year) pairs in one batch.
+
+        Data, aggregates and metrics are shared across the batch; see report.batch.generate_reports
+        for the options (output_dir, chart_workers, llm_workers) and the progress callback.
+
+        Returns:
+            Batch summary with one result per item, or None if the data file does not exist
+        """
+        # report.batch 依赖 utils 包，延迟导入以避免循环导入
+        from report.batch import generate_reports
+
+        data_file = self._report_data_file(data_path)
+        if data_file is None:
+            return None
+        return generate_reports(
+            items,
+            data_file=str(data_file),
+            force_regenerate=force_regenerate,
+            progress=progress,
+            **options,
+        )
+
+    @staticmethod
+    def _report_data_file(data_path: str) -> Path:
+        base_path = Path(data_path).parent if os.path.isfile(data_path) else Path(data_path)
+        data_file = base_path / "湖北_外部能耗数据.xlsx"
+        if not os.path.exists(data_file):
+            logger.error(f"数据文件不存在: {data_file}")
+            return None
+        return data_file
+
     def generate_response(
         self, query: str, processed_results: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
@@ -285,6 +631,14 @@ class EntryPoint:
         Returns:
             Dict containing the natural language response and key insights
         """
+        return run_sync(self.agenerate_response(query=query, processed_results=processed_results))
+
+    async def agenerate_response(
+        self, query: str, processed_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Async variant of generate_response for the ASGI server (see generate_response)
+        """
         try:
             logger.info("生成数据自然语言响应")
 
@@ -292,16 +646,56 @@ class EntryPoint:
             sample_results = (
                 processed_results[:30] if len(processed_results) > 30 else processed_results
             )
+            with span("response"):
+                return await self.response_generator.acall(
+                    query=query,
+                    processed_results=sample_results,
+                )
+        except Exception as e:
+            logger.error(f"生成自然语言响应失败: {str(e)}")
+            traceback.print_exc()
+            return {
+                "response": f"根据您的查询，我们处理了数据，但无法生成详细响应。",
+            }
 
-            response = self.response_generator(
+    async def astream_response(
+        self, query: str, processed_results: List[Dict[str, Any]]
+    ) -> AsyncIterator[Any]:
+        """
+        Streaming variant of generate_response.
+
+        Yields the text of the response field as the LM produces it, then the final response
+        dict. When nothing could be streamed (memo or LM cache hit, or a completion that did
+        not follow the chat format) the whole response is yielded as a single piece.
+        """
+        try:
+            logger.info("生成数据自然语言响应(流式)")
+
+            sample_results = (
+                processed_results[:30] if len(processed_results) > 30 else processed_results
+            )
+            extractor = FieldStreamExtractor("response")
+            streamed = False
+            start = time.perf_counter()
+            async for value in self.response_generator.astream(
                 query=query,
                 processed_results=sample_results,
-            )
-
-            return response
+            ):
+                if isinstance(value, str):
+                    piece = extractor.feed(value)
+                    if piece:
+                        streamed = True
+                        yield piece
+                    continue
+
+                # 直到完整响应到达的耗时
+                record_span("response", time.perf_counter() - start, start)
+                if not streamed and value.get("response"):
+                    yield value.get("response")
+                yield value
         except Exception as e:
             logger.error(f"生成自然语言响应失败: {str(e)}")
             traceback.print_exc()
-            return {
+            yield {
                 "response": f"根据您的查询，我们处理了数据，但无法生成详细响应。",
             }
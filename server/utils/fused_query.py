@@ -0,0 +1,185 @@
+import os
+import traceback
+from typing import Any, Dict, List, Optional
+
+import dspy
+from utils.llm_config import FusedQuerySignature
+from utils.data_store import get_data_store
+from utils.llm_memo import MemoizedModule
+from utils.streaming import run_sync
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("fused_query")
+
+VALID_QUERY_TYPES = ("value", "visualization", "replace", "report")
+
+
+class FusedQuery:
+    """
+    Single-call fast path: query analysis and code generation in one LLM round trip.
+
+    run() returns the same analysis dict as QueryAnalysis.analyze plus the assembled code and
+    channel mapping. When the prediction does not validate (unknown query type, sheet or chart,
+    missing channels, code that does not compile) it returns None and the caller falls back to
+    the two-stage flow.
+    """
+
+    def __init__(self, query_analyzer, data_preprocesser, chart_configs: List[Dict[str, Any]]):
+        self.query_analyzer = query_analyzer
+        self.data_preprocesser = data_preprocesser
+        self.chart_configs = chart_configs
+        self.module = MemoizedModule(dspy.ChainOfThought(FusedQuerySignature), "FusedQuerySignature")
+
+    def _inputs(
+        self,
+        query: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str,
+        vast_system_state: List[Dict[str, Any]],
+        message_history: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "data_description": data_description,
+            "data_sample": data_sample,
+            "vis_template_candidate": self.chart_configs,
+            "code_template": code_template or self.data_preprocesser.get_code_template(),
+            "vast_system_state": vast_system_state,
+            "message_history": message_history,
+        }
+
+    def run(
+        self,
+        query: str,
+        data_path: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str = None,
+        vast_system_state: List[Dict[str, Any]] = None,
+        message_history: List[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Analyze the query and generate its code in one call.
+
+        Returns:
+            {"analysis": analysis dict, "code": complete code or None for reports,
+            "channel_mapping": dict, "inputs": module inputs}, or None if the fast path failed
+        """
+        return run_sync(
+            self.arun(
+                query,
+                data_path,
+                data_description,
+                data_sample,
+                code_template=code_template,
+                vast_system_state=vast_system_state,
+                message_history=message_history,
+            )
+        )
+
+    async def arun(
+        self,
+        query: str,
+        data_path: str,
+        data_description: str,
+        data_sample: str,
+        code_template: str = None,
+        vast_system_state: List[Dict[str, Any]] = None,
+        message_history: List[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Async variant of run, which runs it
+        """
+        inputs = self._inputs(
+            query, data_description, data_sample, code_template, vast_system_state, message_history
+        )
+        try:
+            logger.info("调用 LLM 进行融合查询分析与代码生成")
+            response = await self.module.acall(**inputs)
+            return self._validate(response, inputs, data_path)
+        except Exception as e:
+            logger.warning(f"融合查询失败，回退到两阶段流程: {e}")
+            logger.debug(traceback.format_exc())
+            return None
+
+    def forget(self, fused: Dict[str, Any]) -> None:
+        """Drop the memoized prediction of a fused call whose code turned out to be unusable."""
+        self.module.forget(**fused["inputs"])
+
+    def _validate(
+        self, response: dspy.Prediction, inputs: Dict[str, Any], data_path: str
+    ) -> Optional[Dict[str, Any]]:
+        error = self._check(response, data_path)
+        if error:
+            logger.warning(f"融合查询结果未通过校验，回退到两阶段流程: {error}")
+            self.module.forget(**inputs)
+            return None
+
+        analysis = self.query_analyzer._build_result(response)
+        if analysis["query_type"] == "report":
+            return {"analysis": analysis, "code": None, "channel_mapping": {}, "inputs": inputs}
+
+        sheet_name = response.sheet_name.strip().strip('"')
+        code_result = self.data_preprocesser._assemble_code(
+            response, inputs["code_template"], data_path, sheet_name
+        )
+        try:
+            compile(code_result["code"], "<fused>", "exec")
+        except SyntaxError as e:
+            logger.warning(f"融合查询生成的代码存在语法错误，回退到两阶段流程: {e}")
+            self.module.forget(**inputs)
+            return None
+
+        return {
+            "analysis": analysis,
+            "code": code_result["code"],
+            "channel_mapping": code_result["channel_mapping"] or {},
+            "inputs": inputs,
+        }
+
+    def _check(self, response: dspy.Prediction, data_path: str) -> Optional[str]:
+        """
+        Check a fused prediction before its code is run.
+
+        Returns:
+            Description of the first problem found, or None if the prediction is usable
+        """
+        query_type = response.query_type
+        if query_type not in VALID_QUERY_TYPES:
+            return f"未知查询类型 {query_type}"
+        if query_type == "report":
+            return None
+
+        sheet_name = (response.sheet_name or "").strip().strip('"')
+        if sheet_name not in get_data_store(data_path).sheet_names:
+            return f"未知工作表 {sheet_name}"
+
+        if not (response.pandas_code or "").strip():
+            return "没有生成代码"
+
+        if query_type in ("visualization", "replace"):
+            chart_id = (response.chart_id or "").strip().strip('"')
+            chart = next((c for c in self.chart_configs if c["id"] == chart_id), None)
+            if chart is None:
+                return f"未知图表 {chart_id}"
+
+            mapping = response.channel_mapping
+            if not isinstance(mapping, dict):
+                return "通道映射不是字典"
+            missing = [c["name"] for c in chart["channels"] if c["name"] not in mapping]
+            if missing:
+                return f"缺少通道映射 {', '.join(missing)}"
+
+        return None
+
+
+def get_fused_query(query_analyzer, data_preprocesser, chart_configs) -> Optional[FusedQuery]:
+    """
+    Build the fused fast path if it is enabled (FUSED_QUERY=1), otherwise return None.
+    """
+    if os.getenv("FUSED_QUERY", "0") != "1":
+        return None
+    logger.info("启用融合查询快速路径")
+    return FusedQuery(query_analyzer, data_preprocesser, chart_configs)
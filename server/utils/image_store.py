@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("image_store")
+
+# 图片存储目录
+IMAGE_STORE_DIR = Path(__file__).parent.parent / "cache" / "images"
+
+# 报告中引用图片的URL前缀（对应 /api/report/images/<name> 接口）
+IMAGE_URL_PREFIX = "/api/report/images/"
+
+# 内容寻址的文件名：32位十六进制摘要 + 扩展名
+IMAGE_NAME_PATTERN = re.compile(r"^[0-9a-f]{32}\.(png|jpg|jpeg|svg)$")
+
+IMAGE_MIMETYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "svg": "image/svg+xml",
+}
+
+
+class ImageStore:
+    """
+    Content-addressed store of report images.
+
+    Each image is stored once under the hash of its bytes, so a name always refers to the same
+    content: it doubles as the ETag and the image can be served with an immutable cache policy.
+
+    Retention follows the report workspaces: images not stored again within retention_hours are
+    removed, and when the store exceeds max_bytes the least recently stored images go first, at
+    most once per cleanup_interval seconds. Storing an existing image refreshes it, so reports
+    served from the report cache keep their images (see keep_images).
+    """
+
+    def __init__(
+        self,
+        root: Path = IMAGE_STORE_DIR,
+        url_prefix: str = IMAGE_URL_PREFIX,
+        retention_hours: float = 24,
+        max_bytes: int = 512 * 1024 * 1024,
+        cleanup_interval: float = 600,
+    ):
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+        self.retention = retention_hours * 3600
+        self.max_bytes = max_bytes
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put(self, path: str) -> str:
+        """
+        Store an image file.
+
+        Returns:
+            Content-addressed name of the image
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        suffix = Path(path).suffix.lower() or ".png"
+        name = f"{digest.hexdigest()[:32]}{suffix}"
+
+        self.maybe_cleanup()
+        target = self.root / name
+        try:
+            # 已存在的图片刷新修改时间，重新计算保留期
+            os.utime(target)
+        except FileNotFoundError:
+            # 先写临时文件再改名，读取方不会看到写了一半的图片
+            tmp = self.root / f".{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+            logger.info(f"保存报告图片: {name}")
+        return name
+
+    def maybe_cleanup(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        self.cleanup(now)
+
+    def cleanup(self, now: float = None) -> int:
+        """
+        Remove expired images, then the least recently stored ones while over max_bytes.
+
+        Returns:
+            Number of images removed
+        """
+        now = now or time.time()
+        images = []
+        for entry in self.root.iterdir():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            images.append((stat.st_mtime, stat.st_size, entry))
+        images.sort()
+
+        removed = 0
+        total = sum(size for _, size, _ in images)
+        for mtime, size, entry in images:
+            if now - mtime <= self.retention and total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"清理报告图片 {removed} 张")
+        return removed
+
+    def url(self, name: str) -> str:
+        return f"{self.url_prefix}{name}"
+
+    def path(self, name: str) -> Optional[Path]:
+        """Path of a stored image, or None if the name is invalid or unknown."""
+        if not IMAGE_NAME_PATTERN.match(name):
+            return None
+        path = self.root / name
+        return path if path.is_file() else None
+
+    @staticmethod
+    def etag(name: str) -> str:
+        return name.split(".")[0]
+
+    @staticmethod
+    def mimetype(name: str) -> str:
+        return IMAGE_MIMETYPES.get(name.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+# 图片内容不变，浏览器可永久缓存
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_store: Optional[ImageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageStore:
+    """
+    Get the process-wide image store.
+
+    Configured through IMAGE_STORE_DIR, REPORT_IMAGE_URL_PREFIX, REPORT_RETENTION_HOURS
+    (shared with the report workspaces) and IMAGE_STORE_MAX_MB.
+    """
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore(
+                root=Path(os.getenv("IMAGE_STORE_DIR", str(IMAGE_STORE_DIR))),
+                url_prefix=os.getenv("REPORT_IMAGE_URL_PREFIX", IMAGE_URL_PREFIX),
+                retention_hours=float(os.getenv("REPORT_RETENTION_HOURS", "24")),
+                max_bytes=int(os.getenv("IMAGE_STORE_MAX_MB", "512")) * 1024 * 1024,
+            )
+    return _store
+
+
+def keep_images(image_paths: List[str]) -> None:
+    """
+    Store the images of a report served from the report cache again.
+
+    Its markdown references the images by URL: this refreshes their retention, and restores
+    them from the cached copies if they were already removed.
+    """
+    image_store = get_image_store()
+    for path in image_paths:
+        try:
+            image_store.put(path)
+        except OSError as e:
+            logger.warning(f"恢复报告图片失败 {path}: {e}")
+
+
+def inline_images_default() -> bool:
+    """Whether reports embed their images as base64 by default (REPORT_INLINE_IMAGES=1)."""
+    return os.getenv("REPORT_INLINE_IMAGES", "0") == "1"
@@ -0,0 +1,184 @@
+import os
+import threading
+from typing import Dict, List, Optional, Union
+
+import httpx
+import openai
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("llm_client")
+
+Messages = Union[str, List[Dict[str, str]]]
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60")),
+    )
+
+
+def _timeout() -> float:
+    return float(os.getenv("LLM_TIMEOUT", "60"))
+
+
+def llm_max_concurrency() -> int:
+    """
+    Maximum number of LLM calls in flight at once (LLM_MAX_CONCURRENCY, default 16).
+
+    The limit is shared by the DSPy LM and the report LLM client (see llm_slots), so query
+    and report traffic together never exceed it. dspy.asyncify's worker pool is sized by the
+    same value, so size it to the concurrency the LLM service allows.
+    """
+    return int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+
+_llm_slots: Optional[threading.BoundedSemaphore] = None
+_llm_slots_lock = threading.Lock()
+
+
+def llm_slots() -> threading.BoundedSemaphore:
+    """
+    Process-wide semaphore that every LLM call holds while it is in flight.
+
+    Taken by LLMClient.complete and by the DSPy LM configured in llm_config, sized by
+    llm_max_concurrency().
+    """
+    global _llm_slots
+
+    with _llm_slots_lock:
+        if _llm_slots is None:
+            _llm_slots = threading.BoundedSemaphore(llm_max_concurrency())
+    return _llm_slots
+
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Process-wide keep-alive HTTP connection pool for LLM calls.
+
+    Shared by the report LLM client and by litellm (the DSPy LM), so connections and TLS
+    sessions are reused across calls. Sized by LLM_HTTP_MAX_CONNECTIONS and
+    LLM_HTTP_MAX_KEEPALIVE.
+    """
+    global _http_client
+
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+    return _http_client
+
+
+def install_litellm_session() -> None:
+    """Route litellm's synchronous OpenAI-compatible calls (DSPy) through the shared pool."""
+    import litellm
+
+    litellm.client_session = get_http_client()
+
+
+def _messages(prompt: Messages) -> List[Dict[str, str]]:
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+
+class LLMClient:
+    """
+    Shared chat-completion client with pooled connections.
+
+    One instance serves the whole process: complete() uses the shared keep-alive pool and
+    holds a slot of the process-wide LLM concurrency limit while the call is in flight.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str],
+        model: str,
+        timeout: float = 60,
+        max_retries: int = 2,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self._client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=get_http_client(),
+            timeout=timeout,
+            max_retries=max_retries,
+        )
+
+    def complete(
+        self,
+        prompt: Messages,
+        max_tokens: int = 150,
+        temperature: float = 0.7,
+        timeout: float = None,
+    ) -> str:
+        """
+        Run one chat completion.
+
+        Args:
+            prompt: User prompt, or a full list of chat messages
+            timeout: Per-call timeout in seconds (default: the client timeout)
+
+        Returns:
+            The stripped completion text
+        """
+        with llm_slots():
+            response = self._client.chat.completions.create(
+                model=self.model,
+                messages=_messages(prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout or self.timeout,
+            )
+        return response.choices[0].message.content.strip()
+
+
+_llm_client: Optional[LLMClient] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """
+    Get the process-wide LLM client used for report narratives.
+
+    Configured through REPORT_LLM_API_KEY, REPORT_LLM_BASE_URL and REPORT_LLM_MODEL, each
+    falling back to the OPENAI_API_KEY, OPENAI_API_BASE and OPENAI_MODEL settings of the DSPy
+    LM, and through LLM_TIMEOUT and LLM_MAX_RETRIES.
+
+    Raises:
+        RuntimeError: If no API key is configured
+    """
+    global _llm_client
+
+    with _llm_client_lock:
+        if _llm_client is None:
+            api_key = os.getenv("REPORT_LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError(
+                    "未配置报告 LLM 的 API 密钥，请设置 REPORT_LLM_API_KEY 或 OPENAI_API_KEY"
+                )
+            model = os.getenv("REPORT_LLM_MODEL") or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            # DSPy 使用 litellm 的模型名，OpenAI SDK 需要去掉 "openai/" 前缀
+            if model.startswith("openai/"):
+                model = model[len("openai/") :]
+            _llm_client = LLMClient(
+                api_key=api_key,
+                base_url=os.getenv("REPORT_LLM_BASE_URL") or os.getenv("OPENAI_API_BASE") or None,
+                model=model,
+                timeout=_timeout(),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            )
+            logger.info(
+                f"初始化报告 LLM 客户端 - 模型: {_llm_client.model}, "
+                f"并发上限: {llm_max_concurrency()}"
+            )
+    return _llm_client
@@ -5,6 +5,7 @@ from enum import Enum, auto
 from typing import Dict, Any, List, Literal, Optional, Union
 from dotenv import load_dotenv
 import dspy
+from utils.llm_client import install_litellm_session, llm_max_concurrency, llm_slots
 from utils.logger import get_logger, log_dict
 
 # 获取该模块的日志器
@@ -15,6 +16,15 @@ logger.info("加载环境变量")
 load_dotenv()
 
 
+class BoundedLM(dspy.LM):
+    """dspy.LM whose calls hold a slot of the process-wide LLM concurrency limit."""
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        # 与报告文本生成共用同一个并发上限（同步、asyncify 和 streamify 调用都经过这里）
+        with llm_slots():
+            return super().forward(prompt=prompt, messages=messages, **kwargs)
+
+
 # Configure DSPy with OpenAI
 def configure_dspy():
     logger.info("配置 DSPy 日志器")
@@ -24,16 +34,25 @@ def configure_dspy():
 
     logger.info(f"使用模型: {model}")
 
+    # 单次调用超时（秒），与报告文本生成共用配置
+    timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+
     # Configure model with optional base URL if specified
     if api_base:
         logger.debug(f"使用自定义 API 基础地址: {api_base}")
-        lm = dspy.LM(model, api_key=api_key, api_base=api_base)
+        lm = BoundedLM(model, api_key=api_key, api_base=api_base, timeout=timeout)
     else:
         logger.debug("使用默认 API 基础地址")
-        lm = dspy.LM(model, api_key=api_key)
+        lm = BoundedLM(model, api_key=api_key, timeout=timeout)
+
+    # litellm 的同步请求复用进程内共享的 HTTP 连接池
+    install_litellm_session()
+
+    # dspy.asyncify 的线程池与 LLM 并发上限一致，排队的调用不会占用多余的线程
+    async_max_workers = llm_max_concurrency()
 
     logger.info("完成 DSPy 配置")
-    dspy.configure(lm=lm)
+    dspy.configure(lm=lm, async_max_workers=async_max_workers)
 
 
 # Initialize DSPy with configuration
@@ -101,6 +120,13 @@ chart_configs = load_chart_configs()
 logger.info(f"共加载了 {len(chart_configs)} 个图表配置")
 
 
+# data_sample 输入字段的描述（各签名共用）
+DATA_SAMPLE_DESC = (
+    "Profile of every sheet: column dtypes, null ratios, min/max, year ranges and the distinct "
+    "values of categorical columns"
+)
+
+
 # Define enum classes for type safety
 class QueryType(str, Enum):
     VALUE = "value"  # For specific numerical/data value queries
@@ -117,7 +143,7 @@ class QueryAnalysisSignature(dspy.Signature):
 
     query: str = dspy.InputField(desc="User's query about data or visualization")
     data_description: str = dspy.InputField(desc="Description of the dataset")
-    data_sample: str = dspy.InputField(desc="Sample of the dataset (first few rows)")
+    data_sample: str = dspy.InputField(desc=DATA_SAMPLE_DESC)
     vis_template_candidate: List[Dict[str, Any]] = dspy.InputField(
         desc="List of visualization template candidates, each containing 'id', 'description', and 'channels' (list of dicts with 'name' and 'type')"
     )
@@ -181,7 +207,7 @@ class DataPreprocesserSignature(dspy.Signature):
         desc="Instructions on how to process the data"
     )
     data_description: str = dspy.InputField(desc="Description of the dataset")
-    data_sample: str = dspy.InputField(desc="Sample of the dataset (first few rows)")
+    data_sample: str = dspy.InputField(desc=DATA_SAMPLE_DESC)
     code_template: str = dspy.InputField(
         desc="Template code with placeholders where generated code should be inserted"
     )
@@ -218,3 +244,66 @@ class DataResponseSignature(dspy.Signature):
     response: str = dspy.OutputField(
         desc="Natural language response explaining the data results in context of the user's query. Should be detailed, informative, and directly answer the user's question. You can also add a little bit of insights."
     )
+
+
+# Fused Query Signature - Query analysis and code generation in a single call
+class FusedQuerySignature(dspy.Signature):
+    """
+    Analyze the user query and, in the same step, generate the pandas code that prepares the data.
+    Determine if the user wants a specific value, a visualization, a replacement of an existing
+    visualization or a report, and select the sheet and visualization template.
+    For value, visualization and replace queries, generate partial pandas code to be inserted into
+    the template (only the data transformation part, assigning the result to processed_df) and map
+    the channels of the selected template to dataframe columns.
+    Keep original column names that maintain the semantic meaning of the data.
+    """
+
+    query: str = dspy.InputField(desc="User's query about data or visualization")
+    data_description: str = dspy.InputField(desc="Description of the dataset")
+    data_sample: str = dspy.InputField(desc=DATA_SAMPLE_DESC)
+    vis_template_candidate: List[Dict[str, Any]] = dspy.InputField(
+        desc="List of visualization template candidates, each containing 'id', 'description', and 'channels' (list of dicts with 'name' and 'type')"
+    )
+    code_template: str = dspy.InputField(
+        desc="Template code with placeholders where generated code should be inserted"
+    )
+    vast_system_state: Optional[List[Dict[str, Any]]] = dspy.InputField(
+        desc="The current state of the VAST visualization system, including a list of existing visualizations with their IDs, types, titles, and bindings",
+        default=None
+    )
+    message_history: Optional[List[Dict[str, Any]]] = dspy.InputField(
+        desc="Previous conversation messages between the user and the system",
+        default=None
+    )
+
+    query_type: Union[QueryType, Literal["value", "visualization", "replace", "report"]] = dspy.OutputField(
+        desc="Type of query: 'value' for specific numerical/data value queries, 'visualization' for new visualization requests, 'replace' for replacing an existing visualization, 'report' for report generation. Only replace the chart when user explicitly asks for it, otherwise create a new one."
+    )
+    chart_id: str = dspy.OutputField(
+        desc="ID of the selected visualization template from vis_template_candidate. Only needed when query_type is 'visualization' or 'replace'. This is NOT the frontend visualization ID, but the template ID."
+    )
+    chart_title: str = dspy.OutputField(
+        desc="Title of the selected visualization template. Only needed when query_type is 'visualization' or 'replace'. Use Chinese for the title. Be short, ignoring unnecesary attributes."
+    )
+    existing_visualization_id: Optional[str] = dspy.OutputField(
+        desc="ID of the existing visualization in the frontend to replace. If empty, a new visualization will be created. This is different from chart_id which refers to the template ID.",
+        default=""
+    )
+    province: str = dspy.OutputField(
+        desc="Province name for report generation. Only needed when query_type is 'report'"
+    )
+    year: str = dspy.OutputField(
+        desc="Year for report generation. Only needed when query_type is 'report'"
+    )
+    sheet_name: str = dspy.OutputField(
+        desc="The name of the Excel sheet to use for data processing when working with multi-sheet Excel files"
+    )
+    preprocessing_instructions: str = dspy.OutputField(
+        desc="Instructions on how to transform the data for the query, used if the generated code has to be regenerated"
+    )
+    pandas_code: str = dspy.OutputField(
+        desc="Only the specific data transformation code that will be inserted into the template, not complete code. Empty for report queries. KEEP ORIGINAL COLUMN NAMES that maintain the semantic meaning of the data."
+    )
+    channel_mapping: Dict[str, str] = dspy.OutputField(
+        desc="Mapping between the channel names of the selected template (keys) and actual dataframe column names (values). Empty for value and report queries. Example: {'category': 'industry_type', 'value': 'energy_consumption'}"
+    )
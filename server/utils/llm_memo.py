@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+import dspy
+
+from utils.logger import get_logger
+from utils.streaming import chunk_text
+from utils.telemetry import CACHE_HITS
+
+# 获取该模块的日志器
+logger = get_logger("llm_memo")
+
+# 记忆化数据库路径
+MEMO_DB_PATH = Path(__file__).parent.parent / "cache" / "llm_memo.sqlite3"
+
+# 默认开启记忆化的签名
+DEFAULT_MEMO_SIGNATURES = (
+    "QueryAnalysisSignature,DataPreprocesserSignature,DataResponseSignature,FusedQuerySignature"
+)
+
+
+class LLMMemo:
+    """
+    SQLite-backed memo of DSPy signature calls, shared across processes and restarts.
+
+    Entries are keyed by signature name, model and a canonical hash of the inputs, and store
+    the prediction's output fields as JSON. When the stored values exceed max_bytes the least
+    recently used entries are evicted. warm_start() preloads the most recently used entries
+    into memory so that the first requests after a deploy do not hit the disk.
+
+    Hits only record their access time in memory; the times are written in one batch once
+    flush_batch hits or flush_interval seconds have accumulated, and before every write or
+    eviction, so a hit never commits to the database.
+    """
+
+    def __init__(
+        self,
+        path: Path = MEMO_DB_PATH,
+        max_bytes: int = 256 * 1024 * 1024,
+        enabled_signatures: Optional[set] = None,
+        flush_batch: int = 256,
+        flush_interval: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.enabled_signatures = enabled_signatures
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self._warm: Dict[str, Dict[str, Any]] = {}
+        # 尚未写入数据库的访问时间：{key: last_access}
+        self._accessed: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS memo (
+                key TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS memo_last_access ON memo (last_access)")
+        self._conn.commit()
+
+    def is_enabled(self, signature_name: str) -> bool:
+        return self.enabled_signatures is None or signature_name in self.enabled_signatures
+
+    @staticmethod
+    def make_key(signature_name: str, inputs: Dict[str, Any]) -> str:
+        lm = dspy.settings.lm
+        model = getattr(lm, "model", None)
+        payload = json.dumps(
+            [signature_name, model, inputs], ensure_ascii=False, sort_keys=True, default=str
+        )
+        return f"{signature_name}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._warm.get(key)
+            if value is None:
+                row = self._conn.execute("SELECT value FROM memo WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                value = json.loads(row[0])
+            self._accessed[key] = time.time()
+            if (
+                len(self._accessed) >= self.flush_batch
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush_access()
+                self._conn.commit()
+            return value
+
+    def set(self, key: str, signature_name: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            # 淘汰按最近访问时间进行，先写入累积的访问时间
+            self._flush_access()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO memo (key, signature, value, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, signature_name, data, len(data), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._warm.pop(key, None)
+            self._accessed.pop(key, None)
+            self._conn.execute("DELETE FROM memo WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write the accumulated access times to the database."""
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        # 调用方持有 self._lock 并负责提交
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE memo SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM memo").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        # 按最近访问时间从旧到新删除，直到总量回到上限以内
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM memo ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM memo WHERE key = ?", (key,))
+            self._warm.pop(key, None)
+            total -= size
+            removed += 1
+        logger.info(f"LLM 记忆化缓存超过上限，淘汰 {removed} 条记录")
+
+    def warm_start(self, limit: int = 1000) -> int:
+        """
+        Load the most recently used entries into memory.
+
+        Returns:
+            Number of entries loaded
+        """
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT key, value FROM memo ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+            self._warm = {key: json.loads(value) for key, value in rows}
+        logger.info(f"LLM 记忆化缓存预热完成 - {len(rows)} 条记录")
+        return len(rows)
+
+
+class MemoizedModule:
+    """
+    Wraps a DSPy module so that identical calls are answered from the LLMMemo.
+    """
+
+    def __init__(self, module: dspy.Module, signature_name: str, memo: "LLMMemo" = None):
+        self.module = module
+        self.signature_name = signature_name
+        self.memo = memo
+        self._streamer = None
+
+    def _memo(self) -> Optional[LLMMemo]:
+        memo = self.memo or get_llm_memo()
+        if memo is None or not memo.is_enabled(self.signature_name):
+            return None
+        return memo
+
+    def __call__(self, **kwargs) -> dspy.Prediction:
+        memo = self._memo()
+        if memo is None:
+            return self.module(**kwargs)
+
+        key = memo.make_key(self.signature_name, kwargs)
+        cached = memo.get(key)
+        if cached is not None:
+            logger.info(f"命中 LLM 记忆化缓存: {self.signature_name}")
+            CACHE_HITS.inc(cache="llm_memo")
+            return dspy.Prediction(**cached)
+
+        prediction = self.module(**kwargs)
+        try:
+            memo.set(key, self.signature_name, prediction.toDict())
+        except Exception as e:
+            logger.warning(f"写入 LLM 记忆化缓存失败: {e}")
+        return prediction
+
+    async def acall(self, **kwargs) -> dspy.Prediction:
+        """
+        Async variant of __call__ for the ASGI server.
+
+        The module runs on DSPy's bounded worker pool (dspy.asyncify, sized by
+        dspy.settings.async_max_workers), so the event loop is never blocked on the LLM.
+        """
+        memo = self._memo()
+        key = memo.make_key(self.signature_name, kwargs) if memo is not None else None
+        if memo is not None:
+            cached = memo.get(key)
+            if cached is not None:
+                logger.info(f"命中 LLM 记忆化缓存: {self.signature_name}")
+                CACHE_HITS.inc(cache="llm_memo")
+                return dspy.Prediction(**cached)
+
+        prediction = await dspy.asyncify(self.module)(**kwargs)
+        if memo is not None:
+            try:
+                memo.set(key, self.signature_name, prediction.toDict())
+            except Exception as e:
+                logger.warning(f"写入 LLM 记忆化缓存失败: {e}")
+        return prediction
+
+    async def astream(self, **kwargs) -> AsyncIterator[Any]:
+        """
+        Stream a call: yields the raw LM text deltas, then the final dspy.Prediction.
+
+        A memo hit yields only the prediction. Uses dspy.streamify, which also runs the module
+        on DSPy's bounded worker pool.
+        """
+        memo = self._memo()
+        key = memo.make_key(self.signature_name, kwargs) if memo is not None else None
+        if memo is not None:
+            cached = memo.get(key)
+            if cached is not None:
+                logger.info(f"命中 LLM 记忆化缓存: {self.signature_name}")
+                CACHE_HITS.inc(cache="llm_memo")
+                yield dspy.Prediction(**cached)
+                return
+
+        if self._streamer is None:
+            self._streamer = dspy.streamify(self.module)
+
+        # 让 streamify 的生成器自然结束，提前退出会在其任务组之外关闭它
+        prediction = None
+        async for value in self._streamer(**kwargs):
+            if isinstance(value, dspy.Prediction):
+                prediction = value
+                continue
+            text = chunk_text(value)
+            if text:
+                yield text
+
+        if memo is not None:
+            try:
+                memo.set(key, self.signature_name, prediction.toDict())
+            except Exception as e:
+                logger.warning(f"写入 LLM 记忆化缓存失败: {e}")
+        yield prediction
+
+    def forget(self, **kwargs) -> None:
+        """Drop the memoized result of a call, e.g. after its output turned out to be unusable."""
+        memo = self._memo()
+        if memo is not None:
+            memo.forget(memo.make_key(self.signature_name, kwargs))
+
+
+_memo: Optional[LLMMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_llm_memo() -> Optional[LLMMemo]:
+    """
+    Get the process-wide LLM memo, opening the database on first use.
+
+    Configured through LLM_MEMO (set to 0 to disable), LLM_MEMO_PATH, LLM_MEMO_MAX_MB and
+    LLM_MEMO_SIGNATURES (comma-separated signature names to memoize).
+
+    Returns:
+        The shared LLMMemo, or None if memoization is disabled
+    """
+    global _memo
+
+    if os.getenv("LLM_MEMO", "1") == "0":
+        return None
+
+    with _memo_lock:
+        if _memo is None:
+            signatures = os.getenv("LLM_MEMO_SIGNATURES", DEFAULT_MEMO_SIGNATURES)
+            _memo = LLMMemo(
+                path=Path(os.getenv("LLM_MEMO_PATH", str(MEMO_DB_PATH))),
+                max_bytes=int(os.getenv("LLM_MEMO_MAX_MB", "256")) * 1024 * 1024,
+                enabled_signatures={name.strip() for name in signatures.split(",") if name.strip()},
+            )
+            # 退出时写入尚未落盘的访问时间
+            atexit.register(_memo.flush)
+    return _memo
@@ -35,6 +35,21 @@ COMPONENT_COLORS = {
     "entry_point": Colors.YELLOW,
     "app": Colors.MAGENTA,
     "llm_config": Colors.CYAN,
+    "data_store": Colors.GREEN,
+    "columnar_cache": Colors.GREEN,
+    "sandbox_pool": Colors.GREEN,
+    "data_profile": Colors.GREEN,
+    "result_cache": Colors.GREEN,
+    "llm_memo": Colors.CYAN,
+    "fused_query": Colors.BLUE,
+    "report_cache": Colors.GREEN,
+    "report_batch": Colors.YELLOW,
+    "chart_pool": Colors.GREEN,
+    "image_store": Colors.GREEN,
+    "report_workspace": Colors.GREEN,
+    "llm_client": Colors.CYAN,
+    "report_pipeline": Colors.YELLOW,
+    "telemetry": Colors.MAGENTA,
     "default": Colors.WHITE,
 }
 
@@ -0,0 +1,174 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.result_cache import make_cache_key
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("report_cache")
+
+# 报告缓存目录
+REPORT_CACHE_DIR = Path(__file__).parent.parent / "cache" / "reports"
+
+
+def file_hash(path: Path) -> str:
+    """Content hash of a file (first 16 hex digits of its sha256)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _to_json_value(value: Any) -> Any:
+    # numpy 标量转换为 Python 数值
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class ReportCache:
+    """
+    Persistent cache of generated reports.
+
+    Each entry is a directory named after the cache key (province, year, template hash and data
+    version) holding the rendered markdown, copies of the chart images and the replacement
+    values. Entries are written to a temporary directory and renamed into place, so readers
+    never see a partial report. Beyond max_entries the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: Path = REPORT_CACHE_DIR, max_entries: int = 64):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._template_hashes: Dict[str, tuple] = {}
+
+    def template_hash(self, template_path: Path) -> str:
+        """Hash of the report template, recomputed only when its mtime or size changes."""
+        stat = os.stat(template_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._template_hashes.get(str(template_path))
+        if cached is None or cached[0] != signature:
+            cached = (signature, file_hash(template_path))
+            self._template_hashes[str(template_path)] = cached
+        return cached[1]
+
+    def make_key(
+        self,
+        province: str,
+        year: int,
+        template_path: Path,
+        data_version: str,
+        inline_images: bool = False,
+    ) -> str:
+        # 内嵌图片与URL引用的报告内容不同，分别缓存
+        return make_cache_key(
+            province,
+            int(year),
+            self.template_hash(template_path),
+            data_version,
+            "inline" if inline_images else "url",
+        )[:32]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a report.
+
+        Returns:
+            {"markdown_path", "markdown", "values"} or None if the report is not cached
+        """
+        entry = self.cache_dir / key
+        try:
+            with open(entry / "report.md", "r", encoding="utf-8") as f:
+                markdown = f.read()
+            with open(entry / "values.json", "r", encoding="utf-8") as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # 更新访问时间，用于淘汰最久未使用的报告
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return {"markdown_path": entry / "report.md", "markdown": markdown, "values": values}
+
+    def put(self, key: str, markdown: str, replacement_values: Dict[str, Any]) -> Path:
+        """
+        Store a generated report with copies of its images.
+
+        Returns:
+            Path of the cached markdown file
+        """
+        entry = self.cache_dir / key
+        tmp_entry = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+
+        try:
+            values = dict(replacement_values)
+            image_paths = []
+            for i, img_path in enumerate(replacement_values.get("image_paths", [])):
+                name = f"img{i + 1}{Path(img_path).suffix}"
+                shutil.copyfile(img_path, tmp_entry / name)
+                image_paths.append(str(entry / name))
+            values["image_paths"] = image_paths
+
+            with open(tmp_entry / "values.json", "w", encoding="utf-8") as f:
+                json.dump(values, f, ensure_ascii=False, default=_to_json_value)
+            with open(tmp_entry / "report.md", "w", encoding="utf-8") as f:
+                f.write(markdown)
+
+            with self._lock:
+                if entry.exists():
+                    shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp_entry, entry)
+                self._evict()
+        except Exception:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+
+        logger.info(f"报告已缓存: {key}")
+        return entry / "report.md"
+
+    def _evict(self) -> None:
+        entries = [p for p in self.cache_dir.iterdir() if p.is_dir() and not p.name.startswith(".")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda p: p.stat().st_mtime)
+        for stale in entries[: len(entries) - self.max_entries]:
+            shutil.rmtree(stale, ignore_errors=True)
+            logger.info(f"淘汰报告缓存: {stale.name}")
+
+
+_report_cache: Optional[ReportCache] = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> Optional[ReportCache]:
+    """
+    Get the process-wide report cache.
+
+    Configured through REPORT_CACHE (set to 0 to disable), REPORT_CACHE_DIR and
+    REPORT_CACHE_ENTRIES.
+
+    Returns:
+        The shared ReportCache, or None if report caching is disabled
+    """
+    global _report_cache
+
+    if os.getenv("REPORT_CACHE", "1") == "0":
+        return None
+
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(
+                cache_dir=Path(os.getenv("REPORT_CACHE_DIR", str(REPORT_CACHE_DIR))),
+                max_entries=int(os.getenv("REPORT_CACHE_ENTRIES", "64")),
+            )
+    return _report_cache
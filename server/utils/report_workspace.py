@@ -0,0 +1,175 @@
+import os
+import time
+import errno
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("report_workspace")
+
+# 报告工作目录的根目录
+WORKSPACE_ROOT = Path(__file__).parent.parent / "cache" / "report_workspaces"
+
+# 多个进程同时发布同名报告时，发布的最大尝试次数
+PUBLISH_ATTEMPTS = 5
+
+
+class ReportWorkspace:
+    """
+    Private working directory of one report generation.
+
+    Charts and the markdown are written here instead of the shared report/temp_images and
+    report/output.md, so concurrent reports never overwrite each other. Used as a context
+    manager: the directory is removed on exit unless it was published.
+    """
+
+    def __init__(self, manager: "ReportWorkspaces", name: str):
+        self.manager = manager
+        self.name = name
+        self.path = manager.work_dir / f"{name}.{uuid.uuid4().hex[:12]}"
+        self.images_dir = self.path / "images"
+        self.output_path = self.path / "report.md"
+        self.images_dir.mkdir(parents=True)
+        self.published_path: Optional[Path] = None
+
+    def publish(self) -> Path:
+        """
+        Move the workspace into the published directory with one atomic rename.
+
+        Returns:
+            Path of the published markdown file
+        """
+        self.published_path = self.manager.publish(self)
+        return self.published_path
+
+    def __enter__(self) -> "ReportWorkspace":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.published_path is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ReportWorkspaces:
+    """
+    Manages per-request report workspaces and their published outputs.
+
+    Workspaces live under <root>/work and are published to <root>/published/<name> by renaming
+    the whole directory, so readers never see a partial report. Several processes may publish
+    the same name at once; the rename is retried until one of them wins. Published reports older than
+    retention_hours and abandoned workspaces (e.g. left by a crashed process) are removed,
+    at most once per cleanup_interval seconds.
+    """
+
+    def __init__(
+        self,
+        root: Path = WORKSPACE_ROOT,
+        retention_hours: float = 24,
+        stale_workspace_hours: float = 1,
+        cleanup_interval: float = 600,
+    ):
+        self.root = Path(root)
+        self.work_dir = self.root / "work"
+        self.published_dir = self.root / "published"
+        self.retention = retention_hours * 3600
+        self.stale_workspace = stale_workspace_hours * 3600
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.published_dir.mkdir(parents=True, exist_ok=True)
+
+    def create(self, name: str) -> ReportWorkspace:
+        """Create a fresh workspace; name only needs to be readable (e.g. a cache key)."""
+        self.maybe_cleanup()
+        return ReportWorkspace(self, name)
+
+    def publish(self, workspace: ReportWorkspace) -> Path:
+        # 同名报告（同一缓存键）后发布的覆盖先发布的；旧目录先移开再删除
+        target = self.published_dir / workspace.name
+        with self._lock:
+            for attempt in range(PUBLISH_ATTEMPTS):
+                self._move_aside(target)
+                try:
+                    os.replace(workspace.path, target)
+                    break
+                except OSError as e:
+                    # 其他进程在移开旧目录后抢先发布了同名报告，重新移开再试
+                    if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                        raise
+                    if attempt == PUBLISH_ATTEMPTS - 1:
+                        raise
+                    logger.debug(f"发布报告时目标目录被占用，重试: {workspace.name}")
+        return target / workspace.output_path.name
+
+    def _move_aside(self, target: Path) -> None:
+        if not target.exists():
+            return
+        stale = self.work_dir / f".{target.name}.{uuid.uuid4().hex[:12]}.old"
+        try:
+            os.replace(target, stale)
+        except FileNotFoundError:
+            # 已被其他进程移开
+            return
+        shutil.rmtree(stale, ignore_errors=True)
+
+    def maybe_cleanup(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        self.cleanup(now)
+
+    def cleanup(self, now: float = None) -> int:
+        """
+        Remove expired published reports and abandoned workspaces.
+
+        Returns:
+            Number of directories removed
+        """
+        now = now or time.time()
+        removed = 0
+        for directory, max_age in (
+            (self.published_dir, self.retention),
+            (self.work_dir, self.stale_workspace),
+        ):
+            for entry in directory.iterdir():
+                try:
+                    if now - entry.stat().st_mtime > max_age:
+                        shutil.rmtree(entry, ignore_errors=True)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"清理过期报告工作目录 {removed} 个")
+        return removed
+
+
+_workspaces: Optional[ReportWorkspaces] = None
+_workspaces_lock = threading.Lock()
+
+
+def get_report_workspaces() -> ReportWorkspaces:
+    """
+    Get the process-wide report workspace manager.
+
+    Configured through REPORT_WORKSPACE_DIR, REPORT_RETENTION_HOURS and
+    REPORT_STALE_WORKSPACE_HOURS.
+    """
+    global _workspaces
+
+    with _workspaces_lock:
+        if _workspaces is None:
+            _workspaces = ReportWorkspaces(
+                root=Path(os.getenv("REPORT_WORKSPACE_DIR", str(WORKSPACE_ROOT))),
+                retention_hours=float(os.getenv("REPORT_RETENTION_HOURS", "24")),
+                stale_workspace_hours=float(os.getenv("REPORT_STALE_WORKSPACE_HOURS", "1")),
+            )
+    return _workspaces
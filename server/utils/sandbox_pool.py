@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import queue
+import struct
+import atexit
+import threading
+import subprocess
+from typing import Callable, List, Optional, Tuple
+
+import pyarrow as pa
+
+from utils.logger import get_logger
+from utils.telemetry import span
+
+# 获取该模块的日志器
+logger = get_logger("sandbox_pool")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "sandbox_worker.py")
+
+
+class SandboxError(Exception):
+    """Raised when a sandbox worker crashes, times out or breaks the protocol."""
+
+
+def get_interpreter() -> str:
+    """Interpreter used to run generated code (PYTHON_INTERPRETER, or the current one)."""
+    return os.getenv("PYTHON_INTERPRETER") or sys.executable
+
+
+class SandboxWorker:
+    """
+    One long-lived interpreter with pandas imported and the sheets preloaded.
+    """
+
+    def __init__(self, interpreter: str, preload_paths: List[str]):
+        self.preload_paths = list(preload_paths)
+        self.tasks_done = 0
+        self.rss = 0
+        self._ready = False
+        self.process = subprocess.Popen(
+            [interpreter, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._send({"preload": self.preload_paths})
+
+    def _send(self, message: dict) -> None:
+        self.process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self.process.stdout.read(size) if size else b""
+        if len(data) < size:
+            self.process.wait()
+            raise SandboxError(
+                f"sandbox worker exited (code {self.process.returncode}), possibly timed out"
+            )
+        return data
+
+    def _receive(self, timeout: Optional[float]) -> Tuple[dict, bytes]:
+        # 超时后直接结束进程，读取随即遇到 EOF
+        timer = threading.Timer(timeout, self.process.kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            (header_size,) = struct.unpack(">I", self._read_exactly(4))
+            header = json.loads(self._read_exactly(header_size))
+            payload = self._read_exactly(header.get("payload_size", 0))
+        finally:
+            if timer:
+                timer.cancel()
+        return header, payload
+
+    def run(self, code: str, timeout: Optional[float] = None) -> Tuple[str, Optional[pa.Table]]:
+        """
+        Execute a complete script in the worker.
+
+        Returns:
+            Everything the script printed to stdout, and the result table it handed to
+            RESULT_SINK (None if it printed its result instead)
+        """
+        if not self._ready:
+            self._receive(timeout)
+            self._ready = True
+
+        try:
+            self._send({"code": code})
+        except (BrokenPipeError, OSError) as e:
+            raise SandboxError(f"sandbox worker is not accepting tasks: {e}")
+
+        header, payload = self._receive(timeout)
+        self.tasks_done += 1
+        self.rss = header.get("rss", 0)
+        table = pa.ipc.open_stream(payload).read_all() if payload else None
+        return header.get("stdout", ""), table
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self) -> None:
+        if self.alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+
+
+class SandboxPool:
+    """
+    Pool of pre-started sandbox workers sized to the CPU count.
+
+    Workers are recycled after max_tasks executions, when their resident memory exceeds
+    max_rss_mb, when they crash or time out, and when the preloaded sheets are stale.
+    """
+
+    def __init__(
+        self,
+        preload_provider: Callable[[], List[str]],
+        size: int = None,
+        max_tasks: int = 50,
+        max_rss_mb: int = 1024,
+        timeout: float = 60,
+        interpreter: str = None,
+    ):
+        self.preload_provider = preload_provider
+        self.size = size or os.cpu_count() or 1
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.timeout = timeout
+        self.interpreter = interpreter or get_interpreter()
+        self._idle = queue.Queue()
+        self._closed = False
+
+        logger.info(f"启动沙箱进程池 - 进程数: {self.size}, 解释器: {self.interpreter}")
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> SandboxWorker:
+        return SandboxWorker(self.interpreter, self._current_preload())
+
+    def _current_preload(self) -> List[str]:
+        try:
+            return list(self.preload_provider())
+        except Exception as e:
+            logger.warning(f"获取预加载数据失败，工作进程将按需读取数据: {e}")
+            return []
+
+    def _needs_recycle(self, worker: SandboxWorker) -> Optional[str]:
+        if not worker.alive():
+            return "进程已退出"
+        if worker.tasks_done >= self.max_tasks:
+            return f"已执行 {worker.tasks_done} 个任务"
+        if self.max_rss and worker.rss > self.max_rss:
+            return f"内存占用 {worker.rss // (1024 * 1024)}MB 超过上限"
+        if worker.preload_paths != self._current_preload():
+            return "预加载数据已过期"
+        return None
+
+    def _recycle(self, worker: SandboxWorker, reason: str) -> SandboxWorker:
+        logger.info(f"回收沙箱工作进程 (pid {worker.process.pid}): {reason}")
+        worker.stop()
+        return self._spawn()
+
+    def run(self, code: str) -> Tuple[str, Optional[pa.Table]]:
+        """
+        Execute a complete script on an idle worker, blocking until one is free.
+
+        Returns:
+            The script's captured stdout and its result table (see SandboxWorker.run)
+
+        Raises:
+            SandboxError: if the worker crashed or timed out
+        """
+        # 等待空闲工作进程（必要时重建）计入 sandbox.start
+        with span("sandbox.start"):
+            worker = self._idle.get()
+        try:
+            reason = self._needs_recycle(worker)
+            if reason:
+                with span("sandbox.start", recycled=True):
+                    worker = self._recycle(worker, reason)
+            logger.info(f"沙箱工作进程执行数据处理脚本 (pid {worker.process.pid})")
+            with span("sandbox.execute"):
+                return worker.run(code, timeout=self.timeout)
+        finally:
+            self._release(worker)
+
+    def _release(self, worker: SandboxWorker) -> None:
+        if self._closed:
+            worker.stop()
+            return
+
+        reason = self._needs_recycle(worker)
+        if reason:
+            try:
+                worker = self._recycle(worker, reason)
+            except Exception as e:
+                # 保留旧的工作进程对象，下次取用时再尝试重建
+                logger.error(f"重建沙箱工作进程失败: {e}")
+        self._idle.put(worker)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+def run_once(code: str, timeout: float = None) -> Tuple[str, Optional[pa.Table]]:
+    """
+    Execute a script in a fresh, single-use worker (used when pooling is disabled).
+
+    Returns:
+        The script's captured stdout and its result table (see SandboxWorker.run)
+    """
+    with span("sandbox.start"):
+        worker = SandboxWorker(get_interpreter(), [])
+    try:
+        logger.info(f"子进程执行数据处理脚本 (pid {worker.process.pid})")
+        with span("sandbox.execute"):
+            return worker.run(code, timeout=timeout)
+    finally:
+        worker.stop()
+
+
+def table_to_records(table: pa.Table) -> List[dict]:
+    """
+    Convert a result table to records, matching DataFrame.to_json(orient='records'):
+    nulls become None, timestamps become epoch milliseconds and durations milliseconds.
+    Sub-millisecond precision is truncated, as to_json does.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            target = pa.timestamp("ms", tz=field.type.tz)
+        elif pa.types.is_date(field.type):
+            target = pa.timestamp("ms")
+        elif pa.types.is_duration(field.type):
+            target = pa.duration("ms")
+        else:
+            continue
+        # 非安全转换：截断到毫秒，而不是在有亚毫秒精度时报错
+        column = table.column(i).cast(target, safe=False).cast(pa.int64())
+        table = table.set_column(i, field.name, column)
+    return table.to_pylist()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> Optional[SandboxPool]:
+    """
+    Get the process-wide sandbox pool, starting it on first use.
+
+    The pool is configured through SANDBOX_POOL (set to 0 to disable and run every script in a
+    fresh interpreter), SANDBOX_POOL_SIZE, SANDBOX_MAX_TASKS, SANDBOX_MAX_RSS_MB and
+    SANDBOX_TIMEOUT.
+
+    Returns:
+        The shared SandboxPool, or None if pooling is disabled
+    """
+    global _pool
+
+    if os.getenv("SANDBOX_POOL", "1") == "0":
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            from utils.data_store import get_data_store
+
+            def preload_provider():
+                store = get_data_store()
+                paths = [store.columnar_path(name) for name in store.sheet_names]
+                return [path for path in paths if path]
+
+            _pool = SandboxPool(
+                preload_provider,
+                size=int(os.getenv("SANDBOX_POOL_SIZE", "0")) or None,
+                max_tasks=int(os.getenv("SANDBOX_MAX_TASKS", "50")),
+                max_rss_mb=int(os.getenv("SANDBOX_MAX_RSS_MB", "1024")),
+                timeout=float(os.getenv("SANDBOX_TIMEOUT", "60")),
+            )
+            atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,132 @@
+"""
+Long-lived sandbox worker for generated pandas code.
+
+Started by utils.sandbox_pool under PYTHON_INTERPRETER. The worker imports pandas and attaches
+to the published Arrow sheets once, then executes generated scripts received over stdin, one
+JSON message per line:
+
+    request:  {"code": "<complete script>"}
+
+Responses are binary frames on stdout, which is reserved for the protocol:
+
+    <4-byte big-endian header length><JSON header><payload>
+
+The header is {"stdout": "<captured output>", "rss": <resident bytes>, "payload_size": n}.
+The payload, when present, is the result DataFrame the script handed to RESULT_SINK, encoded
+as an Arrow IPC stream. The first frame after start-up has the header {"ready": true}.
+Anything the generated code prints is captured per task; stderr is left alone for diagnostics.
+The frames are written to a private duplicate of the original stdout and fd 1 is pointed at
+stderr, so output that bypasses sys.stdout cannot corrupt the protocol.
+
+Sheets are memory-mapped read-only: every worker shares the same pages of the published files
+and no worker holds a private parsed copy. Each task converts the mapped table into its own
+DataFrame, which the generated code is free to modify.
+
+This file only depends on the sandbox interpreter's own packages; do not import utils here.
+"""
+
+import io
+import os
+import sys
+import json
+import struct
+import traceback
+import contextlib
+
+import numpy as np  # noqa: F401  - warm import for generated code
+import pandas as pd
+import pyarrow as pa
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        return rss if sys.platform == "darwin" else rss * 1024
+    except ImportError:
+        return 0
+
+
+def encode_table(df: pd.DataFrame) -> bytes:
+    """Serialize a result DataFrame as an Arrow IPC stream."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    # 协议通道使用 fd 1 的私有副本，fd 1 改指向 stderr：生成代码绕过 sys.stdout 的输出
+    # （os.write(1, ...)、sys.__stdout__、C 扩展、子进程）只会进入 stderr，不会破坏协议帧
+    channel = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    config = json.loads(sys.stdin.buffer.readline() or b"{}")
+    preloaded_sheets = {}
+    for path in config.get("preload", []):
+        try:
+            # 零拷贝映射，表数据直接引用共享的文件页
+            preloaded_sheets[path] = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        except Exception as e:
+            print(f"sandbox worker: failed to preload {path}: {e}", file=sys.stderr)
+
+    def send(header, payload=b""):
+        header = dict(header, payload_size=len(payload))
+        data = json.dumps(header).encode("utf-8")
+        channel.write(struct.pack(">I", len(data)) + data + payload)
+        channel.flush()
+
+    send({"ready": True})
+
+    for line in sys.stdin.buffer:
+        request = json.loads(line)
+        results = []
+        namespace = {
+            "__name__": "__main__",
+            "PRELOADED_SHEETS": preloaded_sheets,
+            "RESULT_SINK": results.append,
+        }
+        output = io.StringIO()
+        payload = b""
+
+        with contextlib.redirect_stdout(output):
+            try:
+                exec(compile(request["code"], "<generated>", "exec"), namespace)
+            except BaseException as e:
+                if isinstance(e, KeyboardInterrupt):
+                    raise
+                error_msg = {
+                    "error": f"Code execution error: {str(e)}",
+                    "traceback": traceback.format_exc(),
+                }
+                print(json.dumps(error_msg))
+
+            if results:
+                try:
+                    payload = encode_table(results[-1])
+                except Exception:
+                    # Arrow 无法表示的结果（如重复列名）回退为 JSON 文本
+                    try:
+                        print(results[-1].to_json(orient="records"))
+                    except Exception as e:
+                        error_msg = {
+                            "error": f"Code execution error: {str(e)}",
+                            "traceback": traceback.format_exc(),
+                        }
+                        print(json.dumps(error_msg))
+
+        send({"stdout": output.getvalue(), "rss": current_rss()}, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import asyncio
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# DSPy ChatAdapter 输出字段的标记前缀，如 "[[ ## response ## ]]"
+FIELD_MARKER_PREFIX = "[[ ##"
+
+
+class FieldStreamExtractor:
+    """
+    Pull the text of a single output field out of a streamed ChatAdapter completion.
+
+    The completion arrives as "[[ ## reasoning ## ]]\n...\n\n[[ ## response ## ]]\n...".
+    feed() takes the next chunk of raw LM text and returns the newly available part of the
+    field's value. Text that could still turn out to be the start of the next field marker, and
+    trailing whitespace, is held back until it is known to belong to the value.
+    """
+
+    def __init__(self, field_name: str):
+        self.start_marker = f"[[ ## {field_name} ## ]]"
+        self.buffer = ""
+        self.position = 0
+        self.started = False
+        self.value_started = False
+        self.finished = False
+
+    def feed(self, text: str) -> str:
+        if self.finished or not text:
+            return ""
+        self.buffer += text
+
+        if not self.started:
+            index = self.buffer.find(self.start_marker)
+            if index < 0:
+                return ""
+            self.started = True
+            self.position = index + len(self.start_marker)
+
+        # 跳过字段标记后的换行
+        if not self.value_started:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            self.value_started = self.position < len(self.buffer)
+
+        end = self.buffer.find(FIELD_MARKER_PREFIX, self.position)
+        if end >= 0:
+            self.finished = True
+            out = self.buffer[self.position : end].rstrip()
+            self.position = end
+            return out
+
+        # 末尾可能是下一个字段标记的开头，暂不输出
+        safe_end = len(self.buffer)
+        for length in range(min(len(FIELD_MARKER_PREFIX), len(self.buffer)), 0, -1):
+            if FIELD_MARKER_PREFIX.startswith(self.buffer[-length:]):
+                safe_end -= length
+                break
+        safe_end = max(self.position, len(self.buffer[:safe_end].rstrip()))
+
+        out = self.buffer[self.position : safe_end]
+        self.position = safe_end
+        return out
+
+
+def chunk_text(chunk: Any) -> str:
+    """Text delta of a litellm streaming chunk ("" for chunks without content)."""
+    try:
+        return chunk.choices[0].delta.content or ""
+    except (AttributeError, IndexError, TypeError):
+        return ""
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event with a JSON payload."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def iterate_async(agen: AsyncIterator) -> Iterator:
+    """
+    Drive an async generator from synchronous code (e.g. a Flask streaming response).
+
+    The generator runs on the background loop. All of its steps run in one copy of the
+    caller's context, so context variables it sets (e.g. its request trace) survive its yields.
+    """
+    loop = get_background_loop()
+    context = contextvars.copy_context()
+
+    def run(method):
+        async def call():
+            return await method()
+
+        async def in_context():
+            # asyncio 默认为每个任务复制一份新的上下文，这里让每一步共用同一个上下文
+            return await asyncio.get_running_loop().create_task(call(), context=context)
+
+        return asyncio.run_coroutine_threadsafe(in_context(), loop).result()
+
+    try:
+        while True:
+            try:
+                yield run(agen.__anext__)
+            except StopAsyncIteration:
+                break
+    finally:
+        run(agen.aclose)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    The process-wide event loop that synchronous callers (the Flask app) run coroutines on.
+
+    One loop serves every sync request, so the async pipeline's loop-bound state (DSPy's
+    worker-pool limiter, async HTTP clients) is shared exactly as under the ASGI server.
+    """
+    global _loop
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-bridge", daemon=True).start()
+    return _loop
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine from synchronous code and wait for its result.
+
+    The coroutine runs on the background loop in a copy of the caller's context.
+    """
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    # 在后台事件循环内同步等待会造成死锁
+    if running is loop:
+        raise RuntimeError("run_sync() cannot be called from the background event loop")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
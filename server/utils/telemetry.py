@@ -0,0 +1,244 @@
+import time
+import bisect
+import threading
+import contextlib
+import contextvars
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+# 获取该模块的日志器
+logger = get_logger("telemetry")
+
+# 延迟分桶上限（秒），覆盖从 JSON 解析到完整报告生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 尚未知道查询类型（或不属于任何请求）时使用的标签值
+UNKNOWN_QUERY_TYPE = "unknown"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels, in the Prometheus data model."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels, in the Prometheus data model."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：(各分桶计数, 总和, 总数)
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _format_labels(self.labelnames, key, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total:.6f}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "intellivis_request_seconds",
+    "End-to-end latency of /api/query requests.",
+    ("query_type", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "intellivis_stage_seconds",
+    "Latency of the named stages (spans) of a request.",
+    ("stage", "query_type"),
+)
+RETRIES = Counter(
+    "intellivis_codegen_retries_total",
+    "Code generation attempts after the first one (a previous attempt failed to run).",
+)
+CACHE_HITS = Counter(
+    "intellivis_cache_hits_total",
+    "Cache hits by cache (query, result, report, llm_memo).",
+    ("cache",),
+)
+SANDBOX_FAILURES = Counter(
+    "intellivis_sandbox_failures_total",
+    "Failed sandbox runs: the worker crashed or timed out (worker) or the script failed (script).",
+    ("kind",),
+)
+
+METRICS = (REQUEST_SECONDS, STAGE_SECONDS, RETRIES, CACHE_HITS, SANDBOX_FAILURES)
+
+# Prometheus 文本格式的 Content-Type
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """
+    The spans of one request: (name, start offset, seconds, attributes), in completion order.
+
+    status ("ok" or "error") labels the request latency; the request sets it on an error result.
+    Spans are recorded from worker threads too (asyncio.to_thread copies the context), so the
+    list is guarded by a lock.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.query_type = UNKNOWN_QUERY_TYPE
+        self.status = "ok"
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, seconds: float, attrs: Dict[str, str]) -> None:
+        with self._lock:
+            self.spans.append((name, start - self.start, seconds, attrs))
+
+    def format(self) -> str:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        parts = []
+        for name, offset, seconds, attrs in spans:
+            suffix = "".join(f" {k}={v}" for k, v in attrs.items())
+            parts.append(f"{name}{suffix} {offset:.2f}+{seconds:.2f}s")
+        return ", ".join(parts)
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def set_query_type(query_type: Optional[str]) -> None:
+    """Label the current request (and its histograms) with its query type."""
+    trace = _current_trace.get()
+    if trace is not None and query_type:
+        trace.query_type = query_type
+
+
+def record_span(name: str, seconds: float, start: float = None, **attrs) -> None:
+    """
+    Record a span that was timed elsewhere (e.g. the report pipeline's stages).
+
+    Inside a request the span is added to its trace and observed when the request finishes, so
+    it carries the request's query type; outside a request it is observed immediately.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        STAGE_SECONDS.observe(seconds, stage=name, query_type=UNKNOWN_QUERY_TYPE)
+        return
+    if start is None:
+        start = time.perf_counter() - seconds
+    trace.add(name, start, seconds, {k: str(v) for k, v in attrs.items()})
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    """Time a block as a named span of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, start, **attrs)
+
+
+@contextlib.contextmanager
+def request_trace(name: str) -> Iterator[RequestTrace]:
+    """
+    Trace one request: spans recorded inside the block belong to it.
+
+    On exit the spans and the total latency are observed in the histograms, labelled with the
+    request's query type (see set_query_type), and the spans are logged.
+    """
+    trace = RequestTrace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.status = "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # 异步生成器可能在另一个上下文中结束
+            _current_trace.set(None)
+        total = time.perf_counter() - trace.start
+        REQUEST_SECONDS.observe(total, query_type=trace.query_type, status=trace.status)
+        with trace._lock:
+            spans = list(trace.spans)
+        for span_name, _, seconds, _ in spans:
+            STAGE_SECONDS.observe(seconds, stage=span_name, query_type=trace.query_type)
+        logger.info(
+            f"{trace.name} 耗时 {total:.2f}秒 (类型: {trace.query_type}) - {trace.format()}"
+        )